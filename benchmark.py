@@ -0,0 +1,238 @@
+"""
+Reproducible benchmark of the inference stages : load, decode, preprocess, resize, prepare, predict, scale and paint.
+
+Runs over synthetic images (fixed seed) or supplied ones, at several resolutions and batch sizes, with a tiny
+locally built keras model unless a real checkpoint is given. Results are machine-readable JSON, e.g. :
+    python -m odviewer bench --resolutions 640x480 1920x1080 --batch-sizes 1 4 --out bench.json
+"""
+import os
+import time
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+def measure(pFunction, pRepeats=10, pWarmup=2, pItems=1):
+    """
+    @Brief : Mesure la latence d'une fonction sur plusieurs répétitions.
+
+    @Retour :
+        - stats(dict) : latences p50/p95/moyenne (ms), débit (items/s) et pic mémoire Python (octets, tracemalloc)
+    """
+    for i in range(pWarmup):
+        pFunction()
+
+    latencies = []
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    for i in range(pRepeats):
+        start = time.perf_counter()
+        pFunction()
+        latencies.append(time.perf_counter() - start)
+
+    currentMemory, peakMemory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    return {
+        "repeats": pRepeats,
+        "items": pItems,
+        "p50Ms": float(np.percentile(latencies, 50) * 1000),
+        "p95Ms": float(np.percentile(latencies, 95) * 1000),
+        "meanMs": float(latencies.mean() * 1000),
+        "throughput": float(pItems / latencies.mean()) if latencies.mean() > 0 else None,
+        "peakMemoryBytes": int(peakMemory),
+    }
+
+def syntheticImage(pWidth, pHeight, pSeed=0):
+    rng = np.random.default_rng(pSeed)
+
+    # Smooth gradients plus noise, closer to natural images than pure noise for the JPEG codec
+    x = np.linspace(0, 255, pWidth, dtype=np.float32)[np.newaxis, :]
+    y = np.linspace(0, 255, pHeight, dtype=np.float32)[:, np.newaxis]
+    image = np.stack(np.broadcast_arrays(x + 0 * y, y + 0 * x, (x + y) / 2), axis=-1)
+    image += rng.normal(0, 16, image.shape)
+
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def syntheticDetections(pNbDetections, pWidth, pHeight, pNbLabels=5, pSeed=0):
+    rng = np.random.default_rng(pSeed)
+
+    corners = rng.uniform([0, 0], [pWidth, pHeight], (pNbDetections, 2))
+    sizes = rng.uniform(8, 128, (pNbDetections, 2))
+
+    boxes = np.concatenate((corners, corners + sizes), axis=1).astype(np.float32)
+    scores = np.sort(rng.uniform(0, 1, pNbDetections).astype(np.float32))[::-1].copy()
+    labels = rng.integers(0, pNbLabels, pNbDetections).astype(np.int32)
+
+    return boxes[np.newaxis], scores[np.newaxis], labels[np.newaxis]
+
+def buildTinyModel(pNbDetections=100):
+    """
+    @Brief : Petit modèle keras aux sorties de même forme qu'un Retinanet d'inférence (boxes, scores, labels).
+    """
+    from tensorflow import keras
+
+    inputs = keras.layers.Input(shape=(None, None, 3))
+    x = keras.layers.Conv2D(8, 3, strides=4, activation="relu")(inputs)
+    x = keras.layers.Conv2D(16, 3, strides=4, activation="relu")(x)
+    x = keras.layers.GlobalAveragePooling2D()(x)
+
+    boxes = keras.layers.Reshape((pNbDetections, 4))(keras.layers.Dense(pNbDetections * 4)(x))
+    scores = keras.layers.Dense(pNbDetections, activation="sigmoid")(x)
+    labels = keras.layers.Dense(pNbDetections, activation="relu")(x)
+
+    return keras.Model(inputs=inputs, outputs=[boxes, scores, labels])
+
+def paintDetections(pPainterClass, pWidth, pHeight, pDetections):
+    from PyQt5.QtGui import QImage
+
+    class CDetections:
+        pass
+
+    inference = CDetections()
+    inference._boxes, inference._scores, inference._labels = pDetections
+
+    device = QImage(pWidth, pHeight, QImage.Format.Format_ARGB32_Premultiplied)
+    painter = pPainterClass(device, 0.0)
+    painter.drawInferences(inference)
+
+def runBenchmarks(pResolutions, pBatchSizes, pRepeats=10, pWarmup=2, pImagesPaths=None, pModelPath=None, pBackbone="resnet50", pNbDetections=100, pStages=None):
+    """
+    @Brief : Exécute les étages demandés et retourne le rapport (dict sérialisable en JSON).
+
+    @Paramètres :
+        - pResolutions(list)  : résolutions (largeur, hauteur) des images synthétiques.
+        - pBatchSizes(list)   : tailles de lot pour l'étage predict.
+        - pImagesPaths(list)  : images fournies, utilisées à la place des images synthétiques.
+        - pModelPath(str)     : checkpoint Retinanet à utiliser à la place du modèle jouet.
+        - pStages(list)       : étages à mesurer (tous si None).
+    """
+    from modelRegistry import importBackend
+
+    importBackend()
+    from keras_retinanet.utils.image import read_image_bgr, preprocess_image, resize_image
+
+    stages = pStages if pStages != None else ["load", "decode", "preprocess", "resize", "prepare", "predict", "scale", "paint"]
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+        },
+        "parameters": {
+            "resolutions": ["{}x{}".format(w, h) for w, h in pResolutions],
+            "batchSizes": list(pBatchSizes),
+            "repeats": pRepeats,
+            "warmup": pWarmup,
+            "model": pModelPath if pModelPath != None else "tiny",
+            "nbDetections": pNbDetections,
+        },
+        "results": [],
+    }
+
+    def addResult(stage, stats, **labels):
+        result = {"stage": stage}
+        result.update(labels)
+        result.update(stats)
+        report["results"].append(result)
+
+    application = None
+
+    # Tiny model and synthetic images, removed at the end
+    with tempfile.TemporaryDirectory(prefix="odviewer-bench-") as workDir:
+        ### Modèle, only needed by the load and predict stages
+        model = None
+        if "load" in stages or "predict" in stages:
+            if pModelPath != None:
+                from keras_retinanet import models
+
+                loadModel = lambda: models.load_model(pModelPath, backbone_name=pBackbone)
+            else:
+                from tensorflow import keras
+
+                tinyModelPath = os.path.join(workDir, "tiny.h5")
+                buildTinyModel(pNbDetections).save(tinyModelPath)
+
+                loadModel = lambda: keras.models.load_model(tinyModelPath, compile=False)
+
+            if "load" in stages:
+                addResult("load", measure(loadModel, max(1, pRepeats // 5), 0))
+
+            model = loadModel()
+
+        ### Images
+        if pImagesPaths != None:
+            inputs = []
+            for imagePath in pImagesPaths:
+                height, width = read_image_bgr(imagePath).shape[:2]
+                inputs.append((imagePath, width, height))
+        else:
+            from PIL import Image
+
+            inputs = []
+            for i, (width, height) in enumerate(pResolutions):
+                imagePath = os.path.join(workDir, "synthetic_{}x{}.jpg".format(width, height))
+                Image.fromarray(syntheticImage(width, height, i)).save(imagePath, quality=90)
+                inputs.append((imagePath, width, height))
+
+        for imagePath, width, height in inputs:
+            resolution = "{}x{}".format(width, height)
+
+            if "decode" in stages:
+                addResult("decode", measure(lambda: read_image_bgr(imagePath), pRepeats, pWarmup), resolution=resolution)
+
+            image = read_image_bgr(imagePath)
+
+            if "preprocess" in stages:
+                addResult("preprocess", measure(lambda: preprocess_image(image), pRepeats, pWarmup), resolution=resolution)
+
+            preprocessed = preprocess_image(image)
+
+            # Same sides as CInference (resizeFactor = 1)
+            minSide, maxSide = min(height, width), max(height, width)
+            if "resize" in stages:
+                addResult("resize", measure(lambda: resize_image(preprocessed, minSide, maxSide), pRepeats, pWarmup), resolution=resolution)
+
+            resized, scale = resize_image(preprocessed, minSide, maxSide)
+
+            # Resize then normalise of the pipeline, per prepared image type
+            if "prepare" in stages:
+                from inferencePipeline import prepareImage
+
+                for dtype in ("float32", "float16", "uint8"):
+                    addResult("prepare", measure(lambda: prepareImage(image, 1, dtype), pRepeats, pWarmup), resolution=resolution, dtype=dtype)
+
+            if "predict" in stages:
+                for batchSize in pBatchSizes:
+                    batch = np.repeat(resized[np.newaxis], batchSize, axis=0)
+                    addResult("predict", measure(lambda: model.predict_on_batch(batch), pRepeats, pWarmup, batchSize), resolution=resolution, batchSize=batchSize)
+
+            detections = syntheticDetections(pNbDetections, width, height)
+
+            if "scale" in stages:
+                addResult("scale", measure(lambda: detections[0] / scale, pRepeats, pWarmup), resolution=resolution)
+
+            if "paint" in stages:
+                from PyQt5.QtGui import QGuiApplication
+                from predictionsPainters import CBboxPredictionsPainter, CCirclePredictionsPainter, CCrossPredictionsPainter
+
+                if QGuiApplication.instance() == None:
+                    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+                    application = QGuiApplication([]) # Kept alive until the end of the benchmark
+
+                for painterClass in (CBboxPredictionsPainter, CCirclePredictionsPainter, CCrossPredictionsPainter):
+                    addResult("paint", measure(lambda: paintDetections(painterClass, width, height, detections), pRepeats, pWarmup),
+                              resolution=resolution, painter=painterClass.__name__)
+
+    # The painters are done with the application created for them
+    del application
+
+    return report
+
+def parseResolution(pText):
+    width, height = pText.lower().split("x")
+    return int(width), int(height)
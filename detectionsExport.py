@@ -0,0 +1,235 @@
+"""
+Streaming writers of detections : JSON-lines, COCO results JSON, memory-mappable columnar arrays and rendered overlays.
+
+Every writer receives the detections of one image at a time (write), in the (1, N, ...) layout of the inferences,
+and keeps in memory only what its format cannot write before the end (the images list of COCO, the offsets of the
+columnar format).
+"""
+import os
+import json
+import numpy as np
+
+from detectionsIndex import selectDetections
+
+EXPORT_FORMATS = ("jsonl", "coco", "columnar", "overlays")
+
+def imageSize(pImgPath):
+    # Header only, the pixels are not decoded
+    from PIL import Image
+
+    with Image.open(pImgPath) as image:
+        return image.size
+
+class CDetectionsWriter:
+    def __init__(self, pThreshold=0.0):
+        assert 0 <= pThreshold <= 1
+        self.threshold = pThreshold
+
+    def write(self, pImgPath, pBoxes, pScores, pLabels):
+        self.writeSelection(pImgPath, *selectDetections(pBoxes[0], pScores[0], pLabels[0], self.threshold))
+
+    def writeSelection(self, pImgPath, pBoxes, pScores, pLabels):
+        raise Exception("CDetectionsWriter must be subclassed, writeSelection writing the detections of one image.")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+class CJsonLinesWriter(CDetectionsWriter):
+    """
+    @Brief : One JSON object per image and per line : {"image", "boxes", "scores", "labels"}.
+    """
+    def __init__(self, pPath, pThreshold=0.0):
+        super().__init__(pThreshold)
+
+        self.path = pPath
+        self.file = open(pPath, "w")
+
+    def writeSelection(self, pImgPath, pBoxes, pScores, pLabels):
+        detections = {"image": pImgPath, "boxes": pBoxes.tolist(), "scores": pScores.tolist(), "labels": pLabels.tolist()}
+        self.file.write(json.dumps(detections) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class CCocoWriter(CDetectionsWriter):
+    """
+    @Brief : COCO style JSON file ({"annotations", "images", "categories"}), boxes in [x, y, width, height].
+
+    The annotations are streamed to the file as they come, the images and categories lists are written on close.
+    """
+    def __init__(self, pPath, pThreshold=0.0, pLabelsNames=None):
+        super().__init__(pThreshold)
+
+        self.path = pPath
+        self.labelsNames = pLabelsNames if pLabelsNames != None else {}
+
+        self.images = []
+        self.labels = set()
+        self.nbAnnotations = 0
+
+        self.file = open(pPath, "w")
+        self.file.write('{"annotations": [')
+
+    def writeSelection(self, pImgPath, pBoxes, pScores, pLabels):
+        imageId = len(self.images) + 1
+        width, height = imageSize(pImgPath)
+        self.images.append({"id": imageId, "file_name": pImgPath, "width": width, "height": height})
+
+        xywh = np.column_stack((pBoxes[:, :2], pBoxes[:, 2:] - pBoxes[:, :2])).tolist()
+
+        for bbox, score, label in zip(xywh, pScores.tolist(), pLabels.tolist()):
+            self.nbAnnotations += 1
+            annotation = {"id": self.nbAnnotations, "image_id": imageId, "category_id": label, "bbox": bbox,
+                          "area": bbox[2] * bbox[3], "score": score, "iscrowd": 0}
+
+            self.file.write((",\n" if self.nbAnnotations > 1 else "\n") + json.dumps(annotation))
+
+        self.labels.update(pLabels.tolist())
+
+    def close(self):
+        categories = [{"id": label, "name": self.labelsNames.get(label, str(label))} for label in sorted(self.labels)]
+
+        self.file.write('\n], "images": {}, "categories": {}}}\n'.format(json.dumps(self.images), json.dumps(categories)))
+        self.file.close()
+
+class CColumnarWriter(CDetectionsWriter):
+    """
+    @Brief : Detections of all the images concatenated in raw column files, readable back with np.memmap.
+
+    Directory layout :
+        - boxes.f32 (N, 4), scores.f32 (N,), labels.i32 (N,) : detections of all the images, image after image ;
+        - offsets.npy (nbImages + 1,) : the detections of image i are the rows [offsets[i], offsets[i + 1]) ;
+        - index.json : images paths, in the order of the offsets, and the columns dtypes and shapes.
+    """
+    columns = {"boxes": ("float32", (4,)), "scores": ("float32", ()), "labels": ("int32", ())}
+    extensions = {"float32": ".f32", "int32": ".i32"}
+
+    def __init__(self, pDirectory, pThreshold=0.0):
+        super().__init__(pThreshold)
+
+        self.directory = pDirectory
+        os.makedirs(pDirectory, exist_ok=True)
+
+        self.imagesPaths = []
+        self.offsets = [0]
+
+        self.files = {name: open(self.columnPath(pDirectory, name), "wb") for name in self.columns}
+
+    @classmethod
+    def columnPath(cls, pDirectory, pName):
+        dtype, shape = cls.columns[pName]
+        return os.path.join(pDirectory, pName + cls.extensions[dtype])
+
+    def writeSelection(self, pImgPath, pBoxes, pScores, pLabels):
+        for name, values in (("boxes", pBoxes), ("scores", pScores), ("labels", pLabels)):
+            dtype, shape = self.columns[name]
+            self.files[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+        self.imagesPaths.append(pImgPath)
+        self.offsets.append(self.offsets[-1] + len(pScores))
+
+    def close(self):
+        for columnFile in self.files.values():
+            columnFile.close()
+
+        np.save(os.path.join(self.directory, "offsets.npy"), np.array(self.offsets, dtype=np.int64))
+
+        index = {
+            "images": self.imagesPaths,
+            "count": self.offsets[-1],
+            "columns": {name: {"dtype": dtype, "shape": list(shape)} for name, (dtype, shape) in self.columns.items()},
+        }
+
+        # Written last : a directory without index is an interrupted export
+        with open(os.path.join(self.directory, "index.json"), "w") as f:
+            json.dump(index, f)
+
+def loadColumnar(pDirectory):
+    """
+    @Brief : Ouvre un export colonnaire sans charger les détections en mémoire.
+
+    @Retour :
+        - imagesPaths(list), offsets(ndarray), boxes, scores, labels (np.memmap)
+    """
+    with open(os.path.join(pDirectory, "index.json"), "r") as f:
+        index = json.load(f)
+
+    offsets = np.load(os.path.join(pDirectory, "offsets.npy"))
+
+    arrays = []
+    for name in ("boxes", "scores", "labels"):
+        column = index["columns"][name]
+        shape = (index["count"],) + tuple(column["shape"])
+
+        if index["count"] == 0: # np.memmap cannot map an empty file
+            arrays.append(np.zeros(shape, dtype=column["dtype"]))
+        else:
+            arrays.append(np.memmap(CColumnarWriter.columnPath(pDirectory, name), dtype=column["dtype"], mode="r", shape=shape))
+
+    return (index["images"], offsets, *arrays)
+
+class COverlaysWriter(CDetectionsWriter):
+    """
+    @Brief : Writes a copy of each image with its detections drawn (keras_retinanet style).
+    """
+    def __init__(self, pDirectory, pThreshold=0.0):
+        super().__init__(pThreshold)
+
+        self.directory = pDirectory
+        os.makedirs(pDirectory, exist_ok=True)
+
+    def writeSelection(self, pImgPath, pBoxes, pScores, pLabels):
+        import cv2
+        from keras_retinanet.utils.image import read_image_bgr
+        from keras_retinanet.utils.colors import label_color
+        from keras_retinanet.utils.visualization import draw_box
+
+        image = read_image_bgr(pImgPath)
+
+        for box, label in zip(pBoxes, pLabels):
+            draw_box(image, box.astype(int), color=label_color(label))
+
+        cv2.imwrite(os.path.join(self.directory, os.path.basename(pImgPath)), image)
+
+class CDetectionsExporter(CDetectionsWriter):
+    """
+    @Brief : Streams the detections to several writers, e.g. CDetectionsExporter.create("out/", ["jsonl", "coco"]).
+    """
+    def __init__(self, pWriters):
+        super().__init__(0.0)
+
+        self.writers = pWriters
+
+    @classmethod
+    def create(cls, pDirectory, pFormats, pThreshold=0.0):
+        os.makedirs(pDirectory, exist_ok=True)
+
+        writers = []
+        for exportFormat in pFormats:
+            if exportFormat == "jsonl":
+                writers.append(CJsonLinesWriter(os.path.join(pDirectory, "detections.jsonl"), pThreshold))
+            elif exportFormat == "coco":
+                writers.append(CCocoWriter(os.path.join(pDirectory, "detections_coco.json"), pThreshold))
+            elif exportFormat == "columnar":
+                writers.append(CColumnarWriter(os.path.join(pDirectory, "detections"), pThreshold))
+            elif exportFormat == "overlays":
+                writers.append(COverlaysWriter(os.path.join(pDirectory, "overlays"), pThreshold))
+            else:
+                raise ValueError("Unknown export format : {}".format(exportFormat))
+
+        return cls(writers)
+
+    def write(self, pImgPath, pBoxes, pScores, pLabels):
+        # Each writer applies its own threshold
+        for writer in self.writers:
+            writer.write(pImgPath, pBoxes, pScores, pLabels)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
@@ -0,0 +1,154 @@
+"""
+Score sorted indexes of detections : any score threshold selects a prefix of each class, found by binary search.
+"""
+import numpy as np
+
+def prefixLength(pSortedScores, pThreshold):
+    # Number of scores >= pThreshold, the scores being sorted in decreasing order. The threshold is compared in the
+    # scores dtype : a float64 0.3 is above the float32 0.3 scores
+    return int(np.searchsorted(-pSortedScores, -np.asarray(pThreshold, dtype=pSortedScores.dtype), side="right"))
+
+def selectDetections(pBoxes, pScores, pLabels, pThreshold, pLabelsFilter=None):
+    """
+    @Brief : Filtre les détections d'une image selon leur score et leur classe.
+
+    @Paramètres :
+        - pBoxes, pScores, pLabels : détections d'une image, de formes (N, 4), (N,) et (N,).
+        - pThreshold(float)        : score minimal des détections conservées.
+        - pLabelsFilter(list)      : classes conservées (toutes si None).
+
+    @Retour :
+        - boxes, scores, labels : détections conservées
+    """
+    keep = (pScores >= pThreshold) & (pLabels >= 0) # Retinanet pads its outputs with -1 labels
+
+    if pLabelsFilter is not None:
+        keep &= np.isin(pLabels, pLabelsFilter)
+
+    return pBoxes[keep], pScores[keep], pLabels[keep]
+
+class CSortedDetections:
+    """
+    @Brief : Detections of one image sorted by decreasing score, with the positions of each class in that order.
+
+    The detections above a threshold are the first positions of the sorted arrays (or of each class positions when
+    the classes are filtered), so changing the threshold costs a binary search instead of a pass over all the boxes.
+    """
+    def __init__(self, pBoxes, pScores, pLabels):
+        valid = pLabels >= 0
+        order = np.argsort(-pScores[valid], kind="stable")
+
+        self.boxes = pBoxes[valid][order].astype(int)
+        self.scores = pScores[valid][order]
+        self.labels = pLabels[valid][order]
+
+        # Label -> positions in the sorted arrays, hence by decreasing score too
+        self.classesPositions = {}
+        grouped = np.argsort(self.labels, kind="stable")
+        classes, starts = np.unique(self.labels[grouped], return_index=True)
+        for label, positions in zip(classes.tolist(), np.split(grouped, starts[1:])):
+            self.classesPositions[label] = positions
+
+    def __len__(self):
+        return len(self.scores)
+
+    def classes(self):
+        return list(self.classesPositions)
+
+    def selectedPositions(self, pThreshold, pLabelsFilter=None):
+        """
+        @Retour :
+            - positions(ndarray) : positions croissantes des détections de score >= pThreshold (et des classes pLabelsFilter)
+        """
+        if pLabelsFilter is None:
+            return np.arange(prefixLength(self.scores, pThreshold))
+
+        prefixes = [np.zeros(0, dtype=np.int64)]
+        for label in pLabelsFilter:
+            positions = self.classesPositions.get(label)
+            if positions is not None:
+                prefixes.append(positions[:prefixLength(self.scores[positions], pThreshold)])
+
+        return np.sort(np.concatenate(prefixes))
+
+    def select(self, pThreshold, pLabelsFilter=None):
+        """
+        @Retour :
+            - boxes, scores, labels : détections conservées, comme selectDetections
+        """
+        if pLabelsFilter is None:
+            # A prefix, the arrays are not copied
+            count = prefixLength(self.scores, pThreshold)
+            return self.boxes[:count], self.scores[:count], self.labels[:count]
+
+        positions = self.selectedPositions(pThreshold, pLabelsFilter)
+        return self.boxes[positions], self.scores[positions], self.labels[positions]
+
+class CDatasetDetectionsIndex:
+    """
+    @Brief : Per class index of the detections of a whole results set, counting the detections and the images above a threshold.
+
+    For each class are kept the scores of its detections by decreasing order, and the best score of each image
+    containing the class with the images rows, also by decreasing order : both counts are binary searches.
+    """
+    def __init__(self, pOffsets, pScores, pLabels):
+        # pOffsets : the detections of image i are the rows [pOffsets[i], pOffsets[i + 1]) of pScores and pLabels
+        self.nbImages = len(pOffsets) - 1
+
+        scores = np.asarray(pScores, dtype=np.float32)
+        labels = np.asarray(pLabels, dtype=np.int32)
+        rows = np.repeat(np.arange(self.nbImages), np.diff(pOffsets))
+
+        valid = labels >= 0
+        scores, labels, rows = scores[valid], labels[valid], rows[valid]
+
+        # Grouped by class, then by decreasing score
+        order = np.lexsort((-scores, labels))
+        scores, labels, rows = scores[order], labels[order], rows[order]
+
+        self.classesScores = {}
+        self.classesImages = {} # label -> (rows, best scores) by decreasing best score
+
+        classes, starts = np.unique(labels, return_index=True)
+        for label, classScores, classRows in zip(classes.tolist(), np.split(scores, starts[1:]), np.split(rows, starts[1:])):
+            self.classesScores[label] = classScores
+            self.classesImages[label] = self.imagesBestScores(classRows, classScores)
+
+        # All classes together
+        order = np.argsort(-scores, kind="stable")
+        self.allScores = scores[order]
+        self.allImages = self.imagesBestScores(rows[order], self.allScores)
+
+    @staticmethod
+    def imagesBestScores(pRows, pSortedScores):
+        # The first occurrence of an image in the decreasing order holds its best score
+        imagesRows, firsts = np.unique(pRows, return_index=True)
+        firsts.sort()
+
+        return pRows[firsts], pSortedScores[firsts]
+
+    def classes(self):
+        return list(self.classesScores)
+
+    def count(self, pThreshold, pLabelsFilter=None):
+        """
+        @Retour :
+            - nbDetections(int) : nombre de détections de score >= pThreshold (des classes pLabelsFilter)
+            - nbImages(int)     : nombre d'images ayant au moins une de ces détections
+        """
+        if pLabelsFilter is None:
+            imagesRows, bestScores = self.allImages
+            return prefixLength(self.allScores, pThreshold), prefixLength(bestScores, pThreshold)
+
+        nbDetections = 0
+        selectedRows = [np.zeros(0, dtype=np.int64)]
+        for label in pLabelsFilter:
+            if label not in self.classesScores:
+                continue
+
+            nbDetections += prefixLength(self.classesScores[label], pThreshold)
+
+            imagesRows, bestScores = self.classesImages[label]
+            selectedRows.append(imagesRows[:prefixLength(bestScores, pThreshold)])
+
+        return nbDetections, len(np.unique(np.concatenate(selectedRows)))
@@ -0,0 +1,237 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QObject, Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QImageReader
+
+import os
+import json
+import time
+import hashlib
+
+def imagesExtensions():
+    extensions = {".jpg"} # QImageReader reports "jpeg" but not "jpg"
+    for imageFormat in QImageReader.supportedImageFormats():
+        extensions.add("." + imageFormat.data().decode("utf-8").lower())
+
+    return tuple(sorted(extensions))
+
+class CDirectoryIndexer(QObject):
+    """
+    @Brief : Lists image directories in background, streaming the entries as they are found.
+
+    A listing is cached per directory with its mtime : reopening a dataset only stats its directories, the unchanged
+    ones being read from the cache with their images dimensions. The dimensions of the new images are read from their
+    headers (QImageReader, no decoding) once the listing is complete. A new request abandons the running one.
+    """
+    entriesFound = pyqtSignal(int, list)    # generation, [(path, width, height)], width and height are -1 if unknown
+    dimensionsFound = pyqtSignal(int, list) # generation, [(path, width, height)]
+    finished = pyqtSignal(int, int)         # generation, number of images
+
+    def __init__(self, pCacheDir=None, pChunkSize=512, pChunkInterval=0.1):
+        super().__init__()
+
+        if pCacheDir != None:
+            self.cacheDir = pCacheDir
+        else:
+            self.cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "odviewer", "listings")
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        self.chunkSize = pChunkSize
+        self.chunkInterval = pChunkInterval # Seconds between two emissions, whatever the chunk size
+        self.currentGeneration = 0 # Set from the GUI thread to abandon a stale indexing
+
+    def cachePath(self, pRoot, pRecursive, pExtensions):
+        key = "{}|{}|{}".format(os.path.abspath(pRoot), pRecursive, ",".join(pExtensions))
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def readCache(self, pCachePath):
+        try:
+            with open(pCachePath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def writeCache(self, pCachePath, pDirectories):
+        tmpPath = pCachePath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(pDirectories, f)
+        os.replace(tmpPath, pCachePath)
+
+    def isStale(self, pGeneration):
+        return pGeneration != self.currentGeneration
+
+    def scanDirectory(self, pDirectory, pExtensions):
+        files, subdirs = [], []
+
+        with os.scandir(pDirectory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(pExtensions):
+                        files.append([entry.name, -1, -1])
+                except OSError:
+                    continue
+
+        files.sort()
+        subdirs.sort()
+
+        return files, subdirs
+
+    @pyqtSlot(str, bool, int)
+    def indexDirectory(self, pRoot, pRecursive, pGeneration):
+        if self.isStale(pGeneration):
+            return
+
+        extensions = imagesExtensions()
+        cachePath = self.cachePath(pRoot, pRecursive, extensions)
+        cachedDirectories = self.readCache(cachePath)
+        directories = {} # relative path -> {"mtime", "files" : [[name, width, height]], "subdirs"}
+
+        chunk = []
+        lastEmission = time.perf_counter()
+        nbImages = 0
+
+        def flush():
+            nonlocal chunk, lastEmission
+            if len(chunk) > 0:
+                self.entriesFound.emit(pGeneration, chunk)
+                chunk = []
+            lastEmission = time.perf_counter()
+
+        ### Listing, depth first so that the entries come sorted
+        pending = [""]
+        while len(pending) > 0:
+            if self.isStale(pGeneration):
+                return
+
+            relativeDir = pending.pop()
+            directory = os.path.join(pRoot, relativeDir)
+
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+
+            cached = cachedDirectories.get(relativeDir)
+            if cached != None and cached["mtime"] == mtime:
+                files, subdirs = cached["files"], cached["subdirs"]
+            else:
+                try:
+                    files, subdirs = self.scanDirectory(directory, extensions)
+                except OSError:
+                    continue
+
+                # Dimensions of the images still present are kept
+                if cached != None:
+                    knownFiles = {name: (width, height) for name, width, height in cached["files"]}
+                    files = [[name, *knownFiles.get(name, (-1, -1))] for name, width, height in files]
+
+            directories[relativeDir] = {"mtime": mtime, "files": files, "subdirs": subdirs}
+
+            for name, width, height in files:
+                chunk.append((os.path.join(directory, name), width, height))
+                nbImages += 1
+
+                if len(chunk) >= self.chunkSize or time.perf_counter() - lastEmission >= self.chunkInterval:
+                    flush()
+
+            if pRecursive:
+                pending.extend(os.path.join(relativeDir, subdir) for subdir in reversed(subdirs))
+
+        flush()
+        self.writeCache(cachePath, directories)
+        self.finished.emit(pGeneration, nbImages)
+
+        ### Dimensions, header only
+        for relativeDir, listing in directories.items():
+            for fileEntry in listing["files"]:
+                if fileEntry[1] >= 0:
+                    continue
+
+                if self.isStale(pGeneration):
+                    # The dimensions read so far are kept for the next opening
+                    self.writeCache(cachePath, directories)
+                    return
+
+                imagePath = os.path.join(pRoot, relativeDir, fileEntry[0])
+                size = QImageReader(imagePath).size()
+                fileEntry[1], fileEntry[2] = (size.width(), size.height()) if size.isValid() else (0, 0)
+
+                chunk.append((imagePath, fileEntry[1], fileEntry[2]))
+                if len(chunk) >= self.chunkSize or time.perf_counter() - lastEmission >= self.chunkInterval:
+                    self.dimensionsFound.emit(pGeneration, chunk)
+                    chunk, lastEmission = [], time.perf_counter()
+
+        if len(chunk) > 0:
+            self.dimensionsFound.emit(pGeneration, chunk)
+
+        # Even when every dimension was emitted in the loop
+        self.writeCache(cachePath, directories)
+
+class CImagesListModel(QAbstractListModel):
+    """
+    @Brief : Flat list of the images of a dataset, filled incrementally by CDirectoryIndexer.
+
+    Images of subdirectories are displayed by their path relative to the root, their dimensions in the tooltip.
+    """
+    def __init__(self):
+        super().__init__()
+
+        self.rootPath = ""
+        self.paths = []
+        self.rows = {}  # path -> row
+        self.sizes = {} # path -> (width, height)
+
+    def setRootPath(self, pRootPath):
+        self.beginResetModel()
+        self.rootPath = pRootPath
+        self.paths = []
+        self.rows = {}
+        self.sizes = {}
+        self.endResetModel()
+
+    def appendEntries(self, pEntries):
+        first = len(self.paths)
+
+        self.beginInsertRows(QModelIndex(), first, first + len(pEntries) - 1)
+        for row, (path, width, height) in enumerate(pEntries, first):
+            self.paths.append(path)
+            self.rows[path] = row
+            if width >= 0:
+                self.sizes[path] = (width, height)
+        self.endInsertRows()
+
+    def setDimensions(self, pEntries):
+        for path, width, height in pEntries:
+            self.sizes[path] = (width, height)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.paths):
+            return None
+
+        path = self.paths[index.row()]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.relpath(path, self.rootPath)
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            size = self.sizes.get(path)
+            return "{} ({} x {})".format(path, *size) if size != None else path
+
+        return None
+
+    def filePath(self, pIndex):
+        return self.paths[pIndex.row()] if pIndex.isValid() and pIndex.row() < len(self.paths) else ""
+
+    def pathIndex(self, pPath):
+        row = self.rows.get(pPath)
+        return self.index(row, 0) if row != None else QModelIndex()
+
+    def imageSize(self, pPath):
+        """
+        @Retour :
+            - size(tuple) : (largeur, hauteur) lue dans l'en-tête de l'image, None si pas encore connue
+        """
+        return self.sizes.get(pPath)
@@ -0,0 +1,297 @@
+"""
+Evaluation of detections against ground truth annotations : IoU matching, precision / recall curves, AP, mAP and F1.
+
+Annotations are read from CSV files in the keras_retinanet format (path,x1,y1,x2,y2,class_name) or from COCO JSON.
+CEvaluator is fed one image at a time, so that a folder inference can be evaluated while its results stream in.
+"""
+import os
+import csv
+import json
+import numpy as np
+
+from savedDetections import pathKey
+
+def iouMatrix(pBoxesA, pBoxesB):
+    """
+    @Brief : IoU de toutes les paires de boîtes [x1, y1, x2, y2], de formes (N, 4) et (M, 4).
+
+    @Retour :
+        - iou(ndarray) : matrice (N, M)
+    """
+    a = pBoxesA.astype(np.float64)[:, None, :]
+    b = pBoxesB.astype(np.float64)[None, :, :]
+
+    width = np.maximum(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0)
+    height = np.maximum(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0)
+    intersection = width * height
+
+    areaA = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    areaB = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+
+    return intersection / np.maximum(areaA + areaB - intersection, 1e-9)
+
+def matchDetections(pBoxes, pScores, pLabels, pGtBoxes, pGtLabels, pIouThreshold=0.5):
+    """
+    @Brief : Appariement glouton des détections d'une image, par score décroissant, à la vérité terrain de même classe.
+
+    @Retour :
+        - truePositives(ndarray) : booléen par détection
+    """
+    truePositives = np.zeros(len(pScores), dtype=bool)
+    if len(pScores) == 0 or len(pGtLabels) == 0:
+        return truePositives
+
+    iou = iouMatrix(pBoxes, pGtBoxes)
+    iou[pLabels[:, None] != pGtLabels[None, :]] = 0
+
+    # Only the detections overlapping some annotation enter the greedy loop, by decreasing score
+    order = np.argsort(-pScores, kind="stable")
+    candidates = order[iou[order].max(axis=1) >= pIouThreshold]
+
+    matched = np.zeros(len(pGtLabels), dtype=bool)
+    for detection in candidates:
+        overlaps = np.where(matched, -1.0, iou[detection])
+        annotation = overlaps.argmax()
+
+        if overlaps[annotation] >= pIouThreshold:
+            truePositives[detection] = True
+            matched[annotation] = True
+
+    return truePositives
+
+def averagePrecision(pRecall, pPrecision):
+    # Area under the precision envelope (all points interpolation, as keras_retinanet)
+    recall = np.concatenate(([0.0], pRecall, [1.0]))
+    precision = np.concatenate(([0.0], pPrecision, [0.0]))
+
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    steps = np.flatnonzero(recall[1:] != recall[:-1])
+
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+class CGroundTruth:
+    """
+    @Brief : Annotations of a dataset indexed by image path (then by file name, for annotations written elsewhere).
+    """
+    def __init__(self, pAnnotations, pClassesNames=None):
+        # pAnnotations : image path -> (boxes (N, 4), labels (N,))
+        self.imagesPaths = list(pAnnotations)
+        self.annotations = {}
+        self.rowsByName = {}
+        for imagePath, (boxes, labels) in pAnnotations.items():
+            self.annotations[pathKey(imagePath)] = (np.asarray(boxes, dtype=np.float32).reshape(-1, 4), np.asarray(labels, dtype=np.int32))
+
+            name = os.path.basename(imagePath)
+            self.rowsByName[name] = None if name in self.rowsByName else pathKey(imagePath)
+
+        self.classesNames = pClassesNames if pClassesNames != None else {}
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def lookup(self, pImgPath):
+        """
+        @Retour :
+            - boxes, labels : annotations de l'image, None si l'image n'est pas annotée
+        """
+        key = pathKey(pImgPath)
+        if key not in self.annotations:
+            key = self.rowsByName.get(os.path.basename(pImgPath))
+
+        return self.annotations.get(key) if key != None else None
+
+def loadCsvAnnotations(pAnnotationsPath, pClassesPath=None):
+    """
+    @Brief : Charge des annotations au format CSV de keras_retinanet, une ligne par objet : path,x1,y1,x2,y2,class_name.
+
+    Les images sans objet ont une ligne path,,,,, et les chemins relatifs le sont au fichier d'annotations.
+    Sans fichier de classes (class_name,id), les identifiants suivent l'ordre alphabétique des noms.
+    """
+    classesIds = None
+    if pClassesPath != None:
+        with open(pClassesPath, "r", newline="") as f:
+            classesIds = {row[0]: int(row[1]) for row in csv.reader(f) if len(row) >= 2}
+
+    rows = []
+    with open(pAnnotationsPath, "r", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 6:
+                rows.append(row[:6])
+
+    if classesIds == None:
+        classesIds = {name: i for i, name in enumerate(sorted({row[5] for row in rows if row[5] != ""}))}
+
+    baseDir = os.path.dirname(os.path.abspath(pAnnotationsPath))
+    annotations = {}
+    for imagePath, x1, y1, x2, y2, className in rows:
+        imagePath = os.path.join(baseDir, imagePath)
+        boxes, labels = annotations.setdefault(imagePath, ([], []))
+
+        if className != "":
+            boxes.append([float(x1), float(y1), float(x2), float(y2)])
+            labels.append(classesIds[className])
+
+    return CGroundTruth(annotations, {classId: name for name, classId in classesIds.items()})
+
+def loadCocoAnnotations(pAnnotationsPath):
+    with open(pAnnotationsPath, "r") as f:
+        coco = json.load(f)
+
+    baseDir = os.path.dirname(os.path.abspath(pAnnotationsPath))
+    imagesPaths = {image["id"]: os.path.join(baseDir, image["file_name"]) for image in coco.get("images", [])}
+    annotations = {imagePath: ([], []) for imagePath in imagesPaths.values()}
+
+    for annotation in coco.get("annotations", []):
+        if annotation.get("iscrowd", 0):
+            continue
+
+        x, y, width, height = annotation["bbox"]
+        boxes, labels = annotations[imagesPaths[annotation["image_id"]]]
+        boxes.append([x, y, x + width, y + height])
+        labels.append(annotation["category_id"])
+
+    return CGroundTruth(annotations, {category["id"]: category["name"] for category in coco.get("categories", [])})
+
+def loadAnnotations(pAnnotationsPath, pClassesPath=None):
+    if pAnnotationsPath.lower().endswith(".json"):
+        return loadCocoAnnotations(pAnnotationsPath)
+
+    return loadCsvAnnotations(pAnnotationsPath, pClassesPath)
+
+class CEvaluator:
+    """
+    @Brief : Accumulates the matching of the detections of each image, and computes the metrics of the whole set on demand.
+
+    Only the score and the true positive flag of each detection are kept, per class : computing the curves is a sort
+    and a cumulative sum over all the detections of a class, whatever the number of images.
+    """
+    def __init__(self, pGroundTruth, pIouThreshold=0.5, pMinScore=0.05, pThresholds=None):
+        self.groundTruth = pGroundTruth
+        self.iouThreshold = pIouThreshold
+        self.minScore = pMinScore # Detections below are ignored, as in keras_retinanet evaluation
+        self.thresholds = pThresholds if pThresholds is not None else np.round(np.arange(0.05, 1.0, 0.05), 2)
+
+        self.nbImages = 0
+        self._scores = {}       # label -> list of arrays
+        self._truePositives = {}
+        self._nbAnnotations = {} # label -> count
+
+    def add(self, pImgPath, pBoxes, pScores, pLabels):
+        """
+        @Brief : Ajoute les détections d'une image, de formes (1, N, 4), (1, N) et (1, N) comme les inférences.
+
+        @Retour :
+            - evaluated(bool) : False si l'image n'est pas annotée
+        """
+        annotations = self.groundTruth.lookup(pImgPath)
+        if annotations == None:
+            return False
+
+        gtBoxes, gtLabels = annotations
+
+        boxes, scores, labels = np.asarray(pBoxes[0]), np.asarray(pScores[0]), np.asarray(pLabels[0])
+        # Compared in the scores dtype, as the thresholds of the viewer (see detectionsIndex.prefixLength)
+        keep = (scores >= np.asarray(self.minScore, dtype=scores.dtype)) & (labels >= 0)
+        boxes, scores, labels = boxes[keep], scores[keep], labels[keep]
+
+        truePositives = matchDetections(boxes, scores, labels, gtBoxes, gtLabels, self.iouThreshold)
+
+        for label in np.unique(labels):
+            inClass = labels == label
+            self._scores.setdefault(int(label), []).append(scores[inClass])
+            self._truePositives.setdefault(int(label), []).append(truePositives[inClass])
+
+        for label, count in zip(*np.unique(gtLabels, return_counts=True)):
+            self._nbAnnotations[int(label)] = self._nbAnnotations.get(int(label), 0) + int(count)
+
+        self.nbImages += 1
+        return True
+
+    def sortedDetections(self, pLabel):
+        # Scores by decreasing order and number of true positives of each prefix
+        scores = np.concatenate(self._scores.get(pLabel, [np.zeros(0, dtype=np.float32)]))
+        truePositives = np.concatenate(self._truePositives.get(pLabel, [np.zeros(0, dtype=bool)]))
+
+        order = np.argsort(-scores, kind="stable")
+
+        return scores[order], np.cumsum(truePositives[order])
+
+    def classCurves(self, pLabel):
+        """
+        @Retour :
+            - scores, precision, recall : courbe PR de la classe, une entrée par détection par score décroissant
+        """
+        scores, tpCumulated = self.sortedDetections(pLabel)
+
+        precision = tpCumulated / np.arange(1, len(scores) + 1)
+        recall = tpCumulated / max(self._nbAnnotations.get(pLabel, 0), 1)
+
+        return scores, precision, recall
+
+    def results(self):
+        """
+        @Retour :
+            - results(dict) : AP et précision / rappel / F1 à chaque seuil de score, par classe et toutes classes confondues
+        """
+        labels = sorted(set(self._nbAnnotations) | set(self._scores))
+
+        results = {"images": self.nbImages, "iouThreshold": self.iouThreshold, "thresholds": self.thresholds.tolist(), "classes": {}}
+
+        totalTp = np.zeros(len(self.thresholds))
+        totalDetections = np.zeros(len(self.thresholds))
+        averagePrecisions = []
+
+        for label in labels:
+            scores, tpCumulated = self.sortedDetections(label)
+            nbAnnotations = self._nbAnnotations.get(label, 0)
+
+            # Number of detections above each threshold, the scores being sorted in decreasing order
+            nbDetections = np.searchsorted(-scores, -self.thresholds.astype(scores.dtype), side="right")
+            tp = np.concatenate(([0], tpCumulated))[nbDetections]
+
+            thresholdsPrecision = tp / np.maximum(nbDetections, 1)
+            thresholdsRecall = tp / max(nbAnnotations, 1)
+            f1 = 2 * thresholdsPrecision * thresholdsRecall / np.maximum(thresholdsPrecision + thresholdsRecall, 1e-9)
+
+            precision = tpCumulated / np.arange(1, len(scores) + 1)
+            ap = averagePrecision(tpCumulated / max(nbAnnotations, 1), precision) if nbAnnotations > 0 else None
+            if ap != None:
+                averagePrecisions.append(ap)
+
+            totalTp += tp
+            totalDetections += nbDetections
+
+            results["classes"][label] = {
+                "name": self.groundTruth.classesNames.get(label, str(label)),
+                "annotations": nbAnnotations,
+                "detections": len(scores),
+                "AP": ap,
+                "precision": thresholdsPrecision.tolist(),
+                "recall": thresholdsRecall.tolist(),
+                "f1": f1.tolist(),
+            }
+
+        # Micro averaged over the classes
+        nbAnnotations = sum(self._nbAnnotations.values())
+        precision = totalTp / np.maximum(totalDetections, 1)
+        recall = totalTp / max(nbAnnotations, 1)
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+
+        results["mAP"] = float(np.mean(averagePrecisions)) if len(averagePrecisions) > 0 else None
+        results["precision"] = precision.tolist()
+        results["recall"] = recall.tolist()
+        results["f1"] = f1.tolist()
+        results["bestThreshold"] = float(self.thresholds[f1.argmax()]) if len(f1) > 0 else None
+        results["bestF1"] = float(f1.max()) if len(f1) > 0 else None
+
+        return results
+
+def imageF1(pGroundTruth, pImgPath, pBoxes, pScores, pLabels, pThreshold, pIouThreshold=0.5):
+    """
+    @Brief : Score F1 des détections d'une image au-dessus d'un seuil, None si l'image n'est pas annotée.
+    """
+    evaluator = CEvaluator(pGroundTruth, pIouThreshold, pMinScore=pThreshold, pThresholds=np.array([pThreshold]))
+    if not evaluator.add(pImgPath, pBoxes, pScores, pLabels):
+        return None
+
+    return evaluator.results()["f1"][0]
@@ -0,0 +1,160 @@
+from PyQt5.QtCore import QIdentityProxyModel, QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QIcon, QImage, QImageReader, QPixmap
+
+import os
+import hashlib
+import threading
+
+from tiledImage import CBytesLRUCache, CImagePyramid
+
+class CFunctionRunnable(QRunnable):
+    def __init__(self, pFunction, *pArgs):
+        super().__init__()
+
+        self.function = pFunction
+        self.args = pArgs
+
+    def run(self):
+        try:
+            self.function(*self.args)
+        except Exception as e:
+            print("Background task failed : ", e)
+
+class CImagePrefetcher:
+    """
+    @Brief : Decodes images on worker threads into the pyramid levels cache, ahead of their display.
+
+    The levels cache of CImagePyramid is bounded in bytes (LRU), so prefetching never grows the memory beyond it.
+    """
+    def __init__(self, pNbThreads=2):
+        self.threadPool = QThreadPool()
+        self.threadPool.setMaxThreadCount(pNbThreads)
+
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def prefetch(self, pImagesPaths, pScale=1.0):
+        for imagePath in pImagesPaths:
+            with self._lock:
+                if imagePath in self._pending:
+                    continue
+                self._pending.add(imagePath)
+
+            self.threadPool.start(CFunctionRunnable(self.decode, imagePath, pScale))
+
+    def decode(self, pImagePath, pScale):
+        try:
+            pyramid = CImagePyramid(pImagePath)
+            if pyramid.isValid():
+                level = pyramid.levelForScale(pScale)
+
+                # Huge levels are decoded tile by tile when displayed, there is nothing to prefetch
+                if pyramid.isLevelDecodable(level):
+                    pyramid.levelImage(level)
+        finally:
+            with self._lock:
+                self._pending.discard(pImagePath)
+
+    def cancel(self):
+        self.threadPool.clear()
+
+        with self._lock:
+            self._pending.clear()
+
+class CThumbnailProvider(QObject):
+    """
+    @Brief : Generates image thumbnails on worker threads, persisted in a disk cache keyed by path, mtime and size.
+    """
+    ready = pyqtSignal(str, QImage)
+
+    def __init__(self, pCacheDir=None, pSize=64, pNbThreads=2):
+        super().__init__()
+
+        if pCacheDir != None:
+            self.cacheDir = pCacheDir
+        else:
+            self.cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "odviewer", "thumbnails")
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        self.size = pSize
+
+        self.threadPool = QThreadPool()
+        self.threadPool.setMaxThreadCount(pNbThreads)
+
+        self._requested = set()
+        self.ready.connect(self.onReady)
+
+    def cachePath(self, pImagePath):
+        stat = os.stat(pImagePath)
+        key = "{}|{}|{}|{}".format(os.path.abspath(pImagePath), stat.st_mtime_ns, stat.st_size, self.size)
+
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    def request(self, pImagePath):
+        # Called from the GUI thread only
+        if pImagePath in self._requested:
+            return
+
+        self._requested.add(pImagePath)
+        self.threadPool.start(CFunctionRunnable(self.generate, pImagePath))
+
+    def generate(self, pImagePath):
+        cachePath = self.cachePath(pImagePath)
+
+        thumbnail = QImage(cachePath)
+        if thumbnail.isNull():
+            reader = QImageReader(pImagePath)
+            imageSize = reader.size()
+            if not imageSize.isValid():
+                return
+
+            # Scaled decoding, native for JPEG, avoids decoding the full resolution image
+            reader.setScaledSize(imageSize.scaled(QSize(self.size, self.size), Qt.AspectRatioMode.KeepAspectRatio))
+            thumbnail = reader.read()
+            if thumbnail.isNull():
+                return
+
+            thumbnail.save(cachePath, "PNG")
+
+        self.ready.emit(pImagePath, thumbnail)
+
+    def onReady(self, pImagePath, pThumbnail):
+        # An evicted thumbnail can be requested again, it will then come from the disk cache
+        self._requested.discard(pImagePath)
+
+class CThumbnailProxyModel(QIdentityProxyModel):
+    """
+    @Brief : Adds thumbnails to an images list model (CImagesListModel), generated on demand when displayed.
+    """
+    def __init__(self, pImagesModel, pThumbnailProvider):
+        super().__init__()
+
+        self.setSourceModel(pImagesModel)
+
+        self.thumbnailProvider = pThumbnailProvider
+        self.thumbnailProvider.ready.connect(self.onThumbnailReady)
+
+        self.icons = CBytesLRUCache(64 * 1024 * 1024, "thumbnailsCache")
+
+    def filePath(self, pIndex):
+        return self.sourceModel().filePath(self.mapToSource(pIndex))
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DecorationRole and index.isValid():
+            filePath = self.filePath(index)
+
+            icon = self.icons.get(filePath)
+            if icon is not None:
+                return icon
+
+            self.thumbnailProvider.request(filePath)
+
+        return super().data(index, role)
+
+    def onThumbnailReady(self, pImagePath, pThumbnail):
+        self.icons.put(pImagePath, QIcon(QPixmap.fromImage(pThumbnail)), pThumbnail.sizeInBytes())
+
+        index = self.mapFromSource(self.sourceModel().pathIndex(pImagePath))
+        if index.isValid():
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
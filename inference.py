@@ -0,0 +1,319 @@
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+import time
+import threading
+import numpy as np
+
+from instrumentation import instrumentation
+from modelRegistry import modelRegistry, importBackend
+from resultCache import resultCache
+from inferencePipeline import CInferencePipeline, prepareImage, preprocessingParameters
+from tiledInference import predictTiled
+from detectionsExport import CDetectionsExporter
+from evaluation import CEvaluator
+from videoInference import CVideoPipeline
+from savedDetections import CSavedInference
+
+class CInference(QObject):
+    finished = pyqtSignal()
+
+    def __init__(self, pImgPath, pModelPath, pBackbone=None, pTileSize=None, pTileOverlap=128, pBackend="keras"):
+        super().__init__()
+
+        self.imgPath = pImgPath
+        self.modelPath = pModelPath
+
+        ### Gestion des paramètres
+        if pBackbone != None:
+            assert pBackbone == "resnet50" or pBackbone == "resnet101"
+            self.backbone = pBackbone
+        else:
+            self.backbone = 'resnet50'
+
+        # Inférence par fenêtres glissantes si une taille de tuile est donnée
+        if pTileSize != None:
+            assert 0 <= pTileOverlap < pTileSize
+
+        self.tileSize = pTileSize
+        self.tileOverlap = pTileOverlap
+
+        self.backend = pBackend # keras, or a TensorFlow Lite conversion (see inferenceBackends)
+
+        self.resizeFactor = 1 # Facteur d'échelle
+        self.useCache = True
+
+        self._cacheKey = None
+        self._image = None
+    
+    @pyqtSlot()
+    def inferImage(self):
+        self.performTFObjectDetection()
+        self.finished.emit()
+
+    def performTFObjectDetection(self):
+        """
+        @Signature   : simpleInference
+        @Brief       : Effectue une inférence sur une image selon les paramètres indiqués.
+
+        @Paramètres :
+            - imgPath(str)      : chemin absolu vers le fichier image à inférer (ex : D:\<path>\<filename>.jpg).
+            - modelPath(str)    : chemin absolu vers le modèle d'inférence à utiliser (ex : D:\<path>\<filename>.h5).
+            - pBackbone(str)    : indique le réseau backbone à utiliser pour effectuer l'inférence. Les backbones disponibles sont [resnet50, resnet101].
+            - pBackend(str)     : moteur d'inférence, keras ou une conversion TensorFlow Lite [tflite, tflite-float16, tflite-int8].
+
+        @Retour :
+            - objects       : liste des objets détectés par le modèle
+            - scoreF1       : le score F1 de l'inférence. 
+            - enlapsedTime  : le temps écoulé pour réaliser l'inférence
+        """
+        ### Réutilisation d'un résultat déjà calculé
+        if self.loadCachedResult():
+            return
+
+        ### Inférence
+        self.prepareImage()
+        self.predict()
+
+    def loadCachedResult(self):
+        """
+        @Brief : Charge le résultat depuis le cache si l'image a déjà été inférée avec ce modèle.
+
+        @Retour :
+            - loaded(bool) : True si le résultat a été chargé
+        """
+        self._cacheKey = None
+        if not self.useCache:
+            return False
+
+        self._cacheKey = resultCache.entryKey(self.imgPath, self.modelPath, self.backbone, self.preprocessingParameters(), self.backend)
+        cachedResult = resultCache.get(self._cacheKey)
+
+        if cachedResult == None:
+            return False
+
+        self._boxes, self._scores, self._labels = cachedResult
+        return True
+
+    def prepareImage(self):
+        # Étape CPU, indépendante du modèle : peut s'exécuter en parallèle de l'inférence d'une autre image
+        importBackend()
+        from keras_retinanet.utils.image import read_image_bgr
+
+        with instrumentation.span("decode"):
+            image = read_image_bgr(self.imgPath) # Chargement de l'image
+
+        # Les tuiles sont prétraitées par predictTiled
+        if self.tileSize != None:
+            self._image, self._scale = image, 1
+            return
+
+        # Prétraitement de l'image source pour le réseau
+        with instrumentation.span("preprocess"):
+            self._image, self._scale = prepareImage(image, self.resizeFactor)
+
+    def predict(self):
+        model = modelRegistry.getModel(self.modelPath, self.backbone, self.backend) # Chargement du model Retinanet (ou réutilisation du cache)
+
+        # Traitement de l'image par le réseau
+        if self.tileSize != None:
+            # The tiles preprocessing, prediction and merge are recorded by predictTiled
+            boxes, scores, labels = predictTiled(model, self._image, self.tileSize, self.tileOverlap, pStatistics=instrumentation)
+        else:
+            with instrumentation.span("predict"):
+                boxes, scores, labels = model.predict_on_batch(np.expand_dims(self._image, axis=0))
+
+        with instrumentation.span("postprocess"):
+            if self.tileSize == None:
+                boxes /= self._scale # Réduction de la taille des bbox pour correspondre au redimensionnement de l'image
+
+            self._boxes = boxes
+            self._scores = scores
+            self._labels = labels
+
+            self._image = None # The preprocessed image is no longer needed
+
+            if self._cacheKey != None:
+                resultCache.put(self._cacheKey, boxes, scores, labels)
+
+    def preprocessingParameters(self):
+        return preprocessingParameters(self.resizeFactor, self.tileSize, self.tileOverlap)
+
+    def hasResult(self):
+        return hasattr(self, "_boxes")
+
+class CComparisonInference(QObject):
+    """
+    @Brief : Inference of one image by several models, the image being decoded and preprocessed only once.
+
+    Exposes the same stages as CInference (loadCachedResult, prepareImage, predict) so that it can be queued to
+    CInferenceService. The result of each model is held by the CInference of self.inferences.
+
+    The models registry capacity is raised to the number of compared models so that they all stay loaded : the
+    memory cost is that of every compared model at once (the size of each checkpoint, in GPU memory when one is used).
+    """
+    def __init__(self, pImgPath, pModelsPaths, pBackbone=None, pTileSize=None, pTileOverlap=128, pBackend="keras"):
+        super().__init__()
+
+        self.imgPath = pImgPath
+        modelRegistry.reserve(len(pModelsPaths))
+        self.inferences = [CInference(pImgPath, modelPath, pBackbone, pTileSize=pTileSize, pTileOverlap=pTileOverlap, pBackend=pBackend) for modelPath in pModelsPaths]
+
+    def pendingInferences(self):
+        return [inference for inference in self.inferences if not inference.hasResult()]
+
+    def loadCachedResult(self):
+        for inference in self.inferences:
+            inference.loadCachedResult()
+
+        return len(self.pendingInferences()) == 0
+
+    def prepareImage(self):
+        pendingInferences = self.pendingInferences()
+
+        # The preprocessing parameters are the same for every model : the tensor is shared, not copied
+        pendingInferences[0].prepareImage()
+        for inference in pendingInferences[1:]:
+            inference._image, inference._scale = pendingInferences[0]._image, pendingInferences[0]._scale
+
+    def predict(self):
+        for inference in self.pendingInferences():
+            inference.predict()
+
+    def hasResult(self):
+        return len(self.pendingInferences()) == 0
+
+class CModelWarmer(QObject):
+    warmed = pyqtSignal(str)
+    backendImported = pyqtSignal(float) # Import time in seconds
+    backendImportFailed = pyqtSignal(str)
+
+    @pyqtSlot()
+    def warmBackend(self):
+        try:
+            importTime = importBackend()
+        except Exception as e:
+            self.backendImportFailed.emit(str(e))
+            return
+
+        self.backendImported.emit(importTime)
+
+    @pyqtSlot(str, str, str)
+    def warmModel(self, pModelPath, pBackbone, pBackend):
+        try:
+            modelRegistry.warmModel(pModelPath, pBackbone, pBackend)
+        except Exception as e:
+            print("Cannot warm model {} : {}".format(pModelPath, e))
+            return
+
+        self.warmed.emit(pModelPath)
+
+class CFolderInference(QObject):
+    progress = pyqtSignal(int, int)
+    evaluated = pyqtSignal(dict) # Metrics of the images inferred so far, when ground truth annotations are given
+    finished = pyqtSignal(dict)
+
+    def __init__(self, pEvaluationInterval=1.0):
+        super().__init__()
+
+        self.pipeline = None
+        self.evaluationInterval = pEvaluationInterval # Seconds between two emissions of the running metrics
+
+    @pyqtSlot(list, str, str, dict)
+    def inferImages(self, pImagesPaths, pModelPath, pBackbone, pOptions):
+        # pOptions : additional CInferencePipeline parameters (pTileSize, ...), the export options and the ground truth
+        options = dict(pOptions)
+        exportDir = options.pop("exportDir", None)
+        exportFormats = options.pop("exportFormats", ["jsonl"])
+        exportThreshold = options.pop("exportThreshold", 0.0)
+        groundTruth = options.pop("groundTruth", None)
+
+        self.pipeline = CInferencePipeline(pModelPath, pBackbone, **options)
+
+        exporter = None
+        evaluator = CEvaluator(groundTruth) if groundTruth != None else None
+        lastEvaluation = time.perf_counter()
+
+        def onResult(imgPath, boxes, scores, labels):
+            nonlocal lastEvaluation
+
+            # The detections are streamed to the export files and to the evaluation as the batches finish
+            if exporter != None:
+                exporter.write(imgPath, boxes, scores, labels)
+
+            if evaluator != None and evaluator.add(imgPath, boxes, scores, labels) and time.perf_counter() - lastEvaluation >= self.evaluationInterval:
+                self.evaluated.emit(evaluator.results())
+                lastEvaluation = time.perf_counter()
+
+        try:
+            if exportDir != None:
+                exporter = CDetectionsExporter.create(exportDir, exportFormats, exportThreshold)
+
+            report = self.pipeline.run(pImagesPaths, pOnResult=onResult, pOnProgress=self.progress.emit)
+
+            if evaluator != None:
+                report["evaluation"] = evaluator.results()
+                self.evaluated.emit(report["evaluation"])
+        except Exception as e:
+            print("Folder inference failed : ", e)
+            report = {"error": str(e)}
+        finally:
+            if exporter != None:
+                exporter.close()
+
+        self.finished.emit(report)
+
+    def stop(self):
+        # Called from the GUI thread, the pipeline only sets a flag
+        if self.pipeline != None:
+            self.pipeline.stop()
+
+class CVideoInference(QObject):
+    """
+    @Brief : Runs a CVideoPipeline on a worker thread, the inferred frames being emitted to the GUI one at a time.
+
+    A frame is only emitted once the previous one has been displayed (frameDisplayed) : when the display is slower
+    than the inference, the frames in between are not displayed instead of piling up in the event queue.
+    """
+    frameInferred = pyqtSignal(int, object, object, dict) # index, BGR frame, CSavedInference, statistics
+    finished = pyqtSignal(dict)
+
+    def __init__(self):
+        super().__init__()
+
+        self.pipeline = None
+        self._displayed = threading.Event()
+
+    @pyqtSlot(str, str, str, dict)
+    def streamFrames(self, pPath, pModelPath, pBackbone, pOptions):
+        # pOptions : additional CVideoPipeline parameters (pBackend, pReuseThreshold, ...)
+        self.pipeline = CVideoPipeline(pModelPath, pBackbone, **pOptions)
+        self._displayed.set()
+        notDisplayed = 0
+
+        def onFrame(index, frame, boxes, scores, labels, statistics):
+            nonlocal notDisplayed
+
+            if not self._displayed.is_set():
+                notDisplayed += 1
+                return
+
+            self._displayed.clear()
+            detections = CSavedInference("{}#{}".format(pPath, index), pModelPath, boxes[0], scores[0], labels[0])
+            self.frameInferred.emit(index, frame, detections, dict(statistics, notDisplayed=notDisplayed))
+
+        try:
+            report = self.pipeline.run(pPath, pOnFrame=onFrame)
+            report["notDisplayed"] = notDisplayed
+        except Exception as e:
+            print("Video inference failed : ", e)
+            report = {"error": str(e)}
+
+        self.finished.emit(report)
+
+    def frameDisplayed(self):
+        # Called from the GUI thread
+        self._displayed.set()
+
+    def stop(self):
+        if self.pipeline != None:
+            self.pipeline.stop()
@@ -0,0 +1,249 @@
+"""
+Inference backends of the Retinanet models : the keras model itself, or a TensorFlow Lite conversion for CPU nodes,
+in float32 or quantised to float16 or int8.
+
+A conversion is done once per checkpoint and cached next to it (model.resnet50.tflite-int8.tflite), with a JSON
+sidecar recording the checkpoint it comes from : a checkpoint rewritten on disk is converted again. Converted models
+expose predict_on_batch, so the pipeline, the tiled inference and the interactive inference use them unchanged.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+from instrumentation import instrumentation
+
+BACKENDS = ("keras", "tflite", "tflite-float16", "tflite-int8")
+
+def backendQuantization(pBackend):
+    # "tflite-int8" -> "int8", None for float32
+    return pBackend.split("-", 1)[1] if "-" in pBackend else None
+
+def convertedModelPath(pModelPath, pBackbone, pBackend):
+    modelPath = os.path.abspath(pModelPath)
+    fileName = "{}.{}.{}.tflite".format(os.path.splitext(os.path.basename(modelPath))[0], pBackbone, pBackend)
+
+    if os.access(os.path.dirname(modelPath), os.W_OK):
+        return os.path.join(os.path.dirname(modelPath), fileName)
+
+    # Read-only models directory
+    cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "odviewer", "models")
+    os.makedirs(cacheDir, exist_ok=True)
+
+    return os.path.join(cacheDir, hashlib.sha1(modelPath.encode("utf-8")).hexdigest()[:16] + "_" + fileName)
+
+def sourceStamp(pModelPath):
+    stat = os.stat(pModelPath)
+    return {"path": os.path.abspath(pModelPath), "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+def readSidecar(pConvertedPath):
+    try:
+        with open(pConvertedPath + ".json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def isConversionValid(pModelPath, pConvertedPath):
+    sidecar = readSidecar(pConvertedPath)
+
+    return sidecar != None and os.path.isfile(pConvertedPath) and sidecar.get("source") == sourceStamp(pModelPath)
+
+def conversionStamp(pModelPath, pBackbone, pBackend):
+    """
+    @Retour :
+        - stamp(dict) : description de la conversion en cache du modèle (taille, calibration, date), qui change
+                        à chaque conversion. None si le modèle n'est pas encore converti.
+    """
+    convertedPath = convertedModelPath(pModelPath, pBackbone, pBackend)
+    if not isConversionValid(pModelPath, convertedPath):
+        return None
+
+    sidecar = readSidecar(convertedPath)
+    return {"bytes": sidecar.get("bytes"), "calibrationImages": sidecar.get("calibrationImages"), "tensorflow": sidecar.get("tensorflow"),
+            "mtime": os.stat(convertedPath).st_mtime_ns}
+
+def calibrationImages(pImagesPaths, pResizeFactor=1):
+    """
+    @Brief : Générateur des images prétraitées (float32) d'un jeu de calibration.
+    """
+    from keras_retinanet.utils.image import read_image_bgr
+    from inferencePipeline import prepareImage
+
+    for imgPath in pImagesPaths:
+        image, scale = prepareImage(read_image_bgr(imgPath), pResizeFactor)
+        yield image
+
+def convertModel(pKerasModel, pModelPath, pConvertedPath, pBackend, pCalibrationPaths=None):
+    """
+    @Brief : Convertit un modèle keras en TensorFlow Lite et l'écrit dans pConvertedPath avec son fichier de description.
+
+    @Paramètres :
+        - pBackend(str)          : "tflite", "tflite-float16" ou "tflite-int8".
+        - pCalibrationPaths(list) : images de calibration des activations int8. Sans elles, seuls les poids sont
+                                    quantifiés en int8 (quantification dynamique).
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(pKerasModel)
+    # The detections filtering (NMS) of the Retinanet head has no builtin TFLite kernel
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+
+    quantization = backendQuantization(pBackend)
+    if quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if pCalibrationPaths:
+            converter.representative_dataset = lambda: ([image[np.newaxis]] for image in calibrationImages(pCalibrationPaths))
+
+    with instrumentation.span("convert", backend=pBackend):
+        convertedModel = converter.convert()
+
+    tmpPath = pConvertedPath + ".tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(convertedModel)
+    os.replace(tmpPath, pConvertedPath)
+
+    sidecar = {
+        "source": sourceStamp(pModelPath),
+        "backend": pBackend,
+        "calibrationImages": len(pCalibrationPaths) if pCalibrationPaths else 0,
+        "tensorflow": tf.__version__,
+        "bytes": len(convertedModel),
+    }
+
+    # Written last : a model without sidecar is an interrupted conversion
+    with open(pConvertedPath + ".json", "w") as f:
+        json.dump(sidecar, f, indent=2)
+
+class CTFLiteModel:
+    """
+    @Brief : TensorFlow Lite interpreter with the predict_on_batch interface of the keras Retinanet models.
+
+    The input tensor is resized when the batch shape changes only, which the pipeline makes rare by batching images
+    of the same shape. An interpreter is not thread safe : the calls are serialised.
+    """
+    def __init__(self, pConvertedPath, pNumThreads=None):
+        import tensorflow as tf
+
+        self.path = pConvertedPath
+        self.interpreter = tf.lite.Interpreter(model_path=pConvertedPath, num_threads=pNumThreads)
+        self.inputIndex = self.interpreter.get_input_details()[0]["index"]
+        self.inputShape = None
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def sortOutputs(pOutputs):
+        # The conversion does not keep the outputs order : boxes (B, N, 4), then scores (float) and labels (int)
+        boxes = next(output for output in pOutputs if output.ndim == 3)
+        labels = next(output for output in pOutputs if output.ndim == 2 and np.issubdtype(output.dtype, np.integer))
+        scores = next(output for output in pOutputs if output.ndim == 2 and np.issubdtype(output.dtype, np.floating))
+
+        return boxes, scores, labels
+
+    def predict_on_batch(self, pInputs):
+        inputs = np.ascontiguousarray(pInputs, dtype=np.float32)
+
+        with self._lock:
+            if inputs.shape != self.inputShape:
+                self.interpreter.resize_tensor_input(self.inputIndex, inputs.shape, strict=False)
+                self.interpreter.allocate_tensors()
+                self.inputShape = inputs.shape
+
+            self.interpreter.set_tensor(self.inputIndex, inputs)
+            self.interpreter.invoke()
+
+            # get_tensor returns copies, the next invocation does not overwrite them
+            outputs = [self.interpreter.get_tensor(output["index"]) for output in self.interpreter.get_output_details()]
+
+        return self.sortOutputs(outputs)
+
+def loadBackendModel(pModelPath, pBackbone, pBackend, pKerasModel, pNumThreads=None, pCalibrationPaths=None, pForceConversion=False):
+    """
+    @Brief : Charge le modèle converti pour le backend, en le convertissant d'abord s'il n'est pas en cache.
+
+    @Paramètres :
+        - pKerasModel(callable) : renvoie le modèle keras de référence, appelé seulement si une conversion est nécessaire.
+        - pNumThreads(int)      : nombre de threads de l'interpréteur (intra-op).
+    """
+    assert pBackend in BACKENDS and pBackend != "keras"
+
+    convertedPath = convertedModelPath(pModelPath, pBackbone, pBackend)
+    if pForceConversion or not isConversionValid(pModelPath, convertedPath):
+        convertModel(pKerasModel(), pModelPath, convertedPath, pBackend, pCalibrationPaths)
+
+    with instrumentation.span("load", model=os.path.basename(convertedPath)):
+        return CTFLiteModel(convertedPath, pNumThreads)
+
+def compareBackends(pReferenceModel, pModel, pImagesPaths, pThreshold=0.5, pIouThreshold=0.5):
+    """
+    @Brief : Écart de précision d'un modèle converti par rapport au modèle de référence sur un jeu de calibration.
+
+    Les détections de référence au-dessus du seuil servent de vérité terrain : le rapport donne l'AP du modèle
+    converti par rapport à elles, le F1 au seuil, l'écart moyen et maximal des scores des détections appariées,
+    ainsi que les latences médianes des deux modèles.
+    """
+    from keras_retinanet.utils.image import read_image_bgr
+    from inferencePipeline import prepareImage
+    from evaluation import CEvaluator, CGroundTruth, iouMatrix
+
+    referenceTimes, times = [], []
+    references, predictions = {}, {}
+
+    for imgPath in pImagesPaths:
+        image, scale = prepareImage(read_image_bgr(imgPath))
+        batch = image[np.newaxis]
+
+        start = time.perf_counter()
+        references[imgPath] = pReferenceModel.predict_on_batch(batch)
+        referenceTimes.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        predictions[imgPath] = pModel.predict_on_batch(batch)
+        times.append(time.perf_counter() - start)
+
+    groundTruth = {}
+    for imgPath, (boxes, scores, labels) in references.items():
+        keep = (scores[0] >= pThreshold) & (labels[0] >= 0)
+        groundTruth[imgPath] = (boxes[0][keep], labels[0][keep])
+
+    evaluator = CEvaluator(CGroundTruth(groundTruth), pIouThreshold, pThresholds=np.array([pThreshold]))
+    scoresDeltas = []
+
+    for imgPath, (boxes, scores, labels) in predictions.items():
+        evaluator.add(imgPath, boxes, scores, labels)
+
+        # Score change of each reference detection, against the overlapping converted detection of the same class
+        referenceBoxes, referenceScores, referenceLabels = references[imgPath]
+        valid = (labels[0] >= 0)
+        referenceValid = (referenceLabels[0] >= 0) & (referenceScores[0] >= pThreshold)
+        if valid.any() and referenceValid.any():
+            iou = iouMatrix(referenceBoxes[0][referenceValid], boxes[0][valid])
+            iou[referenceLabels[0][referenceValid][:, None] != labels[0][valid][None, :]] = 0
+
+            matched = iou.max(axis=1) >= pIouThreshold
+            closest = iou.argmax(axis=1)[matched]
+            scoresDeltas.append(np.abs(referenceScores[0][referenceValid][matched] - scores[0][valid][closest]))
+
+    results = evaluator.results()
+    scoresDeltas = np.concatenate(scoresDeltas) if len(scoresDeltas) > 0 else np.zeros(0)
+    referenceMs, candidateMs = 1000 * np.median(referenceTimes), 1000 * np.median(times)
+
+    return {
+        "images": len(pImagesPaths),
+        "threshold": pThreshold,
+        "iouThreshold": pIouThreshold,
+        "mAPVersusReference": results["mAP"],
+        "f1VersusReference": results["f1"][0],
+        "precisionVersusReference": results["precision"][0],
+        "recallVersusReference": results["recall"][0],
+        "meanScoreDelta": float(scoresDeltas.mean()) if len(scoresDeltas) > 0 else None,
+        "maxScoreDelta": float(scoresDeltas.max()) if len(scoresDeltas) > 0 else None,
+        "referenceMs": referenceMs,
+        "backendMs": candidateMs,
+        "speedup": referenceMs / candidateMs if candidateMs > 0 else None,
+    }
@@ -0,0 +1,466 @@
+import time
+import queue
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from instrumentation import instrumentation
+from modelRegistry import modelRegistry, importBackend
+from resultCache import resultCache
+from tiledInference import predictTiled
+
+CAFFE_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32) # preprocess_image, mode "caffe"
+
+def preprocessingParameters(pResizeFactor, pTileSize=None, pTileOverlap=None, pInputDtype="float32", pPadMultiple=None):
+    parameters = {"mode": "caffe", "resizeFactor": pResizeFactor}
+
+    # Resizing the uint8 image before the normalisation changes the rounding, not the results of unresized images
+    if pResizeFactor != 1:
+        parameters["resizeFirst"] = True
+
+    # uint8 images are normalised to float32 in the batch, as the float32 ones
+    if pInputDtype == "float16":
+        parameters["inputDtype"] = pInputDtype
+
+    if pTileSize != None:
+        parameters["tileSize"] = pTileSize
+        parameters["tileOverlap"] = pTileOverlap
+    elif pPadMultiple != None:
+        # The zero padding of the batches changes the results near the bottom and right borders (tiles are not padded)
+        parameters["padMultiple"] = pPadMultiple
+
+    return parameters
+
+def resizeImage(pImage, pResizeFactor=1):
+    """
+    @Brief : Redimensionne une image uint8 comme resize_image, les côtés cibles étant ceux de l'image divisés par pResizeFactor.
+    """
+    importBackend()
+    from keras_retinanet.utils.image import compute_resize_scale
+
+    imgHeight, imgWidth, nbChannels = pImage.shape
+    scale = compute_resize_scale(pImage.shape, min(imgHeight, imgWidth) / pResizeFactor, max(imgHeight, imgWidth) / pResizeFactor)
+
+    # No copy when the image keeps its size, the default
+    if scale == 1:
+        return pImage, scale
+
+    import cv2
+    return cv2.resize(np.ascontiguousarray(pImage), None, fx=scale, fy=scale), scale
+
+def normalizeImage(pImage, pOut=None, pDtype=np.float32):
+    """
+    @Brief : Normalisation "caffe" d'une image BGR uint8, écrite dans pOut (par exemple une tranche d'un buffer de lot).
+    """
+    if pOut is None:
+        pOut = np.empty(pImage.shape, dtype=pDtype)
+
+    np.subtract(pImage, CAFFE_MEAN_BGR, out=pOut, casting="unsafe")
+
+    return pOut
+
+def prepareImage(pImage, pResizeFactor=1, pDtype=np.float32):
+    """
+    @Brief : Prépare une image BGR uint8 pour le réseau (redimensionnement puis normalisation).
+
+    Resizing first works on 1 byte per channel and the normalisation allocates a single array of the final size,
+    instead of a float32 copy of the full resolution image followed by a resized copy.
+
+    @Paramètres :
+        - pDtype : type de l'image prétraitée, float32, float16, ou uint8 pour différer la normalisation (normalizeImage).
+
+    @Retour :
+        - image : l'image prétraitée
+        - scale : le facteur de redimensionnement appliqué
+    """
+    image, scale = resizeImage(pImage, pResizeFactor)
+
+    if np.dtype(pDtype) == np.uint8:
+        return image, scale
+
+    return normalizeImage(image, pDtype=pDtype), scale
+
+class CStagesStatistics:
+    """
+    @Brief : Thread-safe accumulator of the busy time and item count of each pipeline stage.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._memory = {} # name -> (count, total bytes, peak bytes)
+        self.start = time.perf_counter()
+
+    def add(self, pStage, pSeconds, pCount=1):
+        with self._lock:
+            count, seconds = self._stages.get(pStage, (0, 0.0))
+            self._stages[pStage] = (count + pCount, seconds + pSeconds)
+
+        # The model loading is recorded by the registry itself, and waiting is not a processing stage
+        if pStage not in ("load", "wait"):
+            instrumentation.add(pStage, pSeconds, pCount)
+
+    def addMemory(self, pName, pBytes):
+        with self._lock:
+            count, total, peak = self._memory.get(pName, (0, 0, 0))
+            self._memory[pName] = (count + 1, total + pBytes, max(peak, pBytes))
+
+    def report(self):
+        wallTime = time.perf_counter() - self.start
+
+        with self._lock:
+            stages = dict(self._stages)
+            memory = dict(self._memory)
+
+        report = {"wallTime": wallTime, "stages": {}}
+        for stage, (count, seconds) in stages.items():
+            report["stages"][stage] = {
+                "count": count,
+                "seconds": seconds,
+                "throughput": count / seconds if seconds > 0 else None,  # items per busy second
+            }
+
+        report["memory"] = {name: {"meanBytes": total / count, "peakBytes": peak} for name, (count, total, peak) in memory.items()}
+
+        return report
+
+class CShapeBatcher:
+    """
+    @Brief : Groups prepared images in buckets of same input shape, and releases them as batches.
+
+    With a padding multiple, the shapes are rounded up to it so that close sizes share a bucket (images are then
+    zero padded on their bottom and right, which leaves their boxes coordinates unchanged). A bucket is released when
+    it is full, when its oldest image waited more than the deadline, or when too many images are held overall.
+    """
+    def __init__(self, pBatchSize, pMaxDelay=None, pPadMultiple=None, pMaxPending=None):
+        self.batchSize = pBatchSize
+        self.maxDelay = pMaxDelay # Seconds
+        self.padMultiple = pPadMultiple
+        self.maxPending = pMaxPending if pMaxPending != None else 2 * pBatchSize
+
+        self._buckets = {} # bucket shape -> (arrival time of the oldest item, items)
+        self._nbPending = 0
+
+    def bucketShape(self, pShape):
+        if self.padMultiple == None:
+            return tuple(pShape)
+
+        height, width = pShape[:2]
+        multiple = self.padMultiple
+        return (-(-height // multiple) * multiple, -(-width // multiple) * multiple) + tuple(pShape[2:])
+
+    def add(self, pItem, pImage):
+        """
+        @Retour :
+            - batches(list) : lots (bucket shape, items) prêts à être inférés
+        """
+        shape = self.bucketShape(pImage.shape)
+
+        arrival, items = self._buckets.setdefault(shape, (time.perf_counter(), []))
+        items.append(pItem)
+        self._nbPending += 1
+
+        if len(items) >= self.batchSize:
+            return [self.release(shape)]
+
+        # Memory bound : the fullest bucket goes first
+        if self._nbPending > self.maxPending:
+            return [self.release(max(self._buckets, key=lambda s: len(self._buckets[s][1])))]
+
+        return []
+
+    def release(self, pShape):
+        arrival, items = self._buckets.pop(pShape)
+        self._nbPending -= len(items)
+
+        return (pShape, items)
+
+    def timeout(self):
+        # Seconds until the next deadline, None if there is none
+        if self.maxDelay == None or len(self._buckets) == 0:
+            return None
+
+        oldest = min(arrival for arrival, items in self._buckets.values())
+        return max(0.0, oldest + self.maxDelay - time.perf_counter())
+
+    def expired(self):
+        if self.maxDelay == None:
+            return []
+
+        now = time.perf_counter()
+        return [self.release(shape) for shape, (arrival, items) in list(self._buckets.items()) if now - arrival >= self.maxDelay]
+
+    def flush(self):
+        return [self.release(shape) for shape in list(self._buckets)]
+
+class CInferencePipeline:
+    """
+    @Brief : Streams a list of images through decode -> preprocess -> batched predict -> result storage.
+
+    Decoding and preprocessing run on worker threads feeding a bounded queue, so memory stays bounded while the
+    model always has prepared images waiting. Images whose results are already cached skip the network entirely.
+    Images are batched by input shape (see CShapeBatcher), whatever their order in the list.
+    """
+    def __init__(self, pModelPath, pBackbone='resnet50', pBatchSize=4, pWorkers=2, pQueueSize=8, pResizeFactor=1, pUseCache=True, pTileSize=None, pTileOverlap=128,
+                 pPadMultiple=None, pMaxDelay=None, pInputDtype="uint8", pMaxBatchBuffers=4, pBackend="keras"):
+        assert pBatchSize >= 1 and pWorkers >= 1 and pQueueSize >= 1
+        assert pTileSize == None or 0 <= pTileOverlap < pTileSize
+        assert pPadMultiple == None or pPadMultiple >= 1
+        assert pInputDtype in ("float32", "float16", "uint8")
+
+        self.modelPath = pModelPath
+        self.backbone = pBackbone
+        self.backend = pBackend
+        self.batchSize = pBatchSize
+        self.workers = pWorkers
+        self.queueSize = pQueueSize
+        self.resizeFactor = pResizeFactor
+        self.useCache = pUseCache
+        self.tileSize = pTileSize # Images are inferred by sliding windows if set
+        self.tileOverlap = pTileOverlap
+        self.padMultiple = pPadMultiple # Input shapes rounded up to this multiple to share batches, exact shapes if None
+        self.maxDelay = pMaxDelay # Maximal wait of an image for its batch to fill, in seconds
+
+        # uint8 : queued images are kept resized but not normalised (4 times smaller), and normalised into the batch buffer
+        self.inputDtype = pInputDtype
+        self.maxBatchBuffers = pMaxBatchBuffers
+        self._batchBuffers = OrderedDict() # bucket shape -> (batch size, ...) input array, reused from batch to batch
+
+        self._stopRequested = threading.Event()
+
+    def stop(self):
+        self._stopRequested.set()
+
+    def run(self, pImagesPaths, pOnResult=None, pOnProgress=None):
+        """
+        @Brief : Infère toutes les images de la liste.
+
+        @Paramètres :
+            - pImagesPaths(list)    : chemins des images à inférer.
+            - pOnResult(callable)   : appelé avec (imgPath, boxes, scores, labels) pour chaque image inférée.
+            - pOnProgress(callable) : appelé avec (nbDone, nbTotal) après chaque image.
+
+        @Retour :
+            - report : statistiques de débit de chaque étage du pipeline
+        """
+        self._stopRequested.clear()
+        self.statistics = CStagesStatistics()
+        self.errors = {}
+
+        nbTotal = len(pImagesPaths)
+        self._nbDone = 0
+
+        pathsQueue = queue.Queue()
+        for imgPath in pImagesPaths:
+            pathsQueue.put(imgPath)
+
+        start = time.perf_counter()
+        model = modelRegistry.getModel(self.modelPath, self.backbone, self.backend)
+        self.statistics.add("load", time.perf_counter() - start)
+
+        preparedQueue = queue.Queue(maxsize=self.queueSize)
+
+        workers = [threading.Thread(target=self.prepareWorker, args=(pathsQueue, preparedQueue), daemon=True) for i in range(self.workers)]
+        for worker in workers:
+            worker.start()
+
+        def notify(imgPath, result):
+            self._nbDone += 1
+            if result != None and pOnResult != None:
+                pOnResult(imgPath, *result)
+            if pOnProgress != None:
+                pOnProgress(self._nbDone, nbTotal)
+
+        batcher = CShapeBatcher(self.batchSize, self.maxDelay, self.padMultiple, self.queueSize)
+        self._nbBatches = 0
+        nbRunningWorkers = len(workers)
+
+        try:
+            while nbRunningWorkers > 0:
+                start = time.perf_counter()
+                try:
+                    item = preparedQueue.get(timeout=batcher.timeout())
+                except queue.Empty:
+                    # Deadline of a partially filled batch
+                    for batch in batcher.expired():
+                        self.predictBatch(model, batch, notify)
+                    continue
+                finally:
+                    self.statistics.add("wait", time.perf_counter() - start)
+
+                if item == None:
+                    nbRunningWorkers -= 1
+                    continue
+
+                # Keep draining the queue so that the workers are never blocked
+                if self._stopRequested.is_set():
+                    continue
+
+                imgPath, image, scale, cacheKey, cachedResult = item
+
+                if image is None:
+                    notify(imgPath, cachedResult)
+                    continue
+
+                # The tiles of one image are batched together
+                if self.tileSize != None:
+                    self.predictTiledImage(model, item, notify)
+                    continue
+
+                # Only images sharing the same (padded) input shape can be stacked in one batch
+                for batch in batcher.add(item, image) + batcher.expired():
+                    self.predictBatch(model, batch, notify)
+
+            if not self._stopRequested.is_set():
+                for batch in batcher.flush():
+                    self.predictBatch(model, batch, notify)
+        except BaseException:
+            # A failed prediction (out of memory...) : the workers stop at their next image, the queue being drained
+            # until each of them has posted its None so that none stays blocked on a full queue
+            self._stopRequested.set()
+            while nbRunningWorkers > 0:
+                if preparedQueue.get() == None:
+                    nbRunningWorkers -= 1
+            raise
+
+        for worker in workers:
+            worker.join()
+
+        report = self.statistics.report()
+        report["images"] = nbTotal
+        report["done"] = self._nbDone
+        report["errors"] = len(self.errors)
+        report["batches"] = self._nbBatches
+        report["throughput"] = self._nbDone / report["wallTime"] if report["wallTime"] > 0 else None
+
+        return report
+
+    def prepareWorker(self, pPathsQueue, pPreparedQueue):
+        while not self._stopRequested.is_set():
+            try:
+                imgPath = pPathsQueue.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                item = self.prepareItem(imgPath)
+            except Exception as e:
+                self.errors[imgPath] = str(e)
+                item = (imgPath, None, None, None, None)
+
+            pPreparedQueue.put(item)
+
+        pPreparedQueue.put(None)
+
+    def prepareItem(self, pImgPath):
+        cacheKey = None
+        if self.useCache:
+            start = time.perf_counter()
+            cacheKey = resultCache.entryKey(pImgPath, self.modelPath, self.backbone, preprocessingParameters(self.resizeFactor, self.tileSize, self.tileOverlap, self.inputDtype, self.padMultiple), self.backend)
+            cachedResult = resultCache.get(cacheKey)
+            self.statistics.add("cache", time.perf_counter() - start)
+
+            if cachedResult != None:
+                return (pImgPath, None, None, cacheKey, cachedResult)
+
+        importBackend()
+        from keras_retinanet.utils.image import read_image_bgr
+
+        start = time.perf_counter()
+        image = read_image_bgr(pImgPath)
+        self.statistics.add("decode", time.perf_counter() - start)
+
+        # Tiles are preprocessed one batch at a time by predictTiled
+        if self.tileSize != None:
+            return (pImgPath, image, 1, cacheKey, None)
+
+        start = time.perf_counter()
+        preparedImage, scale = prepareImage(image, self.resizeFactor, self.inputDtype)
+        self.statistics.add("preprocess", time.perf_counter() - start)
+
+        # Both arrays are alive at the end of the preparation, only the prepared one is queued
+        self.statistics.addMemory("prepare", image.nbytes + (preparedImage.nbytes if preparedImage is not image else 0))
+        self.statistics.addMemory("queued", preparedImage.nbytes)
+
+        return (pImgPath, preparedImage, scale, cacheKey, None)
+
+    def batchBuffer(self, pShape):
+        # Called from the model thread only
+        buffer = self._batchBuffers.get(pShape)
+
+        if buffer is None:
+            dtype = np.float32 if self.inputDtype == "uint8" else self.inputDtype
+            buffer = np.zeros((self.batchSize,) + pShape, dtype=dtype)
+
+            self._batchBuffers[pShape] = buffer
+            while len(self._batchBuffers) > self.maxBatchBuffers:
+                self._batchBuffers.popitem(last=False)
+
+            self.statistics.addMemory("batchBuffers", sum(b.nbytes for b in self._batchBuffers.values()))
+        else:
+            self._batchBuffers.move_to_end(pShape)
+
+        return buffer
+
+    def predictTiledImage(self, pModel, pItem, pNotify):
+        imgPath, image, scale, cacheKey, cachedResult = pItem
+
+        # The preprocess and predict statistics count tiles in this mode
+        result = predictTiled(pModel, image, self.tileSize, self.tileOverlap, self.batchSize, pStatistics=self.statistics)
+
+        if cacheKey != None:
+            start = time.perf_counter()
+            resultCache.put(cacheKey, *result)
+            self.statistics.add("postprocess", time.perf_counter() - start)
+
+        pNotify(imgPath, result)
+
+    def predictBatch(self, pModel, pBatch, pNotify):
+        shape, items = pBatch
+
+        start = time.perf_counter()
+        buffer = self.batchBuffer(shape)
+        for i, item in enumerate(items):
+            image = item[1]
+            height, width = image.shape[:2]
+
+            # Normalised in place in the buffer, or copied if already normalised
+            if image.dtype == np.uint8:
+                normalizeImage(image, buffer[i, :height, :width])
+            else:
+                buffer[i, :height, :width] = image
+
+            # Zero padding on the bottom and right, the buffer holding the previous batch
+            buffer[i, height:] = 0
+            buffer[i, :height, width:] = 0
+
+        inputs = buffer[:len(items)]
+        self.statistics.add("batch", time.perf_counter() - start, len(items))
+
+        start = time.perf_counter()
+        boxes, scores, labels = pModel.predict_on_batch(inputs)
+        self.statistics.add("predict", time.perf_counter() - start, len(items))
+        self._nbBatches += 1
+
+        boxes = np.asarray(boxes)
+
+        start = time.perf_counter()
+        results = []
+        for i, (imgPath, image, scale, cacheKey, cachedResult) in enumerate(items):
+            imageBoxes = boxes[i:i+1]
+
+            # Boxes reaching into the padding are clipped to the image
+            height, width = image.shape[:2]
+            if (height, width) != shape[:2]:
+                imageBoxes = np.clip(imageBoxes, 0, [width - 1, height - 1, width - 1, height - 1])
+
+            # Keep the batch dimension so results have the same layout as a single image inference, each image has its own scale
+            result = (imageBoxes / scale, scores[i:i+1], labels[i:i+1])
+
+            if cacheKey != None:
+                resultCache.put(cacheKey, *result)
+
+            results.append((imgPath, result))
+        self.statistics.add("postprocess", time.perf_counter() - start, len(items))
+
+        for imgPath, result in results:
+            pNotify(imgPath, result)
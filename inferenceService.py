@@ -0,0 +1,126 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import queue
+import itertools
+import threading
+
+class CInferenceService(QObject):
+    """
+    @Brief : Persistent inference service running CInference jobs by priority.
+
+    Preprocessing workers load cached results or decode and preprocess the images, a single long-lived model worker
+    runs the network. Background jobs (the neighbours of the visible image) only run when no visible job is queued.
+    Jobs can be cancelled until the model worker picks them, results are delivered through signals keyed by job ID
+    (emitted from the worker threads, hence queued to the GUI thread).
+    """
+    jobFinished = pyqtSignal(int, object)   # job ID, CInference
+    jobFailed = pyqtSignal(int, str)        # job ID, error message
+
+    PRIORITY_VISIBLE = 0
+    PRIORITY_BACKGROUND = 10
+
+    def __init__(self, pNbPreprocessWorkers=2):
+        super().__init__()
+
+        assert pNbPreprocessWorkers >= 1
+
+        self._jobs = {} # job ID -> CInference, only pending jobs
+        self._lock = threading.Lock()
+        self._jobIds = itertools.count(1)
+        self._sequence = itertools.count() # FIFO order between jobs of same priority
+
+        self._preprocessQueue = queue.PriorityQueue()
+        self._modelQueue = queue.PriorityQueue()
+
+        self._preprocessWorkers = [threading.Thread(target=self.preprocessWorker, daemon=True) for i in range(pNbPreprocessWorkers)]
+        self._modelWorker = threading.Thread(target=self.modelWorker, daemon=True)
+
+        for worker in self._preprocessWorkers + [self._modelWorker]:
+            worker.start()
+
+    def submit(self, pInference, pPriority=PRIORITY_VISIBLE):
+        jobId = next(self._jobIds)
+
+        with self._lock:
+            self._jobs[jobId] = pInference
+
+        self._preprocessQueue.put((pPriority, next(self._sequence), jobId))
+
+        return jobId
+
+    def cancel(self, pJobId):
+        with self._lock:
+            return self._jobs.pop(pJobId, None) != None
+
+    def cancelAll(self):
+        with self._lock:
+            jobIds = list(self._jobs.keys())
+
+        for jobId in jobIds:
+            self.cancel(jobId)
+
+    def shutdown(self):
+        self.cancelAll()
+
+        # Sentinels are queued after any remaining job
+        for worker in self._preprocessWorkers:
+            self._preprocessQueue.put((float("inf"), next(self._sequence), None))
+        self._modelQueue.put((float("inf"), next(self._sequence), None))
+
+    def activeJob(self, pJobId):
+        with self._lock:
+            return self._jobs.get(pJobId)
+
+    def finishJob(self, pJobId):
+        with self._lock:
+            inference = self._jobs.pop(pJobId, None)
+
+        if inference != None:
+            self.jobFinished.emit(pJobId, inference)
+
+    def failJob(self, pJobId, pError):
+        with self._lock:
+            self._jobs.pop(pJobId, None)
+
+        print("Inference job {} failed : {}".format(pJobId, pError))
+        self.jobFailed.emit(pJobId, str(pError))
+
+    def preprocessWorker(self):
+        while True:
+            priority, sequence, jobId = self._preprocessQueue.get()
+            if jobId == None:
+                break
+
+            inference = self.activeJob(jobId)
+            if inference == None: # Cancelled
+                continue
+
+            try:
+                if inference.loadCachedResult():
+                    self.finishJob(jobId)
+                    continue
+
+                inference.prepareImage()
+            except Exception as e:
+                self.failJob(jobId, e)
+                continue
+
+            self._modelQueue.put((priority, sequence, jobId))
+
+    def modelWorker(self):
+        while True:
+            priority, sequence, jobId = self._modelQueue.get()
+            if jobId == None:
+                break
+
+            inference = self.activeJob(jobId)
+            if inference == None: # Cancelled, the preprocessed image is released with the job
+                continue
+
+            try:
+                inference.predict()
+            except Exception as e:
+                self.failJob(jobId, e)
+                continue
+
+            self.finishJob(jobId)
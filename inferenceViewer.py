@@ -1,234 +1,114 @@
-from re import S
-from PyQt5.QtCore import QDir, QObject, QPoint, QLine, QStandardPaths, QThread, Qt, pyqtSignal, pyqtSlot
-from PyQt5.QtGui import QBrush, QColor, QImage, QImageReader, QPen, QPixmap, QPalette, QPainter
-from PyQt5.QtWidgets import QDialog, QFileSystemModel, QHBoxLayout, QLabel, QListView, QPushButton, QSizePolicy, QRadioButton, QScrollArea, QMessageBox, QMainWindow, QMenu, QAction, QVBoxLayout, QWidget, qApp, QFileDialog
+import time
+startupClock = time.perf_counter() # Reference of the startup measurements (see QImageViewer.startupTimes)
 
-import keras
-from keras_retinanet import models
-from keras_retinanet.utils.image import read_image_bgr, preprocess_image, resize_image
-from keras_retinanet.utils.colors import label_color
-from keras_retinanet.utils.gpu import setup_gpu
+from PyQt5.QtCore import QDir, QItemSelectionModel, QSize, QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QPalette
+from PyQt5.QtWidgets import QActionGroup, QCheckBox, QDoubleSpinBox, QFileSystemModel, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView, QHBoxLayout, QLabel, QListView, QPushButton, QSizePolicy, QSlider, QToolButton, QRadioButton, QMessageBox, QMainWindow, QMenu, QAction, QVBoxLayout, QWidget, qApp, QFileDialog
 
 import os
-import time
 import numpy as np
 
-class CPredictionsPainter(QPainter):
-    def __init__(self, device):
-        if type(self) == CPredictionsPainter:
-            raise Exception("CPredictionsPainter must be subclassed.")
-
-        super().__init__(device)
-
-        self.initPainterStyle()
-
-    def initPainterStyle(self):
-        self.color = QColor(0, 255, 0, 255)
-        self.pen = QPen(self.color)
-        self.pen.setWidth(3)
-        self.setPen(self.pen)
-
-    def drawInferences(self, inference):
-        pass
-
-class CCirclePredictionsPainter(CPredictionsPainter):
-    def __init__(self, device):
-        super().__init__(device)
-
-        self.initPainterStyle()
-
-    def initPainterStyle(self):
-        self.color = QColor(0, 255, 0, 255)
-        self.pen = QPen(self.color)
-        self.pen.setWidth(3)
-        self.setPen(self.pen)
-
-    def drawInferences(self, inference):
-        boxes   = inference._boxes
-        scores  = inference._scores
-        labels  = inference._labels
-
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
-            # Scores are sorted so we can break
-            if score < 0.5: # TODO : récupérer la valeur d'un curseur [0, 1]
-                break
-
-            b = box.astype(int)
-            x = b[0]
-            y = b[1]
-            w = b[2] - x
-            h = b[3] - y 
-
-            self.drawEllipse(x, y, w, h)
-            print("draw (x, y, rx, ry) object: ({}, {}, {}, {}))".format(x + int(w/2), y + int(h/2), int(w/2), int(h/2)))
-
-        self.end()  
-
-class CBboxPredictionsPainter(CPredictionsPainter):
-    def __init__(self, device):
-        super().__init__(device)
-
-        self.initPainterStyle()
-
-    def initPainterStyle(self):
-        self.color = QColor(0, 255, 0, 255)
-        self.pen = QPen(self.color)
-        self.pen.setWidth(3)
-        self.setPen(self.pen)
-
-    def drawInferences(self, inference):
-        super().drawInferences(inference)
-
-        boxes   = inference._boxes
-        scores  = inference._scores
-        labels  = inference._labels
-
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
-            # Scores are sorted so we can break
-            if score < 0.5: # TODO : récupérer la valeur d'un curseur [0, 1]
-                break
-
-            b = box.astype(int)
-            x = b[0]
-            y = b[1]
-            w = b[2] - x
-            h = b[3] - y 
-
-            self.drawRect(x, y, w, h)
-            print("draw (x, y, w, h) object : ({}, {}, {}, {}))".format(x, y, w, h))
-
-        self.end()
-
-class CCrossPredictionsPainter(CPredictionsPainter):
-    def __init__(self, device):
-        super().__init__(device)
-
-        self.initPainterStyle()
-
-    def initPainterStyle(self):
-        self.color = QColor(0, 255, 0, 255)
-        self.pen = QPen(self.color)
-        self.pen.setWidth(3)
-        self.setPen(self.pen)
-
-    def drawInferences(self, inference):
-        super().drawInferences(inference)
-
-        boxes   = inference._boxes
-        scores  = inference._scores
-        labels  = inference._labels
-
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
-            # Scores are sorted so we can break
-            if score < 0.5: # TODO : récupérer la valeur d'un curseur [0, 1]
-                break
-            b = box.astype(int)
-            x = b[0]
-            y = b[1]
-            w = b[2] - x
-            h = b[3] - y 
-            lenLines = 5
- 
-            hLine = QLine(x + w/2 - lenLines, y + h/2, x + w/2 + lenLines, y + h/2)
-            vLine = QLine(x + w/2, y + h/2 - lenLines, x + w/2, y + (h/2) + lenLines)
-
-            self.drawLines(hLine, vLine)
-            print("draw (x, y) object : ({}, {})".format(x + int(w/2), y + int(h/2)))
-
-        self.end()
-
-class CInference(QObject):
-    finished = pyqtSignal()
-
-    def __init__(self, pImgPath, pModelPath, pBackbone=None, pThreshold=None, pSavePath=None):
-        super().__init__()
-
-        self.imgPath = pImgPath
-        self.modelPath = pModelPath
-
-        ### Gestion des paramètres
-        if pBackbone != None:
-            assert pBackbone == "resnet50" or pBackbone == "resnet101"
-            self.backbone = pBackbone
-        else:
-            self.backbone = 'resnet50'
-
-        if pThreshold != None:
-            assert pThreshold >=0 and pThreshold <= 1
-            self.scoreThreshold = pThreshold
-        else:
-            self.scoreThreshold = 0.5
-
-        if pSavePath != None:
-            self.inferenceSavePath = pSavePath
-        else:
-            self.inferenceSavePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference.jpg")
-    
-    @pyqtSlot()
-    def inferImage(self):
-        self.performTFObjectDetection()
-        print("End of inference")
-        self.finished.emit()
-
-    def performTFObjectDetection(self):
-        """
-        @Signature   : simpleInference
-        @Brief       : Effectue une inférence sur une image selon les paramètres indiqués.
-
-        @Paramètres :
-            - imgPath(str)      : chemin absolu vers le fichier image à inférer (ex : D:\<path>\<filename>.jpg).
-            - modelPath(str)    : chemin absolu vers le modèle d'inférence à utiliser (ex : D:\<path>\<filename>.h5).
-            - pBackbone(str)    : indique le réseau backbone à utiliser pour effectuer l'inférence. Les backbones disponibles sont [resnet50, resnet101].
-            - pThreshold(float) : indique le seuil minimal de probabilité pour prendre en compte la prédiction. Ce seuil doit ∈ [0.0, 1.0].
-            - pSavePath(str)    : chemin absolu de sauvegarde pour l'image résultante de l'inférence  (ex : D:\<path>\<filename>.jpg).
-
-        @Retour :
-            - objects       : liste des objets détectés par le modèle
-            - scoreF1       : le score F1 de l'inférence. 
-            - enlapsedTime  : le temps écoulé pour réaliser l'inférence
-        """
-        print("Inference begins")
-
-        ### Gestion du matériel
-        gpu = "0" # ID du GPU pour l'inférence
-        setup_gpu(gpu) # set the modified tf session as backend in keras
-
-        ### Inférence
-        image = read_image_bgr(self.imgPath) # Chargement de l'image
-        model = models.load_model(self.modelPath, backbone_name=self.backbone) # Chargement du model Retinanet
-
-        imgHeight, imgWidth, nbChannels = image.shape
-
-        resizeFactor    = 1     # Facteur d'échelle 
-        imageMinSide    = min(imgHeight, imgWidth) / resizeFactor
-        imageMaxSide    = max(imgHeight, imgWidth) / resizeFactor
-
-        # Prétraitement de l'image source pour le réseau
-        image = preprocess_image(image)
-        image, scale = resize_image(image, imageMinSide, imageMaxSide)
-        print("Facteur de redimensionnement : ", scale)
-
-        # Traitement de l'image par le réseau
-        start = time.time()
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
-        enlapsedTime = time.time() - start
-        print("Processing time : ", enlapsedTime)
-
-        boxes /= scale # Réduction de la taille des bbox pour correspondre au redimensionnement de l'image
-
-        self._boxes = boxes
-        self._scores = scores
-        self._labels = labels
+from instrumentation import instrumentation
+from inference import CInference, CComparisonInference, CModelWarmer, CFolderInference, CVideoInference
+from inferenceService import CInferenceService
+from predictionsPainters import CBboxPredictionsPainter, CCirclePredictionsPainter, CCrossPredictionsPainter, CPredictionsOverlayItem, labelColor
+from tiledImage import CImagePyramid, CTiledImageItem
+from imageCache import CImagePrefetcher, CThumbnailProvider, CThumbnailProxyModel
+from performancePanel import QPerformancePanel
+from savedDetections import CSavedDetections
+from directoryIndex import CDirectoryIndexer, CImagesListModel
+from evaluation import imageF1, loadAnnotations
+from detectionsIndex import CDatasetDetectionsIndex
+from inferenceBackends import BACKENDS
+from videoInference import VIDEO_EXTENSIONS
+
+importTime = time.perf_counter() - startupClock
 
 class QImageViewer(QMainWindow):
+    warmBackendRequested = pyqtSignal()
+    warmModelRequested = pyqtSignal(str, str, str)
+    folderInferenceRequested = pyqtSignal(list, str, str, dict)
+    indexDirectoryRequested = pyqtSignal(str, bool, int)
+    videoRequested = pyqtSignal(str, str, str, dict)
+    startupMeasured = pyqtSignal(dict)
+
     def __init__(self):
         super().__init__()
 
         # Mecanism variables
         self.workingRoot = os.path.join("D:\\", "Retinanet")
         self.scaleFactor = 1.0
-
-        self.computingThread = QThread()
+        self.backbone = 'resnet50'
+        self.inferenceBackend = "keras" # Or a TensorFlow Lite conversion for CPU nodes, see inferenceBackends
+        self.tileSize = 1024 # Used when the tiled inference is enabled
+        self.tileOverlap = 128
+        self.exportFormats = ["jsonl", "coco", "columnar"]
+        self.batchPadMultiple = 32 # Folder inferences batch images of close sizes together
+        self.scoreThreshold = 0.5
+        self.openedImagesInferences = None
+        self.savedDetections = None # Detections files opened for display, indexed by image path
+        self.datasetIndex = None # Score index of the opened detections, counting the detections above the threshold
+        self.knownLabels = set() # Classes met in the displayed detections, listed in the classes filter
+        self.hiddenLabels = set()
+        self.groundTruth = None # Annotations the inferences are evaluated against
+        self.folderEvaluationText = ""
+        self.currentImagePath = None
+        self.overlays = {} # Visualisation style -> overlay item, built on first display
+
+        # Startup measurements (seconds), keras is imported in background once the window is painted
+        self.startupTimes = {"import": importTime, "firstPaint": None, "backendImport": None}
+
+        # Interactive inferences are queued to a persistent service : one model worker and preprocessing workers
+        self.nbPreprocessWorkers = 2
+        self.inferenceService = CInferenceService(self.nbPreprocessWorkers)
+        self.inferenceService.jobFinished.connect(self.onInferenceFinished)
+        self.inferenceService.jobFailed.connect(self.onInferenceFailed)
+        self.visibleJobId = None
+        self.backgroundJobIds = [] # Neighbours of the visible image, inferred when the model is idle
+
+        # Models are loaded in background as soon as they are selected
+        self.warmingThread = QThread()
+        self.modelWarmer = CModelWarmer()
+        self.modelWarmer.moveToThread(self.warmingThread)
+        self.warmModelRequested.connect(self.modelWarmer.warmModel)
+        self.warmBackendRequested.connect(self.modelWarmer.warmBackend)
+        self.modelWarmer.warmed.connect(self.onModelWarmed)
+        self.modelWarmer.backendImported.connect(self.onBackendImported)
+        self.modelWarmer.backendImportFailed.connect(self.onBackendImportFailed)
+        self.warmingThread.start()
+
+        # Folder inferences are run by a long-lived worker
+        self.folderThread = QThread()
+        self.folderInference = CFolderInference()
+        self.folderInference.moveToThread(self.folderThread)
+        self.folderInferenceRequested.connect(self.folderInference.inferImages)
+        self.folderInference.progress.connect(self.onFolderInferenceProgress)
+        self.folderInference.evaluated.connect(self.onFolderEvaluated)
+        self.folderInference.finished.connect(self.onFolderInferenceFinished)
+        self.folderThread.start()
+
+        # Videos and frames sequences are streamed by another long-lived worker
+        self.videoReuseThreshold = 0.01 # Mean pixel difference under which a frame reuses the previous detections
+        self.videoRunning = False
+        self.videoDisplayed = False # False once stopped, the frames still in flight are not displayed
+        self.videoThread = QThread()
+        self.videoInference = CVideoInference()
+        self.videoInference.moveToThread(self.videoThread)
+        self.videoRequested.connect(self.videoInference.streamFrames)
+        self.videoInference.frameInferred.connect(self.onVideoFrame)
+        self.videoInference.finished.connect(self.onVideoFinished)
+        self.videoThread.start()
+
+        # Images directories are listed in background, the entries being streamed into the images list
+        self.indexingThread = QThread()
+        self.directoryIndexer = CDirectoryIndexer()
+        self.directoryIndexer.moveToThread(self.indexingThread)
+        self.indexDirectoryRequested.connect(self.directoryIndexer.indexDirectory)
+        self.directoryIndexer.entriesFound.connect(self.onImagesFound)
+        self.directoryIndexer.dimensionsFound.connect(self.onImagesDimensionsFound)
+        self.directoryIndexer.finished.connect(self.onIndexingFinished)
+        self.indexingThread.start()
+        self.indexingGeneration = 0
 
         self.setupUI()
 
@@ -237,12 +117,16 @@ class QImageViewer(QMainWindow):
         self.mainWidget = QWidget()
 
         # Abstract
-        # Utilisation de deux models QFileSystemModel différents car les filtres sur fichier ne sont pas les mêmes
-        self.fileSysImages = QFileSystemModel()
-        self.fileSysImages.setReadOnly(True)
-        self.fileSysImages.setFilter(QDir.Filter.NoDotAndDotDot | QDir.Filter.Files)
-        self.fileSysImages.setNameFilters(self.defineImageFilter())
-        self.fileSysImages.setNameFilterDisables(False)
+        # The images list is filled by the directory indexer, the models one by a QFileSystemModel
+        self.imagesList = CImagesListModel()
+
+        # The images list shows thumbnails, generated in background
+        self.thumbnailProvider = CThumbnailProvider()
+        self.imagesModel = CThumbnailProxyModel(self.imagesList, self.thumbnailProvider)
+
+        # Neighbours of the selected image are decoded in background
+        self.imagePrefetcher = CImagePrefetcher()
+        self.nbPrefetchedNeighbours = 2
 
         self.fileSysModels = QFileSystemModel()
         self.fileSysModels.setReadOnly(True)
@@ -258,26 +142,38 @@ class QImageViewer(QMainWindow):
 
         self.modelsListView = QListView()
         self.initializeInferenceParamListView(self.modelsListView, self.fileSysModels)
+        self.modelsListView.selectionModel().currentChanged.connect(self.onModelClicked)
 
         self.modelFileBrowserBtn = QPushButton("Browse...")
         self.modelFileBrowserBtn.clicked.connect(self.openModelsFiles)
 
+        # Several models can be selected to compare their detections on the same image
+        self.compareModelsCheckBox = QCheckBox("Compare models")
+        self.compareModelsCheckBox.toggled.connect(self.onCompareModelsToggled)
+
         self.imagesListLbl = QLabel("Images list :")
 
         self.imagesListView = QListView() 
-        self.initializeInferenceParamListView(self.imagesListView, self.fileSysImages)
+        self.initializeInferenceParamListView(self.imagesListView, self.imagesModel)
+        self.imagesListView.setIconSize(QSize(self.thumbnailProvider.size, self.thumbnailProvider.size))
         self.imagesListView.selectionModel().currentChanged.connect(self.onImageClicked)
         self.imagesListView.doubleClicked.connect(self.onImageDoubleClicked) #TODO infer image
 
         self.imageFileBrowserBtn = QPushButton("Browse...")
         self.imageFileBrowserBtn.clicked.connect(self.openImagesFiles)
 
+        self.runOnFolderBtn = QPushButton("Run on folder")
+        self.runOnFolderBtn.setDisabled(True)
+        self.runOnFolderBtn.clicked.connect(self.onRunOnFolder)
+
         self.vlayParam.addWidget(self.modelsListLbl)
         self.vlayParam.addWidget(self.modelsListView)
         self.vlayParam.addWidget(self.modelFileBrowserBtn)
+        self.vlayParam.addWidget(self.compareModelsCheckBox)
         self.vlayParam.addWidget(self.imagesListLbl)
         self.vlayParam.addWidget(self.imagesListView)
         self.vlayParam.addWidget(self.imageFileBrowserBtn)
+        self.vlayParam.addWidget(self.runOnFolderBtn)
 
         # Panel Image
         self.vlayImage = QVBoxLayout()
@@ -307,39 +203,71 @@ class QImageViewer(QMainWindow):
         self.hlayParamVisualisation.addWidget(self.radioVisuCross)
         self.hlayParamVisualisation.addWidget(self.radioVisuNone)
 
-        self.imageLabel = QLabel()
-        self.imageLabel.setBackgroundRole(QPalette.Base)
-        self.imageLabel.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
-        self.imageLabel.setScaledContents(True)
-        self.imageLabel.setUpdatesEnabled(True)
-
-        self.scrollArea = QScrollArea()
-        self.scrollArea.setBackgroundRole(QPalette.Base)
-        self.scrollArea.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.scrollArea.setWidget(self.imageLabel)
-        self.scrollArea.setVisible(True)
+        self.thresholdLbl = QLabel("Score threshold :")
+
+        self.thresholdSpinBox = QDoubleSpinBox()
+        self.thresholdSpinBox.setRange(0.0, 1.0)
+        self.thresholdSpinBox.setSingleStep(0.05)
+        self.thresholdSpinBox.setValue(self.scoreThreshold)
+        self.thresholdSpinBox.valueChanged.connect(self.onScoreThresholdChanged)
+
+        # The slider moves the spin box, hundredths of score
+        self.thresholdSlider = QSlider(Qt.Orientation.Horizontal)
+        self.thresholdSlider.setRange(0, 100)
+        self.thresholdSlider.setValue(round(self.scoreThreshold * 100))
+        self.thresholdSlider.setMinimumWidth(120)
+        self.thresholdSlider.valueChanged.connect(lambda value: self.thresholdSpinBox.setValue(value / 100))
+
+        self.classesFilterBtn = QToolButton()
+        self.classesFilterBtn.setText("Classes")
+        self.classesFilterBtn.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        self.classesFilterBtn.setMenu(QMenu(self.classesFilterBtn))
+        self.classesFilterBtn.setEnabled(False)
+
+        self.modelsLegendLbl = QLabel()
+        self.datasetCountLbl = QLabel()
+
+        self.hlayParamVisualisation.addStretch()
+        self.hlayParamVisualisation.addWidget(self.modelsLegendLbl)
+        self.hlayParamVisualisation.addWidget(self.datasetCountLbl)
+        self.hlayParamVisualisation.addWidget(self.classesFilterBtn)
+        self.hlayParamVisualisation.addWidget(self.thresholdLbl)
+        self.hlayParamVisualisation.addWidget(self.thresholdSlider)
+        self.hlayParamVisualisation.addWidget(self.thresholdSpinBox)
+
+        # The image and the detections overlays are separate items of the scene
+        self.imageScene = QGraphicsScene()
+        self.imageItem = None
+
+        self.imageView = QGraphicsView(self.imageScene)
+        self.imageView.setBackgroundRole(QPalette.Base)
+        self.imageView.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.imageView.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
+        self.imageView.setResizeAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
 
         self.vlayImage.addLayout(self.hlayParamVisualisation)
-        self.vlayImage.addWidget(self.scrollArea)
+        self.vlayImage.addWidget(self.imageView)
 
         self.hlayMain.addLayout(self.vlayParam)
         self.hlayMain.addLayout(self.vlayImage)
 
         self.setCentralWidget(self.mainWidget)
 
+        # Stages timings, caches counters and memory, hidden by default
+        self.performancePanel = QPerformancePanel(self)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.performancePanel)
+        self.performancePanel.hide()
+
+        # F1 of the displayed image and metrics of the running folder inference, next to the status messages
+        self.evaluationLbl = QLabel()
+        self.statusBar().addPermanentWidget(self.evaluationLbl)
+
         self.createActions()
         self.createMenus()
 
         self.setWindowTitle("Inference Viewer")
         self.resize(1064, 536)
 
-    def defineImageFilter(self):
-        imageSupportedMime = ["*.jpg"] # Pas très propre mais solution pour le moment. La fonction QImageReader.supportedMimeTypes() retourne "jpeg" mais pas "jpg".
-        for elem in QImageReader.supportedMimeTypes():
-            imageSupportedMime.append("*." + elem.data().decode("utf-8").split("/")[-1])
-
-        return imageSupportedMime
-
     def initializeImageFileDialog(self, acceptMode):
         dialog = QFileDialog()
 
@@ -380,70 +308,135 @@ class QImageViewer(QMainWindow):
         dirName = dlg.getExistingDirectory(self, "Select images directory")
 
         if dirName:
-            self.imagesListView.setDisabled(False)
+            self.indexImagesDirectory(dirName)
 
-            self.fileSysImages.setRootPath(dirName)
-            self.imagesListView.setRootIndex(self.fileSysImages.index(dirName))
+    def indexImagesDirectory(self, pDirName):
+        # The running indexing, if any, is abandoned
+        self.indexingGeneration += 1
+        self.directoryIndexer.currentGeneration = self.indexingGeneration
 
-    def openImagesDirectory(self):
-        dlg = self.initializeImageFileDialog(QFileDialog.AcceptMode.AcceptOpen)
+        self.imagesList.setRootPath(pDirName)
+        self.imagesListView.setDisabled(False)
+        self.runOnFolderBtn.setDisabled(True)
 
-        dirName = dlg.getExistingDirectory(self, "Select images directory")
+        self.statusBar().showMessage("Indexing {}...".format(pDirName))
+        self.indexDirectoryRequested.emit(pDirName, self.recursiveImagesAct.isChecked(), self.indexingGeneration)
 
-        self.imagesFiles = []
-        if dirName:
-            imageSupportedMime = []
+    def onImagesFound(self, generation, entries):
+        if generation != self.indexingGeneration:
+            return
+
+        self.imagesList.appendEntries(entries)
+        self.statusBar().showMessage("Indexing : {} images".format(self.imagesList.rowCount()))
 
+    def onImagesDimensionsFound(self, generation, entries):
+        if generation == self.indexingGeneration:
+            self.imagesList.setDimensions(entries)
 
-            for imageFile in [f for f in os.listdir(dirName) if f.endswith(tuple(imageSupportedMime))]:
-                self.imagesFiles.append(os.path.join(dirName, imageFile))
+    def onIndexingFinished(self, generation, nbImages):
+        if generation != self.indexingGeneration:
+            return
 
+        self.runOnFolderBtn.setDisabled(nbImages == 0)
+        self.statusBar().showMessage("{} images".format(nbImages))
 
-        self.showImage()
+    def onRecursiveImagesToggled(self, checked):
+        if self.imagesList.rootPath != "":
+            self.indexImagesDirectory(self.imagesList.rootPath)
 
     def showImage(self, imagePath):
-        image = QImage(imagePath)
-        if image.isNull():
+        if self.videoDisplayed:
+            self.stopVideo()
+
+        # Only the header is read here, the visible tiles are decoded when painted
+        pyramid = CImagePyramid(imagePath)
+        if not pyramid.isValid():
             QMessageBox.information(self, "Image Viewer", "Cannot load %s." % imagePath)
             return
 
-        self.originalImage = QPixmap.fromImage(image)
-        self.imageLabel.setPixmap(self.originalImage)
+        if self.imageItem != None:
+            self.imageScene.removeItem(self.imageItem)
 
-        previousFactor =  self.scaleFactor
-        self.scaleFactor = 1.0
+        self.imageItem = CTiledImageItem(pyramid)
+        self.imageScene.addItem(self.imageItem)
+        self.imageScene.setSceneRect(self.imageItem.boundingRect())
+        self.currentImagePath = imagePath
+
+        # The detections of the previous image no longer apply
+        self.clearOverlays()
+        self.drawInferences()
+        self.updateModelsLegend()
 
-        self.scrollArea.setVisible(True)
         self.fitToWindowAct.setEnabled(True)
         self.updateActions()
 
-        if not self.fitToWindowAct.isChecked():
-            self.imageLabel.adjustSize()
-            self.scaleImage(previousFactor) # Keep the scaling after loading image
+        # The view transform is kept after loading image
+        if self.fitToWindowAct.isChecked():
+            self.imageView.fitInView(self.imageScene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+    def onModelClicked(self):
+        selectedElemIndex = self.modelsListView.currentIndex()
+        modelFilePath = QFileSystemModel.filePath(self.fileSysModels, selectedElemIndex)
+
+        if modelFilePath != '':
+            self.warmModelRequested.emit(modelFilePath, self.backbone, self.inferenceBackend)
+
+    def onModelWarmed(self, pModelPath):
+        self.statusBar().showMessage("Model ready : {}".format(os.path.basename(pModelPath)))
 
     def onImageClicked(self):
         selectedElemIndex = self.imagesListView.currentIndex()
-        imageFilePath = QFileSystemModel.filePath(self.fileSysImages, selectedElemIndex)
+        imageFilePath = self.imagesModel.filePath(selectedElemIndex)
+
+        # The pending inference of the previously displayed image is stale
+        if self.visibleJobId != None:
+            self.inferenceService.cancel(self.visibleJobId)
+            self.visibleJobId = None
 
         self.showImage(imageFilePath)
+        self.prefetchNeighbours(selectedElemIndex)
+
+    def neighboursPaths(self, pIndex):
+        neighboursPaths = []
+        for offset in range(1, self.nbPrefetchedNeighbours + 1):
+            for row in (pIndex.row() + offset, pIndex.row() - offset):
+                neighbourIndex = pIndex.sibling(row, 0)
+                if neighbourIndex.isValid():
+                    neighboursPaths.append(self.imagesModel.filePath(neighbourIndex))
+
+        return neighboursPaths
+
+    def prefetchNeighbours(self, pIndex):
+        self.imagePrefetcher.prefetch(self.neighboursPaths(pIndex), self.imageView.transform().m11())
+
+    def createInference(self, pImagePath, pModelPath, pModelsPaths):
+        if self.compareModelsCheckBox.isChecked() and len(pModelsPaths) > 1:
+            return CComparisonInference(pImagePath, pModelsPaths, self.backbone, pTileSize=self.inferenceTileSize(), pTileOverlap=self.tileOverlap, pBackend=self.inferenceBackend)
+
+        return CInference(pImagePath, pModelPath, self.backbone, pTileSize=self.inferenceTileSize(), pTileOverlap=self.tileOverlap, pBackend=self.inferenceBackend)
 
     def onImageDoubleClicked(self):
         selectedElemIndex = self.modelsListView.currentIndex()
         modelFilePath = QFileSystemModel.filePath(self.fileSysModels, selectedElemIndex)
 
         selectedElemIndex = self.imagesListView.currentIndex()
-        imageFilePath = QFileSystemModel.filePath(self.fileSysImages, selectedElemIndex)
-
-        if modelFilePath != '':
-            self.imagesListView.setDisabled(True)
-
-            self.openedImagesInferences = CInference(imageFilePath, modelFilePath)
+        imageFilePath = self.imagesModel.filePath(selectedElemIndex)
 
-            self.openedImagesInferences.moveToThread(self.computingThread)
-            self.computingThread.started.connect(self.openedImagesInferences.inferImage)
-            self.openedImagesInferences.finished.connect(self.onInferenceFinished)
+        modelsFilesPaths = self.selectedModelsPaths()
 
-            self.computingThread.start()
+        if modelFilePath != '':
+            if self.visibleJobId != None:
+                self.inferenceService.cancel(self.visibleJobId)
+            for jobId in self.backgroundJobIds:
+                self.inferenceService.cancel(jobId)
+
+            inference = self.createInference(imageFilePath, modelFilePath, modelsFilesPaths)
+            self.visibleJobId = self.inferenceService.submit(inference, CInferenceService.PRIORITY_VISIBLE)
+            self.statusBar().showMessage("Inference of {} queued".format(os.path.basename(imageFilePath)))
+
+            # Run after the visible image, their results are cached : double-clicking them next is immediate
+            self.backgroundJobIds = [self.inferenceService.submit(self.createInference(neighbourPath, modelFilePath, modelsFilesPaths), CInferenceService.PRIORITY_BACKGROUND)
+                                     for neighbourPath in self.neighboursPaths(selectedElemIndex)]
         else:
             alertDlg = QMessageBox(self)
 
@@ -455,42 +448,428 @@ class QImageViewer(QMainWindow):
             alertDlg.setInformativeText("Please, select a model before infer image.")
             alertDlg.open()
 
-    def onInferenceFinished(self):
-        self.computingThread.quit()
+    def selectedModelsPaths(self):
+        return sorted(QFileSystemModel.filePath(self.fileSysModels, index) for index in self.modelsListView.selectionModel().selectedIndexes())
+
+    def onCompareModelsToggled(self, checked):
+        if checked:
+            self.modelsListView.setSelectionMode(QListView.SelectionMode.MultiSelection)
+        else:
+            self.modelsListView.setSelectionMode(QListView.SelectionMode.SingleSelection)
+            self.modelsListView.selectionModel().select(self.modelsListView.currentIndex(), QItemSelectionModel.SelectionFlag.ClearAndSelect)
+
+    def onRunOnFolder(self):
+        if self.folderInference.pipeline != None and self.runOnFolderBtn.text() == "Stop":
+            self.folderInference.stop()
+            return
+
+        self.startFolderInference()
+
+    def onExportDetections(self):
+        if self.runOnFolderBtn.text() == "Stop":
+            QMessageBox.information(self, "Processing error", "A folder inference is already running.")
+            return
+
+        exportDir = QFileDialog.getExistingDirectory(self, "Export detections to", self.imagesList.rootPath)
+        if exportDir:
+            self.startFolderInference(exportDir)
+
+    def startFolderInference(self, pExportDir=None):
+        selectedElemIndex = self.modelsListView.currentIndex()
+        modelFilePath = QFileSystemModel.filePath(self.fileSysModels, selectedElemIndex)
 
+        if modelFilePath == '':
+            QMessageBox.information(self, "Processing error", "Please, select a model before infer images.")
+            return
+
+        # Images of the same size are made adjacent so that the pipeline can batch them, the dimensions being indexed in advance
+        imagesPaths = sorted(self.imagesList.paths, key=lambda imagePath: self.imagesList.imageSize(imagePath) or (0, 0))
+
+        options = {"pTileSize": self.inferenceTileSize(), "pTileOverlap": self.tileOverlap, "pPadMultiple": self.batchPadMultiple, "pBackend": self.inferenceBackend}
+        if pExportDir != None:
+            # Already cached results are exported too, thresholded with the displayed threshold
+            options.update({"exportDir": pExportDir, "exportFormats": self.exportFormats, "exportThreshold": self.scoreThreshold})
+        if self.groundTruth != None:
+            options["groundTruth"] = self.groundTruth
+
+        self.runOnFolderBtn.setText("Stop")
+        self.folderInferenceRequested.emit(imagesPaths, modelFilePath, self.backbone, options)
+
+    def onBackendSelected(self, pBackend):
+        self.inferenceBackend = pBackend
+
+        # The selected model is converted (once) and loaded in background
+        self.onModelClicked()
+
+    def onOpenVideo(self):
+        videoPath, selectedFilter = QFileDialog.getOpenFileName(self, "Open video", self.imagesList.rootPath,
+                                                                "Videos ({});;All files (*)".format(" ".join("*" + extension for extension in VIDEO_EXTENSIONS)))
+        if videoPath:
+            self.startVideo(videoPath)
+
+    def onOpenFramesSequence(self):
+        framesDir = QFileDialog.getExistingDirectory(self, "Open frames sequence", self.imagesList.rootPath)
+        if framesDir:
+            self.startVideo(framesDir)
+
+    def startVideo(self, pPath):
+        selectedElemIndex = self.modelsListView.currentIndex()
+        modelFilePath = QFileSystemModel.filePath(self.fileSysModels, selectedElemIndex)
+
+        if modelFilePath == '':
+            QMessageBox.information(self, "Processing error", "Please, select a model before infer a video.")
+            return
+
+        if self.videoRunning:
+            QMessageBox.information(self, "Processing error", "A video is already playing.")
+            return
+
+        options = {"pBackend": self.inferenceBackend, "pReuseThreshold": self.videoReuseThreshold if self.reuseFramesAct.isChecked() else None}
+
+        self.videoRunning = True
+        self.videoDisplayed = True
+        self.stopVideoAct.setEnabled(True)
+        self.statusBar().showMessage("Opening {}...".format(os.path.basename(pPath)))
+        self.videoRequested.emit(pPath, modelFilePath, self.backbone, options)
+
+    def stopVideo(self):
+        self.videoDisplayed = False
+        self.videoInference.stop()
+
+    def onVideoFrame(self, index, frame, detections, statistics):
+        if not self.videoDisplayed:
+            self.videoInference.frameDisplayed()
+            return
+
+        height, width = frame.shape[:2]
+        rgbFrame = np.ascontiguousarray(frame[..., ::-1])
+        pixmap = QPixmap.fromImage(QImage(rgbFrame.data, width, height, 3 * width, QImage.Format.Format_RGB888))
+
+        # The frames replace the tiled image item, the overlays are drawn over them as over the images
+        if not isinstance(self.imageItem, QGraphicsPixmapItem):
+            if self.imageItem != None:
+                self.imageScene.removeItem(self.imageItem)
+
+            self.imageItem = QGraphicsPixmapItem()
+            self.imageScene.addItem(self.imageItem)
+            self.fitToWindowAct.setEnabled(True)
+            self.enableVisualisationStyles()
+
+        self.imageItem.setPixmap(pixmap)
+        self.imageScene.setSceneRect(self.imageItem.boundingRect())
+
+        self.currentImagePath = detections.imgPath
+        self.openedImagesInferences = detections
+        self.clearOverlays()
+        self.drawInferences()
+
+        frameCount = "/ {}".format(statistics["frameCount"]) if statistics["frameCount"] > 0 else ""
+        self.statusBar().showMessage("Video : frame {} {} | {:.1f} fps (source {:.0f}) | {} skipped, {} dropped, {} reused".format(
+            index + 1, frameCount, statistics["fps"], statistics["sourceFps"], statistics["skipped"], statistics["dropped"], statistics["reused"]))
+
+        # The worker emits the next frame once this one is displayed
+        self.videoInference.frameDisplayed()
+
+    def onVideoFinished(self, report):
+        self.videoRunning = False
+        self.stopVideoAct.setEnabled(False)
+
+        if "error" in report:
+            self.statusBar().showMessage("Video inference failed : {}".format(report["error"]))
+            return
+
+        self.statusBar().showMessage("Video : {} frames inferred, {} reused, {} skipped, {} dropped in {:.1f} s ({:.1f} fps)".format(
+            report["inferred"], report["reused"], report["skipped"], report["dropped"], report["wallTime"], report["fps"] or 0))
+
+    def inferenceTileSize(self):
+        return self.tileSize if self.tiledInferenceAct.isChecked() else None
+
+    def onFolderInferenceProgress(self, nbDone, nbTotal):
+        self.statusBar().showMessage("Folder inference : {} / {}".format(nbDone, nbTotal))
+
+    def onFolderEvaluated(self, results):
+        if results["mAP"] == None:
+            return
+
+        self.folderEvaluationText = "Folder : mAP {:.3f}, best F1 {:.3f} at {:.2f} ({} images)".format(results["mAP"], results["bestF1"], results["bestThreshold"], results["images"])
+        self.updateEvaluationLabel()
+
+    def onFolderInferenceFinished(self, report):
+        self.runOnFolderBtn.setText("Run on folder")
+
+        if "error" in report:
+            self.statusBar().showMessage("Folder inference failed : {}".format(report["error"]))
+            return
+
+        stagesSummary = ", ".join("{} {:.1f} img/s".format(stage, values["throughput"]) for stage, values in report["stages"].items() if values["throughput"] != None and stage not in ("wait", "load"))
+        self.statusBar().showMessage("Folder inference : {} images in {:.1f} s ({:.1f} img/s) | {}".format(report["done"], report["wallTime"], report["throughput"], stagesSummary))
+
+    def onInferenceFinished(self, jobId, inference):
+        # Results of stale jobs are still cached on disk, they are not displayed
+        if jobId != self.visibleJobId:
+            return
+
+        self.visibleJobId = None
+        self.openedImagesInferences = inference
+        self.statusBar().clearMessage()
+        self.updateModelsLegend()
+        self.enableVisualisationStyles()
+
+        self.clearOverlays()
+        self.drawInferences()
+
+    def enableVisualisationStyles(self):
         self.radioVisuBbox.setEnabled(True)
         self.radioVisuCircle.setEnabled(True)
         self.radioVisuCross.setEnabled(True)
         self.radioVisuNone.setEnabled(True)
 
-        self.initInferencesPainter()
+    def onOpenDetections(self):
+        detectionsPath, selectedFilter = QFileDialog.getOpenFileName(self, "Open detections", self.imagesList.rootPath,
+                                                                     "Detections (*.jsonl *.json);;All files (*)")
+        if detectionsPath:
+            self.openDetections(detectionsPath)
+
+    def openDetections(self, pDetectionsPath):
+        # JSON files are converted to memory mapped columns on first opening only, keras is never imported
+        try:
+            self.savedDetections = CSavedDetections(pDetectionsPath)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.information(self, "Detections", "Cannot open {} : {}".format(pDetectionsPath, e))
+            return
+
+        self.datasetIndex = CDatasetDetectionsIndex(self.savedDetections.offsets, self.savedDetections.scores, self.savedDetections.labels)
+        self.addKnownLabels(self.datasetIndex.classes())
+        self.updateDatasetCount()
+
+        self.statusBar().showMessage("Detections of {} images opened from {}".format(len(self.savedDetections), pDetectionsPath))
+        self.enableVisualisationStyles()
+
+        self.clearOverlays()
         self.drawInferences()
+        self.updateModelsLegend()
+
+    def onOpenAnnotations(self):
+        annotationsPath, selectedFilter = QFileDialog.getOpenFileName(self, "Open annotations", self.imagesList.rootPath,
+                                                                      "Annotations (*.csv *.json);;All files (*)")
+        if annotationsPath:
+            self.openAnnotations(annotationsPath)
+
+    def openAnnotations(self, pAnnotationsPath):
+        # The classes of CSV annotations are read from the classes.csv beside them, as for keras_retinanet trainings
+        classesPath = os.path.join(os.path.dirname(pAnnotationsPath), "classes.csv")
+        if pAnnotationsPath.lower().endswith(".json") or not os.path.isfile(classesPath) or os.path.samefile(classesPath, pAnnotationsPath):
+            classesPath = None
+
+        try:
+            self.groundTruth = loadAnnotations(pAnnotationsPath, classesPath)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            QMessageBox.information(self, "Annotations", "Cannot open {} : {}".format(pAnnotationsPath, e))
+            return
 
-        self.imagesListView.setDisabled(False)
+        self.folderEvaluationText = ""
+        self.updateClassesMenu() # Named after the annotations classes
+        self.statusBar().showMessage("Annotations of {} images opened from {}".format(len(self.groundTruth), pAnnotationsPath))
+        self.updateEvaluationLabel()
 
-    def drawInferences(self):
-        self.myPainter.drawInferences(self.openedImagesInferences)
+    def updateEvaluationLabel(self):
+        texts = []
 
-        self.imageLabel.setPixmap(self.imageLabel.pixmap().copy())
-        self.imageLabel.repaint()
+        # F1 of the single inference displayed, at the displayed threshold
+        displayedInferences = self.displayedInferences() if self.groundTruth != None else []
+        if len(displayedInferences) == 1:
+            key, inference, color = displayedInferences[0]
+            f1 = imageF1(self.groundTruth, self.currentImagePath, inference._boxes, inference._scores, inference._labels, self.scoreThreshold)
+            if f1 != None:
+                texts.append("Image F1 {:.3f}".format(f1))
 
-    def initInferencesPainter(self):
-        self.imageLabel.setPixmap(self.originalImage)
+        if self.folderEvaluationText:
+            texts.append(self.folderEvaluationText)
 
+        self.evaluationLbl.setText(" | ".join(texts))
+
+    def onInferenceFailed(self, jobId, error):
+        if jobId == self.visibleJobId:
+            self.visibleJobId = None
+            self.statusBar().showMessage("Inference failed : {}".format(error))
+
+    def visualisationPainterClass(self):
         if self.radioVisuBbox.isChecked():
-            self.myPainter = CBboxPredictionsPainter(self.imageLabel.pixmap())
+            return CBboxPredictionsPainter
         elif self.radioVisuCircle.isChecked():
-            self.myPainter = CCirclePredictionsPainter(self.imageLabel.pixmap())
+            return CCirclePredictionsPainter
         elif self.radioVisuCross.isChecked():
-            self.myPainter = CCrossPredictionsPainter(self.imageLabel.pixmap())
+            return CCrossPredictionsPainter
         elif self.radioVisuNone.isChecked():
-            pass
+            return None
+
+    def displayedInferences(self):
+        """
+        @Brief : Inferences to display over the current image, as (overlay key, inference, colour) tuples.
+
+        The detections of compared models are displayed with one colour per model, else with one colour per label.
+        """
+        inference = self.openedImagesInferences
+        if inference == None or inference.imgPath != self.currentImagePath or not inference.hasResult():
+            # Computed detections take precedence over the opened detections files
+            savedInference = self.savedDetections.lookup(self.currentImagePath) if self.savedDetections != None and self.currentImagePath != None else None
+            return [("saved", savedInference, None)] if savedInference != None else []
+
+        if isinstance(inference, CComparisonInference):
+            return [(i, modelInference, labelColor(i)) for i, modelInference in enumerate(inference.inferences)]
+
+        return [(None, inference, None)]
+
+    def updateModelsLegend(self):
+        legend = []
+        for key, inference, color in self.displayedInferences():
+            if color is not None:
+                legend.append('<span style="color:{}">&#9632; {}</span>'.format(color.name(), os.path.basename(inference.modelPath)))
+
+        self.modelsLegendLbl.setText(" ".join(legend))
+
+    def drawInferences(self):
+        self.updateEvaluationLabel()
+
+        painterClass = self.visualisationPainterClass()
+
+        # Switching style only toggles the cached overlays
+        for (overlayPainterClass, key), overlay in self.overlays.items():
+            overlay.setVisible(overlayPainterClass == painterClass)
+
+        if painterClass == None:
+            return
+
+        for key, inference, color in self.displayedInferences():
+            if (painterClass, key) in self.overlays:
+                continue
+
+            overlay = CPredictionsOverlayItem(painterClass, inference, self.scoreThreshold, self.labelsFilter(), pColor=color)
+            self.addKnownLabels(overlay.detections.classes())
+            self.imageScene.addItem(overlay)
+            self.overlays[(painterClass, key)] = overlay
+
+    def clearOverlays(self):
+        for overlay in self.overlays.values():
+            self.imageScene.removeItem(overlay)
+
+        self.overlays = {}
 
     def onVisualisationStyleChanged(self):
-        self.initInferencesPainter()
-        
         self.drawInferences()
 
+    def onScoreThresholdChanged(self, value):
+        self.scoreThreshold = value
+
+        self.thresholdSlider.blockSignals(True)
+        self.thresholdSlider.setValue(round(value * 100))
+        self.thresholdSlider.blockSignals(False)
+
+        self.updateSelection()
+
+    def updateSelection(self):
+        # The overlays keep their sorted detections, only the selected prefix and the recorded cells change
+        labelsFilter = self.labelsFilter()
+        for overlay in self.overlays.values():
+            overlay.setSelection(self.scoreThreshold, labelsFilter)
+
+        self.updateEvaluationLabel()
+        self.updateDatasetCount()
+
+    def labelsFilter(self):
+        if len(self.hiddenLabels) == 0:
+            return None
+
+        return sorted(self.knownLabels - self.hiddenLabels)
+
+    def labelName(self, pLabel):
+        if self.groundTruth != None and pLabel in self.groundTruth.classesNames:
+            return self.groundTruth.classesNames[pLabel]
+
+        return str(pLabel)
+
+    def addKnownLabels(self, pLabels):
+        newLabels = set(pLabels) - self.knownLabels
+        if len(newLabels) == 0:
+            return
+
+        self.knownLabels |= newLabels
+        self.updateClassesMenu()
+
+    def updateClassesMenu(self):
+        menu = self.classesFilterBtn.menu()
+        menu.clear()
+
+        for label in sorted(self.knownLabels):
+            action = menu.addAction(self.labelName(label))
+            action.setCheckable(True)
+            action.setChecked(label not in self.hiddenLabels)
+            action.toggled.connect(lambda checked, label=label: self.onClassFilterToggled(label, checked))
+
+        self.classesFilterBtn.setEnabled(len(self.knownLabels) > 0)
+
+    def onClassFilterToggled(self, pLabel, pChecked):
+        if pChecked:
+            self.hiddenLabels.discard(pLabel)
+        else:
+            self.hiddenLabels.add(pLabel)
+
+        self.classesFilterBtn.setText("Classes ({} hidden)".format(len(self.hiddenLabels)) if self.hiddenLabels else "Classes")
+        self.updateSelection()
+
+    def updateDatasetCount(self):
+        if self.datasetIndex == None:
+            self.datasetCountLbl.setText("")
+            return
+
+        nbDetections, nbImages = self.datasetIndex.count(self.scoreThreshold, self.labelsFilter())
+        self.datasetCountLbl.setText("Dataset : {} detections in {} / {} images".format(nbDetections, nbImages, self.datasetIndex.nbImages))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+
+        if self.startupTimes["firstPaint"] == None:
+            # Queued after the pending paint events of the first show
+            QTimer.singleShot(0, self.onFirstPaint)
+
+    def onFirstPaint(self):
+        if self.startupTimes["firstPaint"] != None:
+            return
+
+        self.startupTimes["firstPaint"] = time.perf_counter() - startupClock
+        instrumentation.gauge("startup.importSeconds", round(self.startupTimes["import"], 3))
+        instrumentation.gauge("startup.firstPaintSeconds", round(self.startupTimes["firstPaint"], 3))
+
+        # Displaying opened detections files does not need the inference backend
+        if self.savedDetections == None:
+            self.warmBackendRequested.emit()
+        else:
+            self.startupMeasured.emit(dict(self.startupTimes))
+
+    def onBackendImported(self, importTime):
+        self.startupTimes["backendImport"] = importTime
+        instrumentation.gauge("startup.backendImportSeconds", round(importTime, 3))
+
+        self.startupMeasured.emit(dict(self.startupTimes))
+
+    def onBackendImportFailed(self, error):
+        self.statusBar().showMessage("Cannot import the inference backend : {}".format(error))
+
+        self.startupMeasured.emit(dict(self.startupTimes))
+
+    def closeEvent(self, event):
+        self.inferenceService.shutdown()
+        self.folderInference.stop()
+        self.videoInference.stop()
+        self.imagePrefetcher.cancel()
+        self.directoryIndexer.currentGeneration = -1 # Abandons the running indexing
+
+        for thread in (self.warmingThread, self.folderThread, self.indexingThread, self.videoThread):
+            thread.quit()
+            thread.wait()
+
+        super().closeEvent(event)
+
     def zoomIn(self):
         self.scaleImage(1.25)
 
@@ -500,16 +879,23 @@ class QImageViewer(QMainWindow):
     def normalSize(self):
         self.scaleFactor = 1.0
         self.updateActions()
-        self.imageLabel.adjustSize()
+        self.imageView.resetTransform()
 
     def fitToWindow(self):
         fitToWindow = self.fitToWindowAct.isChecked()
-        self.scrollArea.setWidgetResizable(fitToWindow)
-        if not fitToWindow:
+        if fitToWindow:
+            self.imageView.fitInView(self.imageScene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        else:
             self.normalSize()
 
         self.updateActions()
 
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+
+        if self.fitToWindowAct.isChecked():
+            self.imageView.fitInView(self.imageScene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
     def about(self):
         QMessageBox.about(self, "About Image Viewer",
                           "<p>The <b>Image Viewer</b> example shows how to combine "
@@ -527,7 +913,13 @@ class QImageViewer(QMainWindow):
                           "print an image.</p>")
 
     def createActions(self):
-        self.openAct = QAction("&Open...", self, shortcut="Ctrl+O", triggered=self.openImagesDirectory)
+        self.openVideoAct = QAction("Open &video...", self, triggered=self.onOpenVideo)
+        self.openFramesSequenceAct = QAction("Open frames se&quence...", self, triggered=self.onOpenFramesSequence)
+        self.stopVideoAct = QAction("S&top video", self, enabled=False, triggered=self.stopVideo)
+        self.reuseFramesAct = QAction("&Reuse detections of still video frames", self, checkable=True)
+        self.openDetectionsAct = QAction("Open &detections...", self, shortcut="Ctrl+D", triggered=self.onOpenDetections)
+        self.openAct = QAction("&Open...", self, shortcut="Ctrl+O", triggered=self.openImagesFiles)
+        self.recursiveImagesAct = QAction("Include &subfolders", self, checkable=True, toggled=self.onRecursiveImagesToggled)
         self.exitAct = QAction("E&xit", self, shortcut="Ctrl+Q", triggered=self.close)
         self.zoomInAct = QAction("Zoom &In (25%)", self, shortcut="Ctrl++", enabled=False, triggered=self.zoomIn)
         self.zoomOutAct = QAction("Zoom &Out (25%)", self, shortcut="Ctrl+-", enabled=False, triggered=self.zoomOut)
@@ -536,13 +928,27 @@ class QImageViewer(QMainWindow):
                                       triggered=self.fitToWindow)
         self.aboutAct = QAction("&About", self, triggered=self.about)
         self.aboutQtAct = QAction("About &Qt", self, triggered=qApp.aboutQt)
-
-        # TODO : 
-        self.openAct.setDisabled(True)
+        self.exportDetectionsAct = QAction("&Export folder detections...", self, triggered=self.onExportDetections)
+        self.openAnnotationsAct = QAction("Open &annotations...", self, triggered=self.onOpenAnnotations)
+        self.tiledInferenceAct = QAction("&Tiled inference ({} px tiles)".format(self.tileSize), self, checkable=True)
+
+        self.backendActGroup = QActionGroup(self)
+        self.backendActs = []
+        for backend in BACKENDS:
+            backendAct = QAction(backend, self, checkable=True, checked=backend == self.inferenceBackend,
+                                 triggered=lambda checked, backend=backend: self.onBackendSelected(backend))
+            self.backendActGroup.addAction(backendAct)
+            self.backendActs.append(backendAct)
 
     def createMenus(self):
         self.fileMenu = QMenu("&File", self)
         self.fileMenu.addAction(self.openAct)
+        self.fileMenu.addAction(self.recursiveImagesAct)
+        self.fileMenu.addAction(self.openDetectionsAct)
+        self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.openVideoAct)
+        self.fileMenu.addAction(self.openFramesSequenceAct)
+        self.fileMenu.addAction(self.stopVideoAct)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.exitAct)
 
@@ -552,6 +958,18 @@ class QImageViewer(QMainWindow):
         self.viewMenu.addAction(self.normalSizeAct)
         self.viewMenu.addSeparator()
         self.viewMenu.addAction(self.fitToWindowAct)
+        self.viewMenu.addSeparator()
+        self.viewMenu.addAction(self.performancePanel.toggleViewAction())
+
+        self.inferenceMenu = QMenu("&Inference", self)
+        self.inferenceMenu.addAction(self.tiledInferenceAct)
+        self.backendMenu = self.inferenceMenu.addMenu("&Backend")
+        self.backendMenu.addActions(self.backendActs)
+        self.inferenceMenu.addSeparator()
+        self.inferenceMenu.addAction(self.exportDetectionsAct)
+        self.inferenceMenu.addAction(self.openAnnotationsAct)
+        self.inferenceMenu.addSeparator()
+        self.inferenceMenu.addAction(self.reuseFramesAct)
 
         self.helpMenu = QMenu("&Help", self)
         self.helpMenu.addAction(self.aboutAct)
@@ -559,6 +977,7 @@ class QImageViewer(QMainWindow):
 
         self.menuBar().addMenu(self.fileMenu)
         self.menuBar().addMenu(self.viewMenu)
+        self.menuBar().addMenu(self.inferenceMenu)
         self.menuBar().addMenu(self.helpMenu)
 
     def updateActions(self):
@@ -568,24 +987,31 @@ class QImageViewer(QMainWindow):
 
     def scaleImage(self, factor):
         self.scaleFactor *= factor
-        self.imageLabel.resize(self.scaleFactor * self.imageLabel.pixmap().size())
-
-        self.adjustScrollBar(self.scrollArea.horizontalScrollBar(), factor)
-        self.adjustScrollBar(self.scrollArea.verticalScrollBar(), factor)
+        self.imageView.scale(factor, factor) # The view keeps its center (AnchorViewCenter)
 
         self.zoomInAct.setEnabled(self.scaleFactor < 3.0)
         self.zoomOutAct.setEnabled(self.scaleFactor > 0.333)
 
-    def adjustScrollBar(self, scrollBar, factor):
-        scrollBar.setValue(int(factor * scrollBar.value()
-                               + ((factor - 1) * scrollBar.pageStep() / 2)))
-
 if __name__ == '__main__':
     import sys
     from PyQt5.QtWidgets import QApplication
 
     app = QApplication(sys.argv)
     imageViewer = QImageViewer()
+
+    # Detections saved elsewhere (export directory, JSON-lines or COCO file) : --detections <path>
+    if "--detections" in sys.argv[:-1]:
+        imageViewer.openDetections(sys.argv[sys.argv.index("--detections") + 1])
+
+    # Ground truth the displayed and folder inferences are evaluated against : --annotations <csv or COCO json>
+    if "--annotations" in sys.argv[:-1]:
+        imageViewer.openAnnotations(sys.argv[sys.argv.index("--annotations") + 1])
+
+    # Prints the startup measurements as JSON and exits, to track startup regressions
+    if "--startup-benchmark" in sys.argv:
+        import json
+        imageViewer.startupMeasured.connect(lambda times: (print(json.dumps(times)), imageViewer.close()))
+
     imageViewer.show()
     sys.exit(app.exec_())
     # TODO QScrollArea support mouse
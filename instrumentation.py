@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+def peakRss():
+    if resource == None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == "darwin" else maxRss * 1024
+
+def currentRss():
+    # Resident memory of the process in bytes, the peak one when the current one is not available
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peakRss()
+
+class CInstrumentation:
+    """
+    @Brief : Thread-safe recorder of timing spans, counters and gauges, optionally exported to a JSON-lines log.
+
+    Spans are named after the inference stages (load, decode, preprocess, predict, postprocess, paint). The last
+    spans of each stage are kept in memory for the performance panel, the log receives every span.
+    """
+    def __init__(self, pHistorySize=256, pLogPath=None):
+        self.historySize = pHistorySize
+
+        self._lock = threading.Lock()
+        self._stages = {}   # name -> deque of (end time, seconds, count)
+        self._totals = {}   # name -> (count, seconds)
+        self._counters = {}
+        self._gauges = {}
+        self._logFile = None
+
+        self.setLogPath(pLogPath)
+
+    def setLogPath(self, pLogPath):
+        with self._lock:
+            if self._logFile != None:
+                self._logFile.close()
+                self._logFile = None
+
+            self.logPath = pLogPath
+            if pLogPath != None:
+                self._logFile = open(pLogPath, "a", buffering=1) # Line buffered : the log can be tailed
+
+    def log(self, pEvent):
+        # Must be called with self._lock held
+        if self._logFile != None:
+            self._logFile.write(json.dumps(pEvent) + "\n")
+
+    def add(self, pName, pSeconds, pCount=1, **pAttributes):
+        """
+        @Brief : Enregistre une durée mesurée par l'appelant (même interface que CStagesStatistics.add).
+        """
+        end = time.perf_counter()
+
+        with self._lock:
+            history = self._stages.get(pName)
+            if history == None:
+                history = self._stages[pName] = deque(maxlen=self.historySize)
+            history.append((end, pSeconds, pCount))
+
+            count, seconds = self._totals.get(pName, (0, 0.0))
+            self._totals[pName] = (count + pCount, seconds + pSeconds)
+
+            if self._logFile != None:
+                event = {"type": "span", "name": pName, "time": time.time(), "seconds": pSeconds, "count": pCount, "thread": threading.current_thread().name}
+                event.update(pAttributes)
+                self.log(event)
+
+    @contextmanager
+    def span(self, pName, pCount=1, **pAttributes):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(pName, time.perf_counter() - start, pCount, **pAttributes)
+
+    def count(self, pName, pIncrement=1):
+        with self._lock:
+            self._counters[pName] = self._counters.get(pName, 0) + pIncrement
+
+    def gauge(self, pName, pValue):
+        with self._lock:
+            self._gauges[pName] = pValue
+
+    def sampleMemory(self):
+        rss = currentRss()
+        if rss != None:
+            self.gauge("process.rssBytes", rss)
+
+        with self._lock:
+            self.log({"type": "gauges", "time": time.time(), "gauges": dict(self._gauges), "counters": dict(self._counters)})
+
+    def summary(self, pWindow=10.0):
+        """
+        @Brief : Statistiques des spans récents.
+
+        @Retour :
+            - summary(dict) : par étage, le nombre total, la dernière durée et les p50/p95 (ms) des derniers spans,
+                              et le débit glissant (items/s) sur les pWindow dernières secondes ; les compteurs et jauges
+        """
+        now = time.perf_counter()
+
+        with self._lock:
+            stages = {name: list(history) for name, history in self._stages.items()}
+            totals = dict(self._totals)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        summary = {"stages": {}, "counters": counters, "gauges": gauges}
+        for name, history in stages.items():
+            durations = np.array([seconds for end, seconds, count in history]) * 1000
+
+            summary["stages"][name] = {
+                "count": totals[name][0],
+                "lastMs": float(durations[-1]),
+                "p50Ms": float(np.percentile(durations, 50)),
+                "p95Ms": float(np.percentile(durations, 95)),
+                "throughput": sum(count for end, seconds, count in history if now - end <= pWindow) / pWindow,
+            }
+
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._totals.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+# ODVIEWER_TRACE=<file> logs every span of the process
+instrumentation = CInstrumentation(pLogPath=os.environ.get("ODVIEWER_TRACE"))
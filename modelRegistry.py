@@ -0,0 +1,179 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from instrumentation import instrumentation
+
+# keras and keras_retinanet take seconds to import : they are only imported on first use (see importBackend)
+backendImportTime = None
+_backendLock = threading.Lock()
+
+def importBackend():
+    """
+    @Brief : Importe keras et keras_retinanet si ce n'est pas déjà fait.
+
+    @Retour :
+        - backendImportTime : le temps d'import en secondes
+    """
+    global backendImportTime
+
+    with _backendLock:
+        if backendImportTime == None:
+            start = time.perf_counter()
+
+            import keras
+            from keras_retinanet import models
+            from keras_retinanet.utils import image, gpu
+
+            backendImportTime = time.perf_counter() - start
+
+    return backendImportTime
+
+def isBackendImported():
+    return backendImportTime != None
+
+class CModelRegistry:
+    """
+    @Brief : Process-wide cache of loaded Retinanet models.
+
+    Models are keyed by (absolute path, mtime, size, backbone, backend) so that a checkpoint rewritten on disk is
+    reloaded, and the least recently used models are evicted once the capacity is reached. Backends other than keras
+    are conversions of the keras model (see inferenceBackends), made once and cached next to the checkpoint.
+    """
+    def __init__(self, pCapacity=None, pGpu=None):
+        if pCapacity != None:
+            assert pCapacity >= 1
+            self.capacity = pCapacity
+        else:
+            self.capacity = 2
+
+        # GPU given to setup_gpu : "cpu" hides the GPUs, "none" skips setup_gpu (nodes without GPU)
+        self.gpu = pGpu if pGpu != None else os.environ.get("ODVIEWER_GPU", "0")
+
+        # TensorFlow threads pools, its defaults if None
+        self.intraOpThreads = None
+        self.interOpThreads = None
+
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._loadingLocks = {}
+        self._hardwareLock = threading.Lock() # The setup takes seconds : cache hits do not wait for it
+        self._hardwareReady = False
+
+    @staticmethod
+    def modelKey(pModelPath, pBackbone, pBackend="keras"):
+        modelPath = os.path.abspath(pModelPath)
+        stat = os.stat(modelPath)
+
+        return (modelPath, stat.st_mtime_ns, stat.st_size, pBackbone, pBackend)
+
+    def configure(self, pGpu=None, pIntraOpThreads=None, pInterOpThreads=None):
+        """
+        @Brief : Choisit le GPU et les nombres de threads de TensorFlow, avant le chargement du premier modèle.
+        """
+        assert not self._hardwareReady, "The hardware is configured when the first model is loaded"
+
+        if pGpu != None:
+            self.gpu = pGpu
+        self.intraOpThreads = pIntraOpThreads
+        self.interOpThreads = pInterOpThreads
+
+    def setupHardware(self):
+        # setup_gpu and the threads pools only need to be configured once per process
+        with self._hardwareLock:
+            if self._hardwareReady:
+                return
+
+            importBackend()
+
+            if self.intraOpThreads != None or self.interOpThreads != None:
+                import tensorflow as tf
+
+                if self.intraOpThreads != None:
+                    tf.config.threading.set_intra_op_parallelism_threads(self.intraOpThreads)
+                if self.interOpThreads != None:
+                    tf.config.threading.set_inter_op_parallelism_threads(self.interOpThreads)
+
+            if self.gpu not in ("", "none"):
+                from keras_retinanet.utils.gpu import setup_gpu
+
+                setup_gpu(self.gpu)
+
+            self._hardwareReady = True
+
+    def getModel(self, pModelPath, pBackbone='resnet50', pBackend="keras"):
+        key = self.modelKey(pModelPath, pBackbone, pBackend)
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                instrumentation.count("modelRegistry.hit")
+                return self._models[key]
+
+            # Concurrent requests for the same model wait for a single load
+            keyLock = self._loadingLocks.setdefault(key, threading.Lock())
+
+        with keyLock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+
+            try:
+                self.setupHardware()
+
+                instrumentation.count("modelRegistry.miss")
+
+                if pBackend == "keras":
+                    from keras_retinanet import models
+
+                    with instrumentation.span("load", model=os.path.basename(key[0])):
+                        model = models.load_model(key[0], backbone_name=pBackbone) # Chargement du model Retinanet
+                else:
+                    from inferenceBackends import loadBackendModel
+
+                    # The keras model is only loaded if the checkpoint has not been converted yet
+                    model = loadBackendModel(key[0], pBackbone, pBackend, lambda: self.getModel(key[0], pBackbone), self.intraOpThreads)
+
+                with self._lock:
+                    # Drop previous versions of a checkpoint that changed on disk
+                    for staleKey in [k for k in self._models if k[0] == key[0] and k[3:] == key[3:]]:
+                        del self._models[staleKey]
+
+                    self._models[key] = model
+                    self.evict()
+            finally:
+                # Also after a failed load, the next request tries again
+                with self._lock:
+                    self._loadingLocks.pop(key, None)
+
+        return model
+
+    def warmModel(self, pModelPath, pBackbone='resnet50', pBackend="keras"):
+        self.getModel(pModelPath, pBackbone, pBackend)
+
+    def isLoaded(self, pModelPath, pBackbone='resnet50', pBackend="keras"):
+        try:
+            key = self.modelKey(pModelPath, pBackbone, pBackend)
+        except OSError:
+            return False
+
+        with self._lock:
+            return key in self._models
+
+    def reserve(self, pNbModels):
+        # The capacity is raised so that pNbModels models used together are not evicted by one another
+        with self._lock:
+            self.capacity = max(self.capacity, pNbModels)
+
+    def evict(self):
+        # Must be called with self._lock held
+        while len(self._models) > self.capacity:
+            self._models.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+modelRegistry = CModelRegistry()
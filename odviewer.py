@@ -0,0 +1,306 @@
+"""
+Headless entry point of ODViewer.
+
+Usage :
+    python -m odviewer infer --model X.h5 --images DIR --out results/ [--format jsonl coco columnar] [--render] [--annotations A.csv]
+    python -m odviewer stream --model X.h5 --video V.mp4 --out results/ [--realtime] [--reuse-threshold 0.01]
+    python -m odviewer convert --model X.h5 --backend tflite-int8 --calibration DIR [--out conversion.json]
+    python -m odviewer evaluate --detections results/ --annotations A.csv [--classes classes.csv] [--out evaluation.json]
+    python -m odviewer bench [--resolutions 640x480 1920x1080] [--batch-sizes 1 4] [--out bench.json]
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+from detectionsExport import EXPORT_FORMATS, CDetectionsExporter
+from inferenceBackends import BACKENDS
+
+IMAGES_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def listImages(pImagesPath):
+    if os.path.isfile(pImagesPath):
+        return [os.path.abspath(pImagesPath)]
+
+    return sorted(os.path.join(os.path.abspath(pImagesPath), f) for f in os.listdir(pImagesPath) if f.lower().endswith(IMAGES_EXTENSIONS))
+
+def configureHardware(pArgs):
+    from modelRegistry import modelRegistry
+    modelRegistry.configure(pArgs.gpu, pArgs.intra_op_threads, pArgs.inter_op_threads)
+
+def infer(pArgs):
+    from inferencePipeline import CInferencePipeline
+
+    if not 0 <= pArgs.threshold <= 1:
+        print("The threshold must be in [0, 1]", file=sys.stderr)
+        return 1
+
+    if pArgs.tile_size != None and not 0 <= pArgs.tile_overlap < pArgs.tile_size:
+        print("The tiles overlap must be in [0, tile size[", file=sys.stderr)
+        return 1
+
+    if pArgs.trace != None:
+        from instrumentation import instrumentation
+        instrumentation.setLogPath(pArgs.trace)
+
+    imagesPaths = listImages(pArgs.images)
+    if len(imagesPaths) == 0:
+        print("No image found in {}".format(pArgs.images), file=sys.stderr)
+        return 1
+
+    configureHardware(pArgs)
+
+    formats = list(pArgs.format)
+    if pArgs.render and "overlays" not in formats:
+        formats.append("overlays")
+
+    evaluator = None
+    if pArgs.annotations != None:
+        from evaluation import CEvaluator, loadAnnotations
+        evaluator = CEvaluator(loadAnnotations(pArgs.annotations, pArgs.classes), pIouThreshold=pArgs.iou_threshold)
+
+    # The detections are written as the batches finish, nothing is accumulated
+    exporter = CDetectionsExporter.create(pArgs.out, formats, pArgs.threshold)
+
+    def onResult(imgPath, boxes, scores, labels):
+        # The evaluation sees all the detections, whatever the threshold of the written ones
+        exporter.write(imgPath, boxes, scores, labels)
+        if evaluator != None:
+            evaluator.add(imgPath, boxes, scores, labels)
+
+    def onProgress(nbDone, nbTotal):
+        if not pArgs.quiet:
+            print("\r{} / {}".format(nbDone, nbTotal), end="", file=sys.stderr)
+
+    pipeline = CInferencePipeline(pArgs.model, pArgs.backbone, pBatchSize=pArgs.batch_size, pWorkers=pArgs.workers, pUseCache=not pArgs.no_cache, pTileSize=pArgs.tile_size, pTileOverlap=pArgs.tile_overlap,
+                                  pPadMultiple=pArgs.pad_multiple, pMaxDelay=pArgs.max_delay, pInputDtype=pArgs.input_dtype, pBackend=pArgs.backend)
+
+    try:
+        report = pipeline.run(imagesPaths, pOnResult=onResult, pOnProgress=onProgress)
+    finally:
+        exporter.close()
+
+    report["errorsDetails"] = pipeline.errors
+
+    with open(os.path.join(pArgs.out, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    if evaluator != None:
+        writeEvaluation(evaluator.results(), os.path.join(pArgs.out, "evaluation.json"), pArgs.quiet)
+
+    if not pArgs.quiet:
+        print("\n{} images in {:.1f} s ({:.2f} img/s), {} errors".format(report["done"], report["wallTime"], report["throughput"], report["errors"]), file=sys.stderr)
+
+    return 0 if report["errors"] == 0 else 2
+
+def writeEvaluation(pResults, pPath, pQuiet=False):
+    with open(pPath, "w") as f:
+        json.dump(pResults, f, indent=2)
+
+    if pQuiet:
+        return
+
+    for label, classResults in pResults["classes"].items():
+        ap = "{:.4f}".format(classResults["AP"]) if classResults["AP"] != None else "-"
+        print("{} ({}) : AP {}, {} annotations, {} detections".format(classResults["name"], label, ap, classResults["annotations"], classResults["detections"]), file=sys.stderr)
+
+    if pResults["mAP"] != None:
+        print("mAP {:.4f} on {} images, best F1 {:.4f} at score {:.2f}".format(pResults["mAP"], pResults["images"], pResults["bestF1"], pResults["bestThreshold"]), file=sys.stderr)
+
+def stream(pArgs):
+    from videoInference import CVideoPipeline
+
+    configureHardware(pArgs)
+
+    # Frames are keyed "<video>#<index>" in the detections files
+    exporter = CDetectionsExporter.create(pArgs.out, pArgs.format, pArgs.threshold)
+
+    def onFrame(index, frame, boxes, scores, labels, statistics):
+        exporter.write("{}#{}".format(os.path.abspath(pArgs.video), index), boxes, scores, labels)
+
+        if not pArgs.quiet:
+            print("\rframe {} : {:.1f} fps, {} skipped, {} dropped, {} reused".format(index + 1, statistics["fps"], statistics["skipped"], statistics["dropped"], statistics["reused"]),
+                  end="", file=sys.stderr)
+
+    pipeline = CVideoPipeline(pArgs.model, pArgs.backbone, pBackend=pArgs.backend, pRealTime=pArgs.realtime, pReuseThreshold=pArgs.reuse_threshold, pFps=pArgs.fps)
+
+    try:
+        report = pipeline.run(pArgs.video, pOnFrame=onFrame)
+    finally:
+        exporter.close()
+
+    with open(os.path.join(pArgs.out, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    if not pArgs.quiet:
+        print("\n{} frames inferred, {} reused, {} skipped, {} dropped ({:.1f} fps)".format(report["inferred"], report["reused"], report["skipped"], report["dropped"], report["fps"] or 0), file=sys.stderr)
+
+    return 0
+
+def convert(pArgs):
+    from modelRegistry import modelRegistry
+    from inferenceBackends import loadBackendModel, compareBackends
+
+    if pArgs.backend == "keras":
+        print("The keras backend is the reference, there is nothing to convert", file=sys.stderr)
+        return 1
+
+    calibrationPaths = listImages(pArgs.calibration)[:pArgs.calibration_size] if pArgs.calibration != None else []
+
+    configureHardware(pArgs)
+    referenceModel = modelRegistry.getModel(pArgs.model, pArgs.backbone)
+
+    # Converted again, the calibration images may differ from the cached conversion ones
+    model = loadBackendModel(pArgs.model, pArgs.backbone, pArgs.backend, lambda: referenceModel, pArgs.intra_op_threads, calibrationPaths, pForceConversion=True)
+
+    report = {"model": os.path.abspath(pArgs.model), "backend": pArgs.backend, "converted": model.path}
+    if len(calibrationPaths) > 0:
+        report["accuracy"] = compareBackends(referenceModel, model, calibrationPaths, pArgs.threshold)
+
+    with open(pArgs.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if "accuracy" in report:
+        accuracy = report["accuracy"]
+        print("{} : F1 {:.4f} against keras at {:.2f}, {:.1f} ms instead of {:.1f} ms".format(pArgs.backend, accuracy["f1VersusReference"], pArgs.threshold,
+                                                                                        accuracy["backendMs"], accuracy["referenceMs"]), file=sys.stderr)
+
+    return 0
+
+def addHardwareArguments(pParser):
+    pParser.add_argument("--gpu", default=None, help="GPU given to setup_gpu, \"cpu\" to hide the GPUs, \"none\" to skip the GPU setup (ODVIEWER_GPU, else 0).")
+    pParser.add_argument("--intra-op-threads", type=int, default=None, help="Threads of each TensorFlow operation (and of the TFLite interpreter).")
+    pParser.add_argument("--inter-op-threads", type=int, default=None, help="TensorFlow operations run in parallel.")
+
+def evaluate(pArgs):
+    from evaluation import CEvaluator, loadAnnotations
+    from savedDetections import CSavedDetections
+
+    groundTruth = loadAnnotations(pArgs.annotations, pArgs.classes)
+    savedDetections = CSavedDetections(pArgs.detections)
+    evaluator = CEvaluator(groundTruth, pIouThreshold=pArgs.iou_threshold)
+
+    # Annotated images without saved detections count as missed
+    empty = (np.zeros((1, 0, 4), dtype=np.float32), np.zeros((1, 0), dtype=np.float32), np.zeros((1, 0), dtype=np.int32))
+    for imagePath in groundTruth.imagesPaths:
+        savedInference = savedDetections.lookup(imagePath)
+        if savedInference != None:
+            evaluator.add(imagePath, savedInference._boxes, savedInference._scores, savedInference._labels)
+        else:
+            evaluator.add(imagePath, *empty)
+
+    writeEvaluation(evaluator.results(), pArgs.out)
+
+    return 0
+
+def bench(pArgs):
+    from benchmark import runBenchmarks, parseResolution
+
+    try:
+        resolutions = [parseResolution(r) for r in pArgs.resolutions]
+    except ValueError:
+        print("Resolutions must be given as WIDTHxHEIGHT", file=sys.stderr)
+        return 1
+
+    imagesPaths = listImages(pArgs.images) if pArgs.images != None else None
+
+    report = runBenchmarks(resolutions, pArgs.batch_sizes, pRepeats=pArgs.repeats, pWarmup=pArgs.warmup, pImagesPaths=imagesPaths,
+                           pModelPath=pArgs.model, pBackbone=pArgs.backbone, pNbDetections=pArgs.detections, pStages=pArgs.stages)
+
+    if pArgs.out != None:
+        with open(pArgs.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog="odviewer", description="Object Detection Viewer headless tools.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    inferParser = subparsers.add_parser("infer", help="Infer a folder (or a single image) and write the detections to disk.")
+    inferParser.add_argument("--model", required=True, help="Retinanet model (.h5).")
+    inferParser.add_argument("--images", required=True, help="Image file or images directory.")
+    inferParser.add_argument("--out", required=True, help="Output directory.")
+    inferParser.add_argument("--backbone", default="resnet50", choices=["resnet50", "resnet101"])
+    inferParser.add_argument("--backend", default="keras", choices=BACKENDS, help="Inference backend, the TensorFlow Lite conversions are cached next to the model.")
+    inferParser.add_argument("--threshold", type=float, default=0.5, help="Minimal score of the written detections.")
+    inferParser.add_argument("--batch-size", type=int, default=4)
+    inferParser.add_argument("--workers", type=int, default=2, help="Decoding and preprocessing threads.")
+    inferParser.add_argument("--pad-multiple", type=int, default=None, help="Zero pad the images to a multiple of this size so that close sizes are batched together.")
+    inferParser.add_argument("--input-dtype", default="uint8", choices=["uint8", "float16", "float32"],
+                             help="Type of the queued images : uint8 ones are normalised into the batch at the last moment, float16 halves the memory of the normalised ones.")
+    inferParser.add_argument("--max-delay", type=float, default=None, help="Maximal wait in seconds of an image for its batch to fill.")
+    inferParser.add_argument("--tile-size", type=int, default=None, help="Infer large images by sliding windows of this size, at their original resolution.")
+    inferParser.add_argument("--tile-overlap", type=int, default=128, help="Overlap of the sliding windows in pixels.")
+    inferParser.add_argument("--format", nargs="+", default=["jsonl"], choices=EXPORT_FORMATS,
+                             help="Detections files to write : detections.jsonl, detections_coco.json, detections/ (memory-mappable columns), overlays/.")
+    inferParser.add_argument("--render", action="store_true", help="Also write images with the detections painted (same as --format overlays).")
+    inferParser.add_argument("--no-cache", action="store_true", help="Do not read nor write the inference results cache.")
+    inferParser.add_argument("--trace", default=None, help="Append the timing spans of every stage to this JSON-lines file.")
+    inferParser.add_argument("--annotations", default=None, help="Ground truth (keras_retinanet CSV or COCO JSON) : the detections are evaluated as they come, in evaluation.json.")
+    inferParser.add_argument("--classes", default=None, help="Classes CSV (class_name,id) of CSV annotations, else the ids follow the names order.")
+    inferParser.add_argument("--iou-threshold", type=float, default=0.5)
+    inferParser.add_argument("--quiet", action="store_true")
+    addHardwareArguments(inferParser)
+    inferParser.set_defaults(func=infer)
+
+    streamParser = subparsers.add_parser("stream", help="Infer a video file or a numbered frames sequence frame by frame.")
+    streamParser.add_argument("--model", required=True, help="Retinanet model (.h5).")
+    streamParser.add_argument("--video", required=True, help="Video file, frames directory or frames pattern (img_%%05d.png).")
+    streamParser.add_argument("--out", required=True, help="Output directory.")
+    streamParser.add_argument("--backbone", default="resnet50", choices=["resnet50", "resnet101"])
+    streamParser.add_argument("--backend", default="keras", choices=BACKENDS)
+    streamParser.add_argument("--threshold", type=float, default=0.5, help="Minimal score of the written detections.")
+    streamParser.add_argument("--format", nargs="+", default=["jsonl"], choices=["jsonl", "columnar"])
+    streamParser.add_argument("--realtime", action="store_true", help="Follow the media clock, skipping and dropping the frames the model cannot keep up with.")
+    streamParser.add_argument("--reuse-threshold", type=float, default=None, help="Reuse the last detections for frames whose mean pixel difference is below (0.01 = 1%%).")
+    streamParser.add_argument("--fps", type=float, default=None, help="Frame rate of frames sequences (25 by default), overrides the one of videos.")
+    streamParser.add_argument("--quiet", action="store_true")
+    addHardwareArguments(streamParser)
+    streamParser.set_defaults(func=stream)
+
+    convertParser = subparsers.add_parser("convert", help="Convert a model to a TensorFlow Lite backend and measure its accuracy delta against keras.")
+    convertParser.add_argument("--model", required=True, help="Retinanet model (.h5).")
+    convertParser.add_argument("--backbone", default="resnet50", choices=["resnet50", "resnet101"])
+    convertParser.add_argument("--backend", default="tflite-int8", choices=BACKENDS)
+    convertParser.add_argument("--calibration", default=None, help="Calibration images (file or directory) : int8 activations ranges and accuracy delta.")
+    convertParser.add_argument("--calibration-size", type=int, default=100, help="Maximal number of calibration images.")
+    convertParser.add_argument("--threshold", type=float, default=0.5, help="Score threshold of the compared detections.")
+    convertParser.add_argument("--out", default="conversion.json")
+    addHardwareArguments(convertParser)
+    convertParser.set_defaults(func=convert)
+
+    evaluateParser = subparsers.add_parser("evaluate", help="Evaluate saved detections against ground truth annotations (AP, mAP, F1 per score threshold).")
+    evaluateParser.add_argument("--detections", required=True, help="Export directory, columnar directory, JSON-lines or COCO results file.")
+    evaluateParser.add_argument("--annotations", required=True, help="Ground truth, keras_retinanet CSV (path,x1,y1,x2,y2,class_name) or COCO JSON.")
+    evaluateParser.add_argument("--classes", default=None, help="Classes CSV (class_name,id) of CSV annotations, else the ids follow the names order.")
+    evaluateParser.add_argument("--iou-threshold", type=float, default=0.5)
+    evaluateParser.add_argument("--out", default="evaluation.json")
+    evaluateParser.set_defaults(func=evaluate)
+
+    benchParser = subparsers.add_parser("bench", help="Benchmark the inference stages and write the latencies as JSON.")
+    benchParser.add_argument("--resolutions", nargs="+", default=["640x480", "1920x1080", "4000x3000"], help="Synthetic images resolutions (WIDTHxHEIGHT).")
+    benchParser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4])
+    benchParser.add_argument("--repeats", type=int, default=10)
+    benchParser.add_argument("--warmup", type=int, default=2)
+    benchParser.add_argument("--stages", nargs="+", default=None, choices=["load", "decode", "preprocess", "resize", "prepare", "predict", "scale", "paint"])
+    benchParser.add_argument("--detections", type=int, default=100, help="Number of detections of the tiny model and of the painted overlays.")
+    benchParser.add_argument("--images", default=None, help="Benchmark these images instead of synthetic ones.")
+    benchParser.add_argument("--model", default=None, help="Benchmark this Retinanet model instead of a tiny locally built one.")
+    benchParser.add_argument("--backbone", default="resnet50", choices=["resnet50", "resnet101"])
+    benchParser.add_argument("--out", default=None, help="Output JSON file (stdout by default).")
+    benchParser.set_defaults(func=bench)
+
+    return parser
+
+def main(pArgv=None):
+    args = buildParser().parse_args(pArgv)
+
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtWidgets import QDockWidget, QFileDialog, QHBoxLayout, QHeaderView, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget
+
+from instrumentation import instrumentation
+
+class QPerformancePanel(QDockWidget):
+    """
+    @Brief : Dockable panel showing the recent stages timings, the rolling throughput, the caches counters and the memory gauges.
+
+    The panel polls the instrumentation while it is visible, nothing is computed when it is hidden.
+    """
+    columns = ["Stage", "Count", "Last (ms)", "p50 (ms)", "p95 (ms)", "Items/s"]
+
+    def __init__(self, pParent=None, pRefreshInterval=1000, pWindow=10.0):
+        super().__init__("Performance", pParent)
+
+        self.setObjectName("performancePanel")
+        self.throughputWindow = pWindow # Rolling throughput window in seconds
+
+        self.mainWidget = QWidget()
+        self.vlayMain = QVBoxLayout(self.mainWidget)
+
+        self.stagesTable = QTableWidget(0, len(self.columns))
+        self.stagesTable.setHorizontalHeaderLabels(self.columns)
+        self.stagesTable.verticalHeader().setVisible(False)
+        self.stagesTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.stagesTable.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+        self.countersLbl = QLabel()
+        self.countersLbl.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.countersLbl.setWordWrap(True)
+
+        self.hlayButtons = QHBoxLayout()
+
+        self.logBtn = QPushButton("Log to file...")
+        self.logBtn.clicked.connect(self.onLogClicked)
+
+        self.resetBtn = QPushButton("Reset")
+        self.resetBtn.clicked.connect(self.onResetClicked)
+
+        self.hlayButtons.addWidget(self.logBtn)
+        self.hlayButtons.addWidget(self.resetBtn)
+        self.hlayButtons.addStretch()
+
+        self.vlayMain.addWidget(self.stagesTable)
+        self.vlayMain.addWidget(self.countersLbl)
+        self.vlayMain.addLayout(self.hlayButtons)
+
+        self.setWidget(self.mainWidget)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(pRefreshInterval)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+        self.visibilityChanged.connect(self.onVisibilityChanged)
+        self.updateLogButton()
+
+    def onVisibilityChanged(self, visible):
+        if visible:
+            self.refresh()
+            self.refreshTimer.start()
+        else:
+            self.refreshTimer.stop()
+
+    def refresh(self):
+        instrumentation.sampleMemory()
+        summary = instrumentation.summary(self.throughputWindow)
+
+        stages = sorted(summary["stages"].items())
+        self.stagesTable.setRowCount(len(stages))
+
+        for row, (name, stats) in enumerate(stages):
+            values = [name, str(stats["count"]), "{:.1f}".format(stats["lastMs"]), "{:.1f}".format(stats["p50Ms"]),
+                      "{:.1f}".format(stats["p95Ms"]), "{:.2f}".format(stats["throughput"])]
+
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.stagesTable.setItem(row, column, item)
+
+        lines = []
+
+        # Hit ratio of each cache, from its .hit and .miss counters
+        counters = summary["counters"]
+        for name in sorted({counter.rsplit(".", 1)[0] for counter in counters}):
+            hits, misses = counters.get(name + ".hit", 0), counters.get(name + ".miss", 0)
+            if hits + misses > 0:
+                lines.append("{} : {} hits, {} misses ({:.0%})".format(name, hits, misses, hits / (hits + misses)))
+
+        for name, value in sorted(summary["gauges"].items()):
+            if name.endswith("Bytes") or name.endswith(".bytes"):
+                lines.append("{} : {:.1f} MB".format(name, value / (1024 * 1024)))
+            else:
+                lines.append("{} : {}".format(name, value))
+
+        self.countersLbl.setText("\n".join(lines))
+
+    def onLogClicked(self):
+        if instrumentation.logPath != None:
+            instrumentation.setLogPath(None)
+        else:
+            logPath, selectedFilter = QFileDialog.getSaveFileName(self, "Performance log", "odviewer-trace.jsonl", "JSON lines (*.jsonl)")
+            if logPath:
+                instrumentation.setLogPath(logPath)
+
+        self.updateLogButton()
+
+    def updateLogButton(self):
+        if instrumentation.logPath != None:
+            self.logBtn.setText("Stop logging")
+            self.logBtn.setToolTip(instrumentation.logPath)
+        else:
+            self.logBtn.setText("Log to file...")
+            self.logBtn.setToolTip("")
+
+    def onResetClicked(self):
+        instrumentation.reset()
+        self.refresh()
@@ -0,0 +1,187 @@
+from PyQt5.QtCore import QLine, QRect, QRectF, Qt
+from PyQt5.QtGui import QColor, QPen, QPainter, QPicture
+from PyQt5.QtWidgets import QGraphicsItem
+
+import numpy as np
+
+from instrumentation import instrumentation
+from detectionsIndex import CSortedDetections, selectDetections
+
+def labelColor(pLabel):
+    # colors.py only depends on the standard library, importing it does not load keras
+    try:
+        from keras_retinanet.utils.colors import label_color
+    except ImportError:
+        # Saved detections can be displayed on machines without keras_retinanet
+        return QColor.fromHsv((int(pLabel) * 47) % 360, 255, 255)
+
+    b, g, r = label_color(int(pLabel))
+    return QColor(r, g, b, 255)
+
+class CPredictionsPainter(QPainter):
+    def __init__(self, device, pThreshold=0.5, pLabelsFilter=None, pColor=None):
+        if type(self) == CPredictionsPainter:
+            raise Exception("CPredictionsPainter must be subclassed.")
+
+        super().__init__(device)
+
+        self.threshold = pThreshold
+        self.labelsFilter = pLabelsFilter
+        self.fixedColor = pColor # Colour of all the detections (e.g. one colour per compared model), per label if None
+
+        self.initPainterStyle()
+
+    def initPainterStyle(self):
+        self.color = QColor(0, 255, 0, 255)
+        self.pen = QPen(self.color)
+        self.pen.setWidth(3)
+        self.setPen(self.pen)
+
+    def drawInferences(self, inference):
+        boxes, scores, labels = selectDetections(inference._boxes[0], inference._scores[0], inference._labels[0], self.threshold, self.labelsFilter)
+
+        self.drawSelection(boxes.astype(int), labels)
+
+    def drawSelection(self, boxes, labels):
+        if self.fixedColor is not None:
+            self.pen.setColor(self.fixedColor)
+            self.setPen(self.pen)
+
+            self.drawDetections(boxes)
+            self.end()
+            return
+
+        # One bulk drawing call per label colour
+        order = np.argsort(labels, kind="stable")
+        groupsLabels, groupsStarts = np.unique(labels[order], return_index=True)
+
+        for label, groupBoxes in zip(groupsLabels, np.split(boxes[order], groupsStarts[1:])):
+            self.pen.setColor(labelColor(label))
+            self.setPen(self.pen)
+
+            self.drawDetections(groupBoxes)
+
+        self.end()
+
+    def drawDetections(self, boxes):
+        pass
+
+class CCirclePredictionsPainter(CPredictionsPainter):
+    def drawDetections(self, boxes):
+        rects = [QRectF(x, y, w, h) for x, y, w, h in np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2])).tolist()]
+
+        # QPainter has no drawEllipses : one call per box of the group, without building a path of all the ellipses
+        for rect in rects:
+            self.drawEllipse(rect)
+
+class CBboxPredictionsPainter(CPredictionsPainter):
+    def drawDetections(self, boxes):
+        rects = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2])).tolist()
+
+        self.drawRects([QRect(x, y, w, h) for x, y, w, h in rects])
+
+class CCrossPredictionsPainter(CPredictionsPainter):
+    lenLines = 5
+
+    def drawDetections(self, boxes):
+        centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+        cx, cy = centers[:, 0], centers[:, 1]
+
+        hLines = np.column_stack((cx - self.lenLines, cy, cx + self.lenLines, cy))
+        vLines = np.column_stack((cx, cy - self.lenLines, cx, cy + self.lenLines))
+
+        self.drawLines([QLine(*line) for line in np.concatenate((hLines, vLines)).tolist()])
+
+class CPredictionsOverlayItem(QGraphicsItem):
+    """
+    @Brief : Scene item displaying the detections of one visualisation style over the image item.
+
+    The detections are sorted once by score, then painted lazily per cell of a regular grid : only the cells intersecting
+    the exposed viewport are recorded (into a QPicture, replayed at each repaint), and the base image is never modified.
+    Changing the threshold or the classes filter (setSelection) selects a prefix of the sorted detections and only
+    invalidates the recorded cells, the boxes of each cell being indexed once.
+    """
+    cellSize = 1024
+
+    def __init__(self, pPainterClass, pInference, pThreshold, pLabelsFilter=None, pColor=None):
+        super().__init__()
+
+        self.painterClass = pPainterClass
+        self.color = pColor
+
+        self.detections = CSortedDetections(pInference._boxes[0], pInference._scores[0], pInference._labels[0])
+        self.boxes, self.labels = self.detections.boxes, self.detections.labels
+        self.cellsPositions = {} # (cellX, cellY) -> positions of the boxes intersecting the cell, selected or not
+        self.cells = {} # (cellX, cellY) -> QPicture
+
+        self.setSelection(pThreshold, pLabelsFilter)
+
+        # Bounds of all the detections, so that the selection does not change the geometry
+        if len(self.boxes) > 0:
+            left, top = self.boxes[:, :2].min(axis=0)
+            right, bottom = self.boxes[:, 2:].max(axis=0)
+            # Margin for the pen width and the crosses
+            self.bounds = QRectF(left, top, right - left, bottom - top).adjusted(-8, -8, 8, 8)
+        else:
+            self.bounds = QRectF()
+
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+
+    def boundingRect(self):
+        return self.bounds
+
+    def setSelection(self, pThreshold, pLabelsFilter=None):
+        self.threshold = pThreshold
+        self.labelsFilter = pLabelsFilter
+
+        self.selected = np.zeros(len(self.detections), dtype=bool)
+        self.selected[self.detections.selectedPositions(pThreshold, pLabelsFilter)] = True
+
+        self.cells = {}
+        self.update()
+
+    def cellPositions(self, pCellX, pCellY):
+        positions = self.cellsPositions.get((pCellX, pCellY))
+
+        if positions is None:
+            # Cell extended by the pen width and the crosses length
+            cellLeft, cellTop = pCellX * self.cellSize - 8, pCellY * self.cellSize - 8
+            cellRight, cellBottom = cellLeft + self.cellSize + 16, cellTop + self.cellSize + 16
+
+            inCell = (self.boxes[:, 2] >= cellLeft) & (self.boxes[:, 0] < cellRight) & \
+                     (self.boxes[:, 3] >= cellTop) & (self.boxes[:, 1] < cellBottom)
+
+            positions = np.flatnonzero(inCell)
+            self.cellsPositions[(pCellX, pCellY)] = positions
+
+        return positions
+
+    def cellPicture(self, pCellX, pCellY):
+        picture = self.cells.get((pCellX, pCellY))
+
+        if picture is None:
+            positions = self.cellPositions(pCellX, pCellY)
+            positions = positions[self.selected[positions]]
+
+            picture = QPicture()
+            painter = self.painterClass(picture, self.threshold, self.labelsFilter, self.color)
+            painter.drawSelection(self.boxes[positions], self.labels[positions])
+
+            self.cells[(pCellX, pCellY)] = picture
+
+        return picture
+
+    def paint(self, painter, option, widget=None):
+        exposedRect = option.exposedRect.intersected(self.bounds)
+        if exposedRect.isEmpty():
+            return
+
+        with instrumentation.span("paint", style=self.painterClass.__name__):
+            # Boxes spanning several cells are recorded in each of them, each cell only draws inside itself
+            for cellY in range(int(exposedRect.top()) // self.cellSize, int(exposedRect.bottom()) // self.cellSize + 1):
+                for cellX in range(int(exposedRect.left()) // self.cellSize, int(exposedRect.right()) // self.cellSize + 1):
+                    painter.save()
+                    painter.setClipRect(QRectF(cellX * self.cellSize, cellY * self.cellSize, self.cellSize, self.cellSize), Qt.ClipOperation.IntersectClip)
+                    painter.drawPicture(0, 0, self.cellPicture(cellX, cellY))
+                    painter.restore()
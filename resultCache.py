@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from instrumentation import instrumentation
+from inferenceBackends import conversionStamp
+
+def hashFile(pFilePath, pChunkSize=1 << 20):
+    digest = hashlib.sha1()
+    with open(pFilePath, "rb") as f:
+        for chunk in iter(lambda: f.read(pChunkSize), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+class CResultCache:
+    """
+    @Brief : Persistent cache of inference results (boxes, scores, labels) stored as compressed .npz files.
+
+    An entry is keyed by the image content hash, the model file hash, the backbone and the preprocessing parameters.
+    Entry file names are prefixed by the model hash so that every result of an outdated model can be dropped at once.
+    The total size of the cache is bounded, least recently used entries being evicted first : the entries sizes are
+    kept in memory in access order, and an eviction goes down to a low-water mark so that it is rare.
+    """
+    def __init__(self, pCacheDir=None, pMaxBytes=None):
+        if pCacheDir != None:
+            self.cacheDir = pCacheDir
+        else:
+            self.cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "odviewer", "inferences")
+
+        if pMaxBytes != None:
+            assert pMaxBytes > 0
+            self.maxBytes = pMaxBytes
+        else:
+            self.maxBytes = 512 * 1024 * 1024
+        self.lowWaterBytes = int(0.9 * self.maxBytes)
+
+        self._lock = threading.Lock()
+        self._modelHashes = {} # (path, mtime, size) -> hash, avoids hashing the checkpoint on every inference
+        self._modelsIndexPath = os.path.join(self.cacheDir, "models.json")
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        self._modelsIndex = self.readModelsIndex()
+        self._entries, self._totalBytes = self.readEntries()
+
+    def readModelsIndex(self):
+        try:
+            with open(self._modelsIndexPath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def writeModelsIndex(self):
+        tmpPath = self._modelsIndexPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self._modelsIndex, f)
+        os.replace(tmpPath, self._modelsIndexPath)
+
+    def entriesPaths(self, pPrefix=""):
+        # Without the interrupted writes
+        return [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir)
+                if f.startswith(pPrefix) and f.endswith(".npz") and not f.endswith(".tmp.npz")]
+
+    def readEntries(self):
+        # Entry path -> size, least recently used first
+        entries = []
+        for entryPath in self.entriesPaths():
+            try:
+                stat = os.stat(entryPath)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entryPath, stat.st_size))
+
+        entries.sort()
+
+        return OrderedDict((entryPath, size) for mtime, entryPath, size in entries), sum(size for mtime, entryPath, size in entries)
+
+    def modelFingerprint(self, pModelPath):
+        modelPath = os.path.abspath(pModelPath)
+        stat = os.stat(modelPath)
+        statKey = (modelPath, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            modelHash = self._modelHashes.get(statKey)
+
+        if modelHash == None:
+            modelHash = hashFile(modelPath)
+
+            with self._lock:
+                self._modelHashes[statKey] = modelHash
+
+            # The checkpoint changed on disk : the results of its previous version are obsolete
+            previousHash = self._modelsIndex.get(modelPath)
+            if previousHash != None and previousHash != modelHash:
+                self.invalidateModelHash(previousHash)
+
+            with self._lock:
+                self._modelsIndex[modelPath] = modelHash
+                self.writeModelsIndex()
+
+        return modelHash
+
+    def entryKey(self, pImagePath, pModelPath, pBackbone, pPreprocessing, pBackend="keras"):
+        # Converted and quantised models give slightly different results, from one conversion to the next too
+        stamp = None
+        if pBackend != "keras":
+            stamp = conversionStamp(pModelPath, pBackbone, pBackend)
+            if stamp == None:
+                # Not converted yet : the result cannot be keyed by the conversion it will come from
+                return None
+
+        modelHash = self.modelFingerprint(pModelPath)
+
+        digest = hashlib.sha1()
+        digest.update(hashFile(pImagePath).encode("utf-8"))
+        digest.update(pBackbone.encode("utf-8"))
+        digest.update(json.dumps(pPreprocessing, sort_keys=True).encode("utf-8"))
+
+        # The keras keys are unchanged
+        if stamp != None:
+            digest.update(pBackend.encode("utf-8"))
+            digest.update(json.dumps(stamp, sort_keys=True).encode("utf-8"))
+
+        return "{}_{}".format(modelHash[:16], digest.hexdigest())
+
+    def entryPath(self, pKey):
+        return os.path.join(self.cacheDir, pKey + ".npz")
+
+    def get(self, pKey):
+        if pKey == None:
+            # Result not cacheable (see entryKey)
+            return None
+
+        entryPath = self.entryPath(pKey)
+
+        try:
+            with np.load(entryPath) as data:
+                result = (data["boxes"], data["scores"], data["labels"])
+        except (OSError, KeyError, ValueError):
+            instrumentation.count("resultCache.miss")
+            return None
+
+        instrumentation.count("resultCache.hit")
+
+        with self._lock:
+            if entryPath in self._entries:
+                self._entries.move_to_end(entryPath)
+
+        # Access time orders the entries of the next sessions
+        try:
+            os.utime(entryPath, None)
+        except OSError:
+            pass
+
+        return result
+
+    def put(self, pKey, pBoxes, pScores, pLabels):
+        entryPath = self.entryPath(pKey)
+        tmpPath = entryPath + ".tmp.npz"
+
+        np.savez_compressed(tmpPath, boxes=pBoxes, scores=pScores, labels=pLabels)
+
+        with self._lock:
+            os.replace(tmpPath, entryPath)
+
+            size = os.path.getsize(entryPath)
+            self._totalBytes += size - self._entries.pop(entryPath, 0)
+            self._entries[entryPath] = size
+
+            self.evict()
+
+        instrumentation.gauge("resultCache.bytes", self._totalBytes)
+
+    def evict(self):
+        # Must be called with self._lock held
+        if self._totalBytes <= self.maxBytes:
+            return
+
+        while self._totalBytes > self.lowWaterBytes and len(self._entries) > 0:
+            self.removeEntry(next(iter(self._entries)))
+
+    def removeEntry(self, pEntryPath):
+        # Must be called with self._lock held
+        try:
+            os.remove(pEntryPath)
+        except OSError:
+            pass
+
+        self._totalBytes -= self._entries.pop(pEntryPath, 0)
+        instrumentation.gauge("resultCache.bytes", self._totalBytes)
+
+    def invalidateModelHash(self, pModelHash):
+        prefix = os.path.join(self.cacheDir, pModelHash[:16] + "_")
+
+        with self._lock:
+            for entryPath in [p for p in self._entries if p.startswith(prefix)]:
+                self.removeEntry(entryPath)
+
+    def invalidateModel(self, pModelPath):
+        modelPath = os.path.abspath(pModelPath)
+
+        with self._lock:
+            modelHash = self._modelsIndex.pop(modelPath, None)
+            self._modelHashes = {k: v for k, v in self._modelHashes.items() if k[0] != modelPath}
+            self.writeModelsIndex()
+
+        if modelHash != None:
+            self.invalidateModelHash(modelHash)
+
+    def clear(self):
+        with self._lock:
+            for entryPath in list(self._entries):
+                self.removeEntry(entryPath)
+
+resultCache = CResultCache()
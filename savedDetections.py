@@ -0,0 +1,150 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from detectionsExport import CColumnarWriter, loadColumnar
+
+def pathKey(pPath):
+    return os.path.normcase(os.path.abspath(pPath))
+
+class CSavedInference:
+    """
+    @Brief : Detections of one image read from a results file (or of a video frame), exposing the attributes of CInference used for display.
+    """
+    def __init__(self, pImgPath, pModelPath, pBoxes, pScores, pLabels):
+        self.imgPath = pImgPath
+        self.modelPath = pModelPath
+
+        # Views (of the memory mapped columns), in the (1, N, ...) layout of the inferences
+        self._boxes = pBoxes[np.newaxis]
+        self._scores = pScores[np.newaxis]
+        self._labels = pLabels[np.newaxis]
+
+    def hasResult(self):
+        return True
+
+class CSavedDetections:
+    """
+    @Brief : Index of detections saved by an export (see detectionsExport), opened without keras.
+
+    The columnar format is memory mapped and indexed by image path, so looking up an image is O(1) whatever the size
+    of the results set. JSON-lines and COCO files are converted once to the columnar format, in a cache keyed by the
+    file path, mtime and size. Images are looked up by absolute path, then by file name for results produced elsewhere.
+    """
+    def __init__(self, pPath, pCacheDir=None):
+        if pCacheDir != None:
+            self.cacheDir = pCacheDir
+        else:
+            self.cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "odviewer", "detections")
+
+        self.path = pPath
+        self.imagesPaths, self.offsets, self.boxes, self.scores, self.labels = loadColumnar(self.columnarDirectory(pPath))
+
+        self.rows = {}
+        self.rowsByName = {}
+        for row, imagePath in enumerate(self.imagesPaths):
+            self.rows[pathKey(imagePath)] = row
+
+            # Ambiguous file names are not indexed
+            name = os.path.basename(imagePath)
+            self.rowsByName[name] = None if name in self.rowsByName else row
+
+    def columnarDirectory(self, pPath):
+        # An export directory, a columnar directory, its index.json, or a JSON-lines / COCO file
+        if os.path.isdir(pPath):
+            if os.path.isfile(os.path.join(pPath, "index.json")):
+                return pPath
+            if os.path.isfile(os.path.join(pPath, "detections", "index.json")):
+                return os.path.join(pPath, "detections")
+            if os.path.isfile(os.path.join(pPath, "detections.jsonl")):
+                return self.columnarDirectory(os.path.join(pPath, "detections.jsonl"))
+            if os.path.isfile(os.path.join(pPath, "detections_coco.json")):
+                return self.columnarDirectory(os.path.join(pPath, "detections_coco.json"))
+
+            raise ValueError("No detections found in {}".format(pPath))
+
+        if os.path.basename(pPath) == "index.json":
+            return os.path.dirname(pPath)
+
+        stat = os.stat(pPath)
+        key = "{}|{}|{}".format(os.path.abspath(pPath), stat.st_mtime_ns, stat.st_size)
+        directory = os.path.join(self.cacheDir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+        if not os.path.isfile(os.path.join(directory, "index.json")):
+            # Converted in a temporary directory renamed once complete : a failed conversion is never found in the cache
+            tmpDirectory = "{}.tmp{}".format(directory, os.getpid())
+            shutil.rmtree(tmpDirectory, ignore_errors=True)
+
+            try:
+                with CColumnarWriter(tmpDirectory) as writer:
+                    if pPath.endswith(".jsonl"):
+                        self.convertJsonLines(pPath, writer)
+                    else:
+                        self.convertCoco(pPath, writer)
+
+                shutil.rmtree(directory, ignore_errors=True)
+                os.rename(tmpDirectory, directory)
+            finally:
+                shutil.rmtree(tmpDirectory, ignore_errors=True)
+
+        return directory
+
+    @staticmethod
+    def convertJsonLines(pPath, pWriter):
+        # Streamed line by line
+        with open(pPath, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                detections = json.loads(line)
+                pWriter.writeSelection(detections["image"], np.array(detections["boxes"], dtype=np.float32).reshape(-1, 4),
+                                       np.array(detections["scores"], dtype=np.float32), np.array(detections["labels"], dtype=np.int32))
+
+    @staticmethod
+    def convertCoco(pPath, pWriter):
+        with open(pPath, "r") as f:
+            coco = json.load(f)
+
+        if not isinstance(coco, dict):
+            # A COCO results list has image ids but not the images file names
+            raise ValueError("{} is not a COCO file with an images list".format(pPath))
+
+        annotations = coco.get("annotations", [])
+        imagesIds = np.array([annotation["image_id"] for annotation in annotations], dtype=np.int64)
+        boxes = np.array([annotation["bbox"] for annotation in annotations], dtype=np.float32).reshape(-1, 4)
+        boxes[:, 2:] += boxes[:, :2] # [x, y, width, height] -> [x1, y1, x2, y2]
+        scores = np.array([annotation.get("score", 1.0) for annotation in annotations], dtype=np.float32) # Ground truths have no score
+        labels = np.array([annotation["category_id"] for annotation in annotations], dtype=np.int32)
+
+        # Annotations grouped by image, by decreasing score as the inferences
+        order = np.lexsort((-scores, imagesIds))
+        imagesIds, boxes, scores, labels = imagesIds[order], boxes[order], scores[order], labels[order]
+
+        for image in coco.get("images", []):
+            start, end = np.searchsorted(imagesIds, [image["id"], image["id"] + 1])
+            pWriter.writeSelection(image["file_name"], boxes[start:end], scores[start:end], labels[start:end])
+
+    def __len__(self):
+        return len(self.imagesPaths)
+
+    def row(self, pImgPath):
+        row = self.rows.get(pathKey(pImgPath))
+        if row == None:
+            row = self.rowsByName.get(os.path.basename(pImgPath))
+
+        return row
+
+    def lookup(self, pImgPath):
+        """
+        @Retour :
+            - inference(CSavedInference) : détections de l'image, None si elle n'est pas dans les résultats
+        """
+        row = self.row(pImgPath)
+        if row == None:
+            return None
+
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return CSavedInference(pImgPath, self.path, self.boxes[start:end], self.scores[start:end], self.labels[start:end])
@@ -0,0 +1,204 @@
+from PyQt5.QtCore import QPoint, QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QImageReader, QPixmap
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+import os
+import math
+import threading
+from collections import OrderedDict
+
+from instrumentation import instrumentation
+
+class CBytesLRUCache:
+    """
+    @Brief : Thread-safe least recently used cache bounded by the total size in bytes of its values.
+
+    A named cache reports its hits, misses and size to the instrumentation.
+    """
+    def __init__(self, pMaxBytes, pName=None):
+        self.maxBytes = pMaxBytes
+        self.totalBytes = 0
+        self.name = pName
+
+        self._entries = OrderedDict() # key -> (value, nbBytes)
+        self._lock = threading.Lock()
+
+    def get(self, pKey):
+        with self._lock:
+            entry = self._entries.get(pKey)
+            if entry != None:
+                self._entries.move_to_end(pKey)
+
+        if self.name != None:
+            instrumentation.count(self.name + (".hit" if entry != None else ".miss"))
+
+        return entry[0] if entry != None else None
+
+    def put(self, pKey, pValue, pNbBytes):
+        with self._lock:
+            if pKey in self._entries:
+                self.totalBytes -= self._entries.pop(pKey)[1]
+
+            self._entries[pKey] = (pValue, pNbBytes)
+            self.totalBytes += pNbBytes
+
+            # The last inserted entry is always kept, even if it is bigger than the cache
+            while self.totalBytes > self.maxBytes and len(self._entries) > 1:
+                key, (value, nbBytes) = self._entries.popitem(last=False)
+                self.totalBytes -= nbBytes
+
+        if self.name != None:
+            instrumentation.gauge(self.name + ".bytes", self.totalBytes)
+
+    def __contains__(self, pKey):
+        with self._lock:
+            return pKey in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.totalBytes = 0
+
+class CImagePyramid:
+    """
+    @Brief : Lazily built multi-resolution pyramid of an image file, split in square tiles.
+
+    Level 0 is the full resolution image, each level halves the previous one. A whole level is decoded at once
+    (QImageReader scaled decoding, native for JPEG) when it is small enough, otherwise each tile is decoded alone
+    with a clip rectangle so that gigapixel images are never fully loaded in memory.
+    """
+    levelsCache = CBytesLRUCache(512 * 1024 * 1024, "levelsCache")
+    tilesCache = CBytesLRUCache(256 * 1024 * 1024, "tilesCache")
+
+    def __init__(self, pImagePath, pTileSize=512, pMaxLevelPixels=32 * 1024 * 1024):
+        self.imagePath = pImagePath
+        self.tileSize = pTileSize
+        self.maxLevelPixels = pMaxLevelPixels
+
+        # Header only, the pixels are not decoded
+        reader = QImageReader(pImagePath)
+        self.size = reader.size()
+
+        try:
+            stat = os.stat(pImagePath)
+            self.key = (os.path.abspath(pImagePath), stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # Deleted since it was listed : invalid, as an unreadable image
+            self.size = QSize()
+            self.key = (os.path.abspath(pImagePath), None, None)
+
+        if self.isValid():
+            self.nbLevels = max(1, math.ceil(math.log2(max(self.size.width(), self.size.height()) / self.tileSize)) + 1)
+        else:
+            self.nbLevels = 0
+
+    def isValid(self):
+        return self.size.isValid() and not self.size.isEmpty()
+
+    def levelSize(self, pLevel):
+        factor = 2 ** pLevel
+        return QSize(max(1, math.ceil(self.size.width() / factor)), max(1, math.ceil(self.size.height() / factor)))
+
+    def levelForScale(self, pScale):
+        # Finest level whose resolution is still above the displayed one
+        if pScale <= 0:
+            return self.nbLevels - 1
+
+        level = int(math.floor(math.log2(1 / pScale))) if pScale < 1 else 0
+        return min(max(level, 0), self.nbLevels - 1)
+
+    def isLevelDecodable(self, pLevel):
+        levelSize = self.levelSize(pLevel)
+        return levelSize.width() * levelSize.height() <= self.maxLevelPixels
+
+    def levelImage(self, pLevel):
+        # May be called from worker threads (prefetch) : QImage only, no QPixmap
+        cacheKey = (self.key, pLevel)
+
+        image = self.levelsCache.get(cacheKey)
+        if image is None:
+            reader = QImageReader(self.imagePath)
+            reader.setScaledSize(self.levelSize(pLevel))
+            image = reader.read()
+
+            self.levelsCache.put(cacheKey, image, image.sizeInBytes())
+
+        return image
+
+    def tileRect(self, pLevel, pTileX, pTileY):
+        levelSize = self.levelSize(pLevel)
+        return QRect(pTileX * self.tileSize, pTileY * self.tileSize, self.tileSize, self.tileSize).intersected(QRect(QPoint(0, 0), levelSize))
+
+    def tilePixmap(self, pLevel, pTileX, pTileY):
+        cacheKey = (self.key, pLevel, pTileX, pTileY)
+
+        pixmap = self.tilesCache.get(cacheKey)
+        if pixmap is not None:
+            return pixmap
+
+        levelSize = self.levelSize(pLevel)
+        tileRect = self.tileRect(pLevel, pTileX, pTileY)
+
+        if self.isLevelDecodable(pLevel):
+            image = self.levelImage(pLevel).copy(tileRect)
+        else:
+            reader = QImageReader(self.imagePath)
+            reader.setScaledSize(levelSize)
+            reader.setScaledClipRect(tileRect)
+            image = reader.read()
+
+        # Uploaded to a pixmap only once the tile is visible
+        pixmap = QPixmap.fromImage(image)
+        self.tilesCache.put(cacheKey, pixmap, image.sizeInBytes())
+
+        return pixmap
+
+    def visibleTiles(self, pLevel, pRect):
+        """
+        @Brief : Tiles of a level intersecting a rectangle given in full resolution coordinates.
+        """
+        factor = 2 ** pLevel
+        levelSize = self.levelSize(pLevel)
+
+        nbTilesX = math.ceil(levelSize.width() / self.tileSize)
+        nbTilesY = math.ceil(levelSize.height() / self.tileSize)
+
+        left = max(0, int(pRect.left() / factor) // self.tileSize)
+        top = max(0, int(pRect.top() / factor) // self.tileSize)
+        right = min(nbTilesX - 1, int(math.ceil(pRect.right() / factor)) // self.tileSize)
+        bottom = min(nbTilesY - 1, int(math.ceil(pRect.bottom() / factor)) // self.tileSize)
+
+        return [(tx, ty) for ty in range(top, bottom + 1) for tx in range(left, right + 1)]
+
+class CTiledImageItem(QGraphicsItem):
+    """
+    @Brief : Scene item drawing an image pyramid, only the visible tiles of the level matching the zoom are decoded.
+    """
+    def __init__(self, pPyramid):
+        super().__init__()
+
+        self.pyramid = pPyramid
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.pyramid.size.width(), self.pyramid.size.height())
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.levelForScale(scale)
+        factor = 2 ** level
+
+        exposedRect = option.exposedRect.intersected(self.boundingRect())
+
+        # The last tiles of a coarse level slightly overflow the image once scaled back
+        painter.save()
+        painter.setClipRect(self.boundingRect(), Qt.ClipOperation.IntersectClip)
+
+        for tileX, tileY in self.pyramid.visibleTiles(level, exposedRect):
+            tileRect = self.pyramid.tileRect(level, tileX, tileY)
+            targetRect = QRectF(tileRect.x() * factor, tileRect.y() * factor, tileRect.width() * factor, tileRect.height() * factor)
+
+            pixmap = self.pyramid.tilePixmap(level, tileX, tileY)
+            painter.drawPixmap(targetRect, pixmap, QRectF(pixmap.rect()))
+
+        painter.restore()
@@ -0,0 +1,108 @@
+import time
+import numpy as np
+
+def tileOrigins(pLength, pTileSize, pOverlap):
+    """
+    @Brief : Positions of the tiles along one dimension, the last tile being aligned on the border.
+    """
+    if pLength <= pTileSize:
+        return [0]
+
+    stride = pTileSize - pOverlap
+    origins = list(range(0, pLength - pTileSize, stride))
+    origins.append(pLength - pTileSize)
+
+    return origins
+
+def nonMaximumSuppression(pBoxes, pScores, pLabels, pIouThreshold=0.5):
+    """
+    @Brief : Suppression des non-maxima, par classe, des détections (N, 4) données en coordonnées image.
+
+    @Retour :
+        - keep : indices des détections conservées, triés par score décroissant
+    """
+    if len(pBoxes) == 0:
+        return np.zeros(0, dtype=int)
+
+    # Shifting the boxes by class makes boxes of different classes never overlap, so all classes are processed at once
+    offsets = pLabels.astype(np.float64)[:, None] * (pBoxes.max() + 1)
+    boxes = pBoxes.astype(np.float64) + offsets
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+
+    order = np.argsort(-pScores, kind="stable")
+    keep = []
+
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+
+        others = order[1:]
+        width = np.maximum(np.minimum(x2[i], x2[others]) - np.maximum(x1[i], x1[others]), 0)
+        height = np.maximum(np.minimum(y2[i], y2[others]) - np.maximum(y1[i], y1[others]), 0)
+        intersection = width * height
+        iou = intersection / np.maximum(areas[i] + areas[others] - intersection, 1e-9)
+
+        order = others[iou <= pIouThreshold]
+
+    return np.array(keep, dtype=int)
+
+def predictTiled(pModel, pImage, pTileSize=1024, pOverlap=128, pBatchSize=4, pIouThreshold=0.5, pStatistics=None):
+    """
+    @Brief : Infère une image BGR par fenêtres glissantes, à sa résolution d'origine.
+
+    Les tuiles sont prétraitées une à une (la mémoire reste bornée à un lot de tuiles), inférées par lots avec
+    predict_on_batch, puis les boîtes sont ramenées en coordonnées image et dédoublonnées par une NMS globale.
+
+    @Paramètres :
+        - pModel            : modèle Retinanet (inférence).
+        - pImage(ndarray)   : image BGR (H, W, 3) non prétraitée.
+        - pTileSize(int)    : côté des tuiles en pixels.
+        - pOverlap(int)     : recouvrement des tuiles en pixels, à choisir supérieur à la taille des objets.
+        - pBatchSize(int)   : nombre de tuiles par appel à predict_on_batch.
+        - pIouThreshold     : seuil d'IoU de la NMS entre tuiles.
+
+    @Retour :
+        - boxes, scores, labels : détections de formes (1, N, 4), (1, N) et (1, N) triées par score décroissant
+    """
+    assert 0 <= pOverlap < pTileSize
+
+    from keras_retinanet.utils.image import preprocess_image
+
+    imgHeight, imgWidth = pImage.shape[:2]
+    origins = [(y, x) for y in tileOrigins(imgHeight, pTileSize, pOverlap) for x in tileOrigins(imgWidth, pTileSize, pOverlap)]
+
+    allBoxes, allScores, allLabels = [], [], []
+
+    for batchStart in range(0, len(origins), pBatchSize):
+        batchOrigins = origins[batchStart:batchStart + pBatchSize]
+
+        start = time.perf_counter()
+        tiles = np.stack([preprocess_image(pImage[y:y + pTileSize, x:x + pTileSize]) for y, x in batchOrigins], axis=0)
+        if pStatistics != None:
+            pStatistics.add("preprocess", time.perf_counter() - start, len(batchOrigins))
+
+        start = time.perf_counter()
+        boxes, scores, labels = pModel.predict_on_batch(tiles)
+        if pStatistics != None:
+            pStatistics.add("predict", time.perf_counter() - start, len(batchOrigins))
+
+        boxes, scores, labels = np.asarray(boxes), np.asarray(scores), np.asarray(labels)
+
+        for i, (y, x) in enumerate(batchOrigins):
+            valid = labels[i] >= 0
+            allBoxes.append(boxes[i][valid] + np.array([x, y, x, y], dtype=boxes.dtype))
+            allScores.append(scores[i][valid])
+            allLabels.append(labels[i][valid])
+
+    start = time.perf_counter()
+    boxes = np.concatenate(allBoxes).reshape(-1, 4)
+    scores = np.concatenate(allScores)
+    labels = np.concatenate(allLabels)
+
+    keep = nonMaximumSuppression(boxes, scores, labels, pIouThreshold)
+    if pStatistics != None:
+        pStatistics.add("nms", time.perf_counter() - start)
+
+    return boxes[keep][np.newaxis], scores[keep][np.newaxis], labels[keep][np.newaxis]
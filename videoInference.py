@@ -0,0 +1,257 @@
+"""
+Streaming inference of video files and numbered frames sequences.
+
+Frames are decoded one at a time by a reader thread into a small bounded queue, the model consuming them as they
+come. In real time mode the reader follows the media clock : frames already late are skipped without being
+converted, and when the model is behind, the oldest queued frame is dropped so that the freshest one is inferred.
+Frames almost identical to the last inferred one can reuse its detections instead of running the network.
+"""
+import os
+import re
+import glob
+import time
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+
+from instrumentation import instrumentation
+from modelRegistry import modelRegistry, importBackend
+from inferencePipeline import prepareImage
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".mpg", ".mpeg", ".wmv", ".m4v")
+FRAMES_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def naturalKey(pPath):
+    # frame_2.png before frame_10.png
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", os.path.basename(pPath))]
+
+class CFramesSequence:
+    """
+    @Brief : Numbered images read as a video : a directory, or a printf pattern such as frames/img_%05d.png.
+    """
+    def __init__(self, pPath, pFps=None):
+        if os.path.isdir(pPath):
+            paths = [os.path.join(pPath, f) for f in os.listdir(pPath) if f.lower().endswith(FRAMES_EXTENSIONS)]
+        else:
+            paths = glob.glob(re.sub(r"%0?\d*d", "*", pPath))
+
+        self.paths = sorted(paths, key=naturalKey)
+        self.fps = pFps if pFps != None else 25.0
+        self.frameCount = len(self.paths)
+        self.position = 0
+
+    def skip(self):
+        # Nothing is read
+        if self.position >= self.frameCount:
+            return False
+
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.frameCount:
+            return False, None
+
+        from keras_retinanet.utils.image import read_image_bgr
+
+        frame = read_image_bgr(self.paths[self.position])
+        self.position += 1
+
+        return True, frame
+
+    def close(self):
+        pass
+
+class CVideoFrames:
+    """
+    @Brief : Frames of a video file, decoded one at a time by OpenCV.
+    """
+    def __init__(self, pPath, pFps=None):
+        import cv2
+
+        self.capture = cv2.VideoCapture(pPath)
+        if not self.capture.isOpened():
+            raise ValueError("Cannot open the video {}".format(pPath))
+
+        sourceFps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.fps = pFps if pFps != None else (sourceFps if sourceFps > 0 else 25.0)
+        self.frameCount = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)) # Estimated by some containers, -1 if unknown
+
+    def skip(self):
+        # The frame is demuxed but not converted to BGR
+        return self.capture.grab()
+
+    def read(self):
+        return self.capture.read()
+
+    def close(self):
+        self.capture.release()
+
+def openFrames(pPath, pFps=None):
+    if os.path.isdir(pPath) or "%" in pPath:
+        return CFramesSequence(pPath, pFps)
+
+    return CVideoFrames(pPath, pFps)
+
+def frameDifference(pFrameA, pFrameB, pStride=8):
+    """
+    @Brief : Différence moyenne des pixels de deux images, dans [0, 1], mesurée sur une grille d'un pixel sur pStride.
+    """
+    if pFrameA.shape != pFrameB.shape:
+        return 1.0
+
+    a = pFrameA[::pStride, ::pStride].astype(np.int16)
+    b = pFrameB[::pStride, ::pStride].astype(np.int16)
+
+    return float(np.abs(a - b).mean()) / 255
+
+class CVideoPipeline:
+    """
+    @Brief : Infers the frames of a video or of a frames sequence as they are decoded.
+
+    A reader thread feeds a queue of pQueueSize frames to the model, so at most a few decoded frames are in memory.
+    With pRealTime, frames are skipped or dropped to follow the media clock, else every frame is inferred.
+    """
+    def __init__(self, pModelPath, pBackbone='resnet50', pBackend="keras", pResizeFactor=1, pRealTime=True, pQueueSize=2, pReuseThreshold=None, pFps=None):
+        assert pQueueSize >= 1
+        assert pReuseThreshold == None or 0 <= pReuseThreshold <= 1
+
+        self.modelPath = pModelPath
+        self.backbone = pBackbone
+        self.backend = pBackend
+        self.resizeFactor = pResizeFactor
+        self.realTime = pRealTime
+        self.queueSize = pQueueSize
+        self.reuseThreshold = pReuseThreshold # Mean pixel difference under which the last detections are reused, never if None
+        self.fps = pFps # Frame rate of the sequences, the videos giving theirs
+
+        self._stopRequested = threading.Event()
+
+    def stop(self):
+        self._stopRequested.set()
+
+    def readFrames(self, pFrames, pFramesQueue, pCounters, pErrors):
+        start = time.perf_counter()
+        index = 0
+
+        try:
+            while not self._stopRequested.is_set():
+                if self.realTime:
+                    # Frames whose time has passed are skipped without conversion
+                    due = int((time.perf_counter() - start) * pFrames.fps)
+                    while index < due and pFrames.skip():
+                        index += 1
+                        pCounters["skipped"] += 1
+
+                    wait = start + index / pFrames.fps - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+
+                with instrumentation.span("decode"):
+                    ok, frame = pFrames.read()
+                if not ok:
+                    break
+
+                if self.realTime:
+                    # The model is behind : the oldest frame is dropped, the freshest is kept
+                    while True:
+                        try:
+                            pFramesQueue.put_nowait((index, frame))
+                            break
+                        except queue.Full:
+                            try:
+                                pFramesQueue.get_nowait()
+                                pCounters["dropped"] += 1
+                            except queue.Empty:
+                                pass
+                else:
+                    pFramesQueue.put((index, frame))
+
+                index += 1
+        except Exception as e:
+            # Raised again by run : a decoding error is not the end of the video
+            pErrors.append(e)
+        finally:
+            pFramesQueue.put(None)
+
+    def run(self, pPath, pOnFrame=None):
+        """
+        @Brief : Infère les images d'une vidéo ou d'une séquence d'images.
+
+        @Paramètres :
+            - pPath(str)          : fichier vidéo, dossier d'images numérotées ou motif (img_%05d.png).
+            - pOnFrame(callable)  : appelé avec (index, frame, boxes, scores, labels, statistics) pour chaque image inférée,
+                                    les détections étant de formes (1, N, 4), (1, N) et (1, N). statistics contient
+                                    les compteurs cumulés et frameReused, vrai si les détections de l'image sont réutilisées.
+
+        @Retour :
+            - report : nombres d'images inférées, réutilisées, sautées et abandonnées, et débit atteint
+        """
+        self._stopRequested.clear()
+
+        model = modelRegistry.getModel(self.modelPath, self.backbone, self.backend)
+        importBackend()
+
+        frames = openFrames(pPath, self.fps)
+        framesQueue = queue.Queue(maxsize=self.queueSize)
+        counters = {"inferred": 0, "reused": 0, "skipped": 0, "dropped": 0}
+        readErrors = []
+
+        reader = threading.Thread(target=self.readFrames, args=(frames, framesQueue, counters, readErrors), daemon=True)
+        start = time.perf_counter()
+        reader.start()
+
+        lastFrame, lastResult = None, None
+        framesTimes = deque(maxlen=30) # Achieved frame rate over the last frames
+
+        try:
+            while True:
+                item = framesQueue.get()
+                if item == None:
+                    break
+                if self._stopRequested.is_set():
+                    continue # Drains the queue until the reader stops
+
+                index, frame = item
+
+                reused = lastFrame is not None and self.reuseThreshold != None and frameDifference(frame, lastFrame) < self.reuseThreshold
+                if reused:
+                    counters["reused"] += 1
+                else:
+                    with instrumentation.span("preprocess"):
+                        image, scale = prepareImage(frame, self.resizeFactor)
+
+                    with instrumentation.span("predict"):
+                        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
+
+                    boxes /= scale
+                    lastFrame, lastResult = frame, (boxes, scores, labels)
+                    counters["inferred"] += 1
+
+                framesTimes.append(time.perf_counter())
+                fps = (len(framesTimes) - 1) / (framesTimes[-1] - framesTimes[0]) if len(framesTimes) > 1 and framesTimes[-1] > framesTimes[0] else 0.0
+                instrumentation.gauge("video.fps", round(fps, 1))
+
+                if pOnFrame != None:
+                    statistics = dict(counters, index=index, frameReused=reused, fps=fps, sourceFps=frames.fps, frameCount=frames.frameCount)
+                    pOnFrame(index, frame, *lastResult, statistics)
+        finally:
+            # The queue is drained so that a reader blocked on a full queue can stop
+            self._stopRequested.set()
+            while reader.is_alive():
+                try:
+                    framesQueue.get_nowait()
+                except queue.Empty:
+                    reader.join(0.05)
+
+            frames.close()
+
+        if len(readErrors) > 0:
+            raise readErrors[0]
+
+        wallTime = time.perf_counter() - start
+        nbFrames = counters["inferred"] + counters["reused"]
+
+        return dict(counters, wallTime=wallTime, fps=nbFrames / wallTime if wallTime > 0 else None, sourceFps=frames.fps)